@@ -0,0 +1,198 @@
+import asyncio
+import sqlite3
+import struct
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Iterable
+
+from storage import Database
+
+DAY = 86400
+
+# Події підписок. Оплати: new — вперше, renewal — продовження активної, grace_conversion —
+# оплата під час grace, reactivation — повернення після expired. Переходи: grace, churn
+# (кік після grace), churn_reverted (кік не вдався, користувач повернутий у grace), removed (/removesub)
+PAYMENT_KINDS = ('new', 'renewal', 'grace_conversion', 'reactivation')
+KIND_LABELS = {'new': "нових", 'renewal': "продовжень", 'grace_conversion': "оплат із grace",
+               'reactivation': "повернень після expired", 'grace': "перейшли в grace",
+               'churn': "відтік (кік після grace)", 'removed': "видалено вручну"}
+
+SQL_INSERT_EVENT = "INSERT INTO sub_events (user_id, kind, tariff, days, amount, created_at) VALUES (?, ?, ?, ?, ?, ?)"
+SQL_BUMP_DAILY = """
+    INSERT INTO daily_stats (day, tariff, kind, count, revenue) VALUES (?, ?, ?, 1, ?)
+    ON CONFLICT(day, tariff, kind) DO UPDATE SET count = count + 1, revenue = revenue + excluded.revenue
+"""
+
+
+def _day(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%d')
+
+
+def payment_kind(prev_status: str | None) -> str:
+    return {'active': 'renewal', 'grace': 'grace_conversion', 'expired': 'reactivation'}.get(prev_status, 'new')
+
+
+def record(conn: sqlite3.Connection, events: Iterable[tuple[int, str, str | None, int | None, int]],
+           at: int | None = None) -> None:
+    # Викликається всередині транзакції, що змінює users: подія (user_id, kind, tariff, days, amount)
+    # і денний агрегат пишуться атомарно разом зі зміною, тож звіти ніколи не сканують історію
+    at = int(time.time()) if at is None else at
+    rows = [(user_id, kind, tariff or "", days, amount) for user_id, kind, tariff, days, amount in events]
+    if not rows:
+        return
+    day = _day(at)
+    conn.executemany(SQL_INSERT_EVENT, [(*row, at) for row in rows])
+    conn.executemany(SQL_BUMP_DAILY, [(day, tariff, kind, amount) for _, kind, tariff, _, amount in rows])
+
+
+class Analytics:
+    """Звіти з daily_stats: кілька сотень рядків на квартал замість сканування sub_events."""
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    async def summary(self, days: int = 30) -> dict:
+        since = _day(time.time() - (days - 1) * DAY)
+        rows = await self.db.fetchall(
+            "SELECT tariff, kind, SUM(count), SUM(revenue) FROM daily_stats WHERE day >= ? GROUP BY tariff, kind",
+            (since,))
+        kinds: dict[str, int] = {}
+        revenue: dict[str, int] = {}
+        payments: dict[str, int] = {}
+        for tariff, kind, count, amount in rows:
+            kinds[kind] = kinds.get(kind, 0) + count
+            if kind in PAYMENT_KINDS:
+                revenue[tariff] = revenue.get(tariff, 0) + amount
+                payments[tariff] = payments.get(tariff, 0) + count
+        # Відкат кіку може потрапити у вікно без самого кіку (той був днем раніше) — як і на графіку, не нижче нуля
+        kinds['churn'] = max(0, kinds.get('churn', 0) - kinds.pop('churn_reverted', 0))
+        statuses = dict(await self.db.fetchall("SELECT status, COUNT(*) FROM users GROUP BY status"))
+        return {"days": days, "since": since, "kinds": kinds, "revenue": revenue, "payments": payments,
+                "statuses": statuses}
+
+    @staticmethod
+    def format(summary: dict) -> str:
+        kinds, statuses = summary["kinds"], summary["statuses"]
+        lines = [f"Статистика за {summary['days']} днів (з {summary['since']}, UTC)",
+                 f"Зараз: active {statuses.get('active', 0)}, grace {statuses.get('grace', 0)}, "
+                 f"expired {statuses.get('expired', 0)}", ""]
+        lines += [f"• {label}: {kinds[kind]}" for kind, label in KIND_LABELS.items() if kinds.get(kind)]
+        if kinds.get('grace'):
+            lines.append(f"Конверсія grace → оплата: {kinds.get('grace_conversion', 0) / kinds['grace']:.0%}")
+        if summary["revenue"]:
+            lines += ["", "Дохід по тарифах:"]
+            for tariff, amount in sorted(summary["revenue"].items(), key=lambda item: -item[1]):
+                lines.append(f"• {tariff or '—'}: {amount} грн ({summary['payments'][tariff]} оплат)")
+            lines.append(f"Разом: {sum(summary['revenue'].values())} грн")
+        if len(lines) == 3:
+            lines.append("Подій за цей період немає.")
+        return "\n".join(lines)
+
+    async def series(self, days: int = 30) -> list[tuple[str, dict[str, int], int]]:
+        today = datetime.now(timezone.utc).date()
+        dates = [(today - timedelta(days=offset)).isoformat() for offset in range(days - 1, -1, -1)]
+        rows = await self.db.fetchall(
+            "SELECT day, kind, SUM(count), SUM(revenue) FROM daily_stats WHERE day >= ? GROUP BY day, kind",
+            (dates[0],))
+        by_day: dict[str, tuple[dict[str, int], list[int]]] = {day: ({}, [0]) for day in dates}
+        for day, kind, count, amount in rows:
+            if day in by_day:
+                counts, revenue = by_day[day]
+                counts[kind] = count
+                if kind in PAYMENT_KINDS:
+                    revenue[0] += amount
+        return [(day, counts, revenue[0]) for day, (counts, revenue) in by_day.items()]
+
+    async def chart(self, days: int = 30) -> bytes:
+        # Рендер — чистий CPU, тож у потоці, щоб не блокувати event loop
+        return await asyncio.to_thread(render_chart, await self.series(days))
+
+
+# --- Мінімальний PNG-рендер (без matplotlib/Pillow) ---
+
+WHITE, GREY, BLACK = (255, 255, 255), (210, 210, 210), (40, 40, 40)
+COLORS = {'revenue': (240, 170, 40), 'new': (60, 170, 90), 'renewal': (70, 120, 210),
+          'grace_conversion': (40, 180, 190), 'reactivation': (150, 90, 200), 'churn': (220, 70, 60)}
+# Шрифт 3×5 для підписів осей: кожен рядок гліфа — 3 біти
+_FONT = {'0': (7, 5, 5, 5, 7), '1': (2, 6, 2, 2, 7), '2': (7, 1, 7, 4, 7), '3': (7, 1, 7, 1, 7),
+         '4': (5, 5, 7, 1, 1), '5': (7, 4, 7, 1, 7), '6': (7, 4, 7, 5, 7), '7': (7, 1, 1, 1, 1),
+         '8': (7, 5, 7, 5, 7), '9': (7, 5, 7, 1, 7), '-': (0, 0, 7, 0, 0), '.': (0, 0, 0, 0, 2),
+         ' ': (0, 0, 0, 0, 0)}
+
+
+class _Canvas:
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(WHITE * (width * height))
+
+    def rect(self, x0: int, y0: int, x1: int, y1: int, color: tuple[int, int, int]) -> None:
+        x0, x1 = max(0, min(x0, x1)), min(self.width, max(x0, x1))
+        y0, y1 = max(0, min(y0, y1)), min(self.height, max(y0, y1))
+        if x0 >= x1:
+            return
+        line = bytes(color) * (x1 - x0)
+        for y in range(y0, y1):
+            start = (y * self.width + x0) * 3
+            self.pixels[start:start + len(line)] = line
+
+    def text(self, x: int, y: int, text: str, color: tuple[int, int, int] = BLACK, scale: int = 2) -> None:
+        for char in text:
+            for row, bits in enumerate(_FONT.get(char, _FONT[' '])):
+                for col in range(3):
+                    if bits & (4 >> col):
+                        self.rect(x + col * scale, y + row * scale, x + (col + 1) * scale, y + (row + 1) * scale, color)
+            x += 4 * scale
+
+    def png(self) -> bytes:
+        def chunk(kind: bytes, data: bytes) -> bytes:
+            return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+        stride = self.width * 3
+        raw = b"".join(b"\x00" + bytes(self.pixels[y * stride:(y + 1) * stride]) for y in range(self.height))
+        return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height, 8, 2, 0, 0, 0))
+                + chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b""))
+
+
+def render_chart(series: list[tuple[str, dict[str, int], int]], width: int = 800, height: int = 480) -> bytes:
+    # Зверху — дохід по днях; знизу — оплати (стовпчик угору за видами) і відтік (униз)
+    canvas = _Canvas(width, height)
+    left, right = 60, width - 20
+    step = (right - left) / max(1, len(series))
+    bar = max(1, int(step * 0.7))
+    top_area = (20, 190)
+    max_revenue = max((revenue for _, _, revenue in series), default=0) or 1
+    canvas.rect(left, top_area[1], right, top_area[1] + 1, GREY)
+    canvas.text(4, top_area[0], str(max_revenue))
+    for i, (_, _, revenue) in enumerate(series):
+        x = left + int(i * step)
+        canvas.rect(x, top_area[1] - int((top_area[1] - top_area[0]) * revenue / max_revenue), x + bar,
+                    top_area[1], COLORS['revenue'])
+
+    flow_top, flow_bottom = 230, height - 40
+    ups = [sum(counts.get(kind, 0) for kind in PAYMENT_KINDS) for _, counts, _ in series]
+    downs = [max(0, counts.get('churn', 0) - counts.get('churn_reverted', 0)) for _, counts, _ in series]
+    max_up, max_down = max(ups, default=0), max(downs, default=0)
+    total = max(1, max_up + max_down)
+    zero = flow_top + int((flow_bottom - flow_top) * max_up / total)
+    unit = (flow_bottom - flow_top) / total
+    canvas.rect(left, zero, right, zero + 1, GREY)
+    canvas.text(4, flow_top, str(max_up))
+    if max_down:
+        canvas.text(4, flow_bottom - 10, f"-{max_down}")
+    for i, (_, counts, _) in enumerate(series):
+        x = left + int(i * step)
+        y = zero
+        for kind in PAYMENT_KINDS:
+            h = int(round(counts.get(kind, 0) * unit))
+            canvas.rect(x, y - h, x + bar, y, COLORS[kind])
+            y -= h
+        canvas.rect(x, zero + 1, x + bar, zero + 1 + int(round(downs[i] * unit)), COLORS['churn'])
+    # Дати під віссю кожні 7 днів, рахуючи від останнього
+    for i in range(len(series) - 1, -1, -7):
+        canvas.text(left + int(i * step) - 8, height - 22, series[i][0][5:])
+    return canvas.png()
+
+
+LEGEND = ("Зверху — дохід за день (грн). Знизу — оплати: 🟩 нові, 🟦 продовження, "
+          "бірюзовий — оплата з grace, 🟪 повернення після expired; 🟥 униз — відтік.")
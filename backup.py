@@ -0,0 +1,170 @@
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import struct
+import sys
+import time
+from datetime import datetime, timezone
+
+from storage import Database
+
+logger = logging.getLogger(__name__)
+
+DELTA_MAGIC = b"IRDELTA1"
+CHUNK = 1024 * 1024
+
+
+class BackupResult:
+    def __init__(self, backup_id: str, kind: str, path: str, base_id: str | None,
+                 raw_size: int, size: int, duration: float):
+        self.backup_id = backup_id
+        self.kind = kind
+        self.path = path
+        self.base_id = base_id
+        self.raw_size = raw_size
+        self.size = size
+        self.duration = duration
+
+    @property
+    def caption(self) -> str:
+        kind = "повний" if self.kind == "full" else f"дельта до {self.base_id}"
+        return (f"Бекап {self.backup_id} ({kind}): {self.size / 1024:.0f} КБ "
+                f"(база {self.raw_size / 1024:.0f} КБ), {self.duration:.1f} с")
+
+
+class BackupManager:
+    """Узгоджені бекапи живої бази без блокування event loop.
+
+    Знімок робиться через sqlite3 backup API в окремому потоці, тому торнутої копії
+    під час запису не буде. Повний бекап — це gzip знімка; між повними робляться
+    дельти: сторінки БД, що змінились відносно останнього повного (тобто для відновлення
+    потрібні лише повний + остання дельта).
+    """
+
+    def __init__(self, db: Database, directory: str, full_every_days: float = 7,
+                 max_delta_ratio: float = 0.5):
+        self.db = db
+        self.directory = directory
+        self.full_every = full_every_days * 86400
+        self.max_delta_ratio = max_delta_ratio
+        self.base_path = os.path.join(directory, "base.db")
+        self._lock = asyncio.Lock()
+
+    async def create(self, full: bool = False) -> BackupResult:
+        async with self._lock:
+            result = await asyncio.to_thread(self._create, full)
+        await self.db.execute(
+            "INSERT INTO backups (backup_id, kind, base_id, duration_ms, raw_size, size) VALUES (?, ?, ?, ?, ?, ?)",
+            (result.backup_id, result.kind, result.base_id, int(result.duration * 1000),
+             result.raw_size, result.size))
+        logger.info(result.caption)
+        return result
+
+    def _base_id(self) -> tuple[str | None, float]:
+        marker = self.base_path + ".id"
+        if not (os.path.exists(self.base_path) and os.path.exists(marker)):
+            return None, 0
+        with open(marker) as f:
+            return f.read().strip(), os.path.getmtime(marker)
+
+    def _create(self, full: bool) -> BackupResult:
+        started = time.monotonic()
+        os.makedirs(self.directory, exist_ok=True)
+        backup_id = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S.%f")[:-3]
+        snapshot = os.path.join(self.directory, "snapshot.db")
+        self._snapshot(snapshot)
+        raw_size = os.path.getsize(snapshot)
+        base_id, base_time = self._base_id()
+        if not full and base_id and time.time() - base_time < self.full_every:
+            path = os.path.join(self.directory, f"delta-{backup_id}.gz")
+            write_delta(self.base_path, snapshot, path, base_id)
+            size = os.path.getsize(path)
+            if size <= raw_size * self.max_delta_ratio:
+                os.remove(snapshot)
+                return BackupResult(backup_id, "delta", path, base_id, raw_size, size,
+                                    time.monotonic() - started)
+            # Дельта вийшла майже як повний бекап — вигідніше оновити базу
+            os.remove(path)
+        path = os.path.join(self.directory, f"full-{backup_id}.db.gz")
+        with open(snapshot, "rb") as src, gzip.open(path, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, CHUNK)
+        # Попередні повні бекапи і дельти до них більше не потрібні локально
+        for name in os.listdir(self.directory):
+            if name.endswith(".gz") and name != os.path.basename(path):
+                os.remove(os.path.join(self.directory, name))
+        os.replace(snapshot, self.base_path)
+        with open(self.base_path + ".id", "w") as f:
+            f.write(backup_id)
+        return BackupResult(backup_id, "full", path, None, raw_size, os.path.getsize(path),
+                            time.monotonic() - started)
+
+    def _snapshot(self, target: str) -> None:
+        src = sqlite3.connect(self.db.path)
+        dst = sqlite3.connect(target)
+        try:
+            # Копіюємо порціями, щоб writer не чекав на весь файл одразу
+            src.backup(dst, pages=1024)
+            # Знімок має бути самодостатнім файлом, без -wal поруч
+            dst.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            dst.close()
+            src.close()
+
+
+def _page_size(path: str) -> int:
+    with sqlite3.connect(path) as conn:
+        return conn.execute("PRAGMA page_size").fetchone()[0]
+
+
+def write_delta(base: str, current: str, out: str, base_id: str) -> None:
+    # Формат: MAGIC, довжина base_id + base_id, page_size, к-сть сторінок,
+    # далі записи (номер сторінки, сторінка) лише для змінених сторінок
+    page_size = _page_size(current)
+    pages = os.path.getsize(current) // page_size
+    with open(base, "rb") as old, open(current, "rb") as new, gzip.open(out, "wb", compresslevel=6) as dst:
+        encoded_id = base_id.encode()
+        dst.write(DELTA_MAGIC + struct.pack(">H", len(encoded_id)) + encoded_id)
+        dst.write(struct.pack(">II", page_size, pages))
+        for number in range(pages):
+            page = new.read(page_size)
+            if old.read(page_size) != page:
+                dst.write(struct.pack(">I", number) + page)
+
+
+def apply_delta(base: str, delta: str, out: str) -> None:
+    shutil.copyfile(base, out)
+    with gzip.open(delta, "rb") as src, open(out, "r+b") as dst:
+        if src.read(len(DELTA_MAGIC)) != DELTA_MAGIC:
+            raise ValueError(f"{delta} не є дельтою бекапу")
+        (id_len,) = struct.unpack(">H", src.read(2))
+        src.read(id_len)
+        page_size, pages = struct.unpack(">II", src.read(8))
+        while header := src.read(4):
+            (number,) = struct.unpack(">I", header)
+            dst.seek(number * page_size)
+            dst.write(src.read(page_size))
+        dst.truncate(pages * page_size)
+
+
+def restore(out: str, full: str, delta: str | None = None) -> None:
+    # Відновлення: розпаковуємо повний бекап і, якщо є, накладаємо останню дельту
+    unpacked = out + ".base"
+    with gzip.open(full, "rb") as src, open(unpacked, "wb") as dst:
+        shutil.copyfileobj(src, dst, CHUNK)
+    if delta:
+        apply_delta(unpacked, delta, out)
+        os.remove(unpacked)
+    else:
+        os.replace(unpacked, out)
+
+
+if __name__ == "__main__":
+    # python backup.py users.db full-XXXX.db.gz [delta-YYYY.gz]
+    if len(sys.argv) not in (3, 4):
+        print("Використання: python backup.py <куди.db> <full.db.gz> [delta.gz]")
+        sys.exit(1)
+    restore(*sys.argv[1:])
+    print(f"Базу відновлено в {sys.argv[1]}")
@@ -0,0 +1,129 @@
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+# Заглушка Telegram Bot API для навантажувальних тестів.
+# Відповідає валідними для aiogram об'єктами, записує виклики і вміє
+# додавати затримку та віддавати 429 (flood control) із заданою ймовірністю.
+
+BOT_USER = {"id": 42, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+
+
+def _chat(chat_id) -> dict:
+    chat_id = int(chat_id)
+    return {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"}
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 retry_after: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.calls: Counter = Counter()
+        self.throttled: Counter = Counter()
+        self.latencies: list[float] = []
+        self._message_ids = itertools.count(1)
+        self._links = itertools.count(1)
+        self.webhook: dict = {"url": ""}
+        # Черга для getUpdates: бенчмарк кладе апдейти через push_update
+        self.updates: list[dict] = []
+        self._updates_ready = asyncio.Event()
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner: web.AppRunner | None = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081) -> str:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+
+    def push_update(self, update: dict) -> None:
+        self.updates.append(update)
+        self._updates_ready.set()
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        # Long polling: offset підтверджує все, що менше; без нових апдейтів чекаємо до timeout
+        offset = int(params.get("offset") or 0)
+        if offset:
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        if not self.updates:
+            self._updates_ready.clear()
+            try:
+                await asyncio.wait_for(self._updates_ready.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:int(params.get("limit") or 100)]
+
+    def _message(self, params: dict) -> dict:
+        message = {"message_id": next(self._message_ids), "date": int(time.time()),
+                   "chat": _chat(params.get("chat_id", 1))}
+        if "text" in params:
+            message["text"] = params["text"]
+        return message
+
+    def _invite_link(self, params: dict) -> dict:
+        return {"invite_link": f"https://t.me/+bench{next(self._links)}", "creator": BOT_USER,
+                "creates_join_request": params.get("creates_join_request") == "true",
+                "is_primary": False, "is_revoked": False}
+
+    def _result(self, method: str, params: dict):
+        if method in ("sendMessage", "forwardMessage", "sendDocument", "sendPhoto", "editMessageText"):
+            return self._message(params)
+        if method == "copyMessage":
+            return {"message_id": next(self._message_ids)}
+        if method in ("createChatInviteLink", "revokeChatInviteLink", "editChatInviteLink"):
+            return self._invite_link(params)
+        if method == "getChat":
+            return {**_chat(params["chat_id"]), "username": f"user{params['chat_id']}",
+                    "accent_color_id": 0, "max_reaction_count": 11}
+        if method == "getMe":
+            return BOT_USER
+        if method == "setWebhook":
+            self.webhook = {"url": params.get("url", "")}
+            if params.get("allowed_updates"):
+                self.webhook["allowed_updates"] = json.loads(params["allowed_updates"])
+            return True
+        if method == "deleteWebhook":
+            self.webhook = {"url": ""}
+            return True
+        if method == "getWebhookInfo":
+            return {**self.webhook, "has_custom_certificate": False, "pending_update_count": 0}
+        if method == "getChatMemberCount":
+            return 0
+        if method == "getChatAdministrators":
+            return [{"status": "administrator", "user": BOT_USER, "can_be_edited": False,
+                     "is_anonymous": False, "can_manage_chat": True, "can_delete_messages": True,
+                     "can_manage_video_chats": True, "can_restrict_members": True,
+                     "can_promote_members": False, "can_change_info": True, "can_invite_users": True,
+                     "can_post_stories": False, "can_edit_stories": False, "can_delete_stories": False}]
+        return True
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        started = time.perf_counter()
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        self.calls[method] += 1
+        if self.error_rate and random.random() < self.error_rate:
+            self.throttled[method] += 1
+            return web.json_response({"ok": False, "error_code": 429,
+                                      "description": f"Too Many Requests: retry after {self.retry_after}",
+                                      "parameters": {"retry_after": self.retry_after}}, status=429)
+        if method == "getUpdates":
+            return web.json_response({"ok": True, "result": await self._get_updates(params)})
+        self.latencies.append(time.perf_counter() - started)
+        return web.json_response({"ok": True, "result": self._result(method, params)})
@@ -0,0 +1,288 @@
+"""Навантажувальний бенчмарк бота проти локальної заглушки Bot API.
+
+    python bench/load.py webhook --rate 200 --duration 10 --users 1000
+    python bench/load.py polling --rate 200 --duration 10 --users 1000
+    python bench/load.py compare --rate 200 --duration 10
+    python bench/load.py expiry --sizes 1000,10000,100000
+
+webhook: піднімає fake Bot API і застосунок з bot.build_app(), шле апдейти у вебхук
+із заданою частотою (суміш заявок на вступ, вибору тарифу і скрінів оплати) і рахує
+p50/p99 обробки, наскрізну затримку (від відправки до кінця обробки) та апдейти/с.
+polling: те саме навантаження, але апдейти лежать у черзі fake API, а бот забирає їх
+через getUpdates (UPDATE_MODE=polling).
+compare: запускає webhook і polling окремими процесами з однаковими параметрами і
+виводить таблицю поруч.
+expiry: засіває базу N користувачами і міряє check_subscriptions.
+
+Ліміти на чат у черзі відправки лишаються бойовими. Усе, що йде адміну (пересилання
+скрінів, сповіщення про заявки й «Я оплатив»), шле окрема задача AdminNotifier з темпом
+~1 повідомлення/с, тож після кінця прогону вона ще якийсь час дописує чергу — на
+затримку хендлерів це не впливає.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_api import FakeBotAPI  # noqa: E402
+
+ADMIN_ID = 1
+GROUP_ID = -1001000000000
+SECRET = "bench-secret"
+DAY = 86400
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def configure_env(api_url: str, webhook_port: int, global_rate: float, mode: str = "webhook") -> str:
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    os.environ.update(
+        BOT_TOKEN="123456:bench", ADMIN_ID=str(ADMIN_ID), GROUP_ID=str(GROUP_ID),
+        DB_FILE=os.path.join(workdir, "users.db"), BACKUP_DIR=os.path.join(workdir, "backups"),
+        TELEGRAM_API_URL=api_url, BASE_WEBHOOK_URL=f"http://127.0.0.1:{webhook_port}",
+        WEBHOOK_SECRET=SECRET, TG_GLOBAL_RATE=str(global_rate), UPDATE_MODE=mode,
+    )
+    return workdir
+
+
+async def seed_users(db, count: int, now: int, spread: tuple[int, int] = (-3 * DAY, 30 * DAY)) -> None:
+    def insert(conn):
+        rows = []
+        for uid in range(1, count + 1):
+            end = now + random.randint(*spread)
+            status = 'grace' if end < now + DAY and random.random() < 0.5 else 'active'
+            rows.append((uid + 1000, f"user{uid}", "14 днів", now - 14 * DAY, end, status))
+        conn.executemany("INSERT OR REPLACE INTO users (user_id, username, tariff, start_date, end_date, status) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", rows)
+    await db.write(insert)
+
+
+def user(uid: int) -> dict:
+    return {"id": uid, "is_bot": False, "first_name": f"u{uid}", "username": f"user{uid}"}
+
+
+class UpdateFactory:
+    def __init__(self, users: int):
+        self.users = users
+        self.ids = itertools.count(1)
+        self.messages = itertools.count(1)
+
+    def join_request(self) -> dict:
+        # Половина заявок — від користувачів без підписки (відхилення)
+        uid = random.randint(1, self.users * 2) + 1000
+        return {"update_id": next(self.ids), "chat_join_request": {
+            "chat": {"id": GROUP_ID, "type": "supergroup", "title": "bench"},
+            "from": user(uid), "user_chat_id": uid, "date": int(time.time())}}
+
+    def tariff_callback(self) -> dict:
+        uid = random.randint(1, self.users) + 1000
+        return {"update_id": next(self.ids), "callback_query": {
+            "id": str(next(self.messages)), "from": user(uid), "chat_instance": "bench",
+            "data": random.choice(["tariff_14days", "tariff_1month"]),
+            "message": {"message_id": next(self.messages), "date": int(time.time()),
+                        "chat": {"id": uid, "type": "private"}, "text": "menu"}}}
+
+    def proof(self) -> dict:
+        uid = random.randint(1, self.users) + 1000
+        return {"update_id": next(self.ids), "message": {
+            "message_id": next(self.messages), "date": int(time.time()),
+            "chat": {"id": uid, "type": "private"}, "from": user(uid),
+            "photo": [{"file_id": "bench", "file_unique_id": "bench", "width": 1, "height": 1}]}}
+
+
+MIX = (("join_request", 0.5), ("tariff_callback", 0.3), ("proof", 0.2))
+
+
+async def run_ingress(args) -> dict:
+    from aiohttp import ClientSession, web
+
+    api = FakeBotAPI(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    api_url = await api.start(port=args.api_port)
+    configure_env(api_url, args.port, args.global_rate, args.mode)
+    import bot
+    from aiogram import BaseMiddleware
+
+    durations: dict[str, list[float]] = {}
+    latencies: list[float] = []
+    sent_at: dict[int, float] = {}
+    done = asyncio.Event()
+    state = {"processed": 0, "expected": None, "last": 0.0}
+
+    class Recorder(BaseMiddleware):
+        async def __call__(self, handler, event, data):
+            started = time.perf_counter()
+            try:
+                return await handler(event, data)
+            finally:
+                now = time.perf_counter()
+                durations.setdefault(event.event_type, []).append(now - started)
+                if event.update_id in sent_at:
+                    latencies.append(now - sent_at.pop(event.update_id))
+                state["processed"] += 1
+                state["last"] = now
+                if state["expected"] is not None and state["processed"] >= state["expected"]:
+                    done.set()
+
+    bot.dp.update.outer_middleware(Recorder())
+    app = bot.build_app()
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+    await seed_users(bot.db, args.users, int(time.time()))
+    for uid in range(1001, args.users + 1001):
+        await bot.waiting_for_proof.put(uid, f"user{uid}", "14 днів", "14days")
+
+    factory = UpdateFactory(args.users)
+    kinds, weights = zip(*MIX)
+    url = f"http://127.0.0.1:{args.port}{bot.WEBHOOK_PATH}"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+    sent = 0
+    http_errors = 0
+    interval = 1 / args.rate
+    async with ClientSession() as client:
+        async def post(update: dict):
+            nonlocal http_errors
+            async with client.post(url, json=update, headers=headers) as response:
+                if response.status != 200:
+                    http_errors += 1
+
+        started = time.perf_counter()
+        posts = []
+        while time.perf_counter() - started < args.duration:
+            kind = random.choices(kinds, weights)[0]
+            update = getattr(factory, kind)()
+            sent_at[update["update_id"]] = time.perf_counter()
+            if args.mode == "polling":
+                api.push_update(update)
+            else:
+                posts.append(asyncio.create_task(post(update)))
+            sent += 1
+            # Рівномірний темп: наздоганяємо розклад, якщо цикл відстав
+            target = started + sent * interval
+            delay = target - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await asyncio.gather(*posts)
+        state["expected"] = sent
+        if state["processed"] >= sent:
+            done.set()
+        try:
+            await asyncio.wait_for(done.wait(), timeout=args.drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"Не всі апдейти оброблені за {args.drain_timeout} с", file=sys.stderr)
+    elapsed = state["last"] - started
+    everything = [d for values in durations.values() for d in values]
+    result = {
+        "mode": args.mode, "sent": sent, "processed": state["processed"], "http_errors": http_errors,
+        "throughput": state["processed"] / elapsed if elapsed > 0 else 0.0,
+        "latency_p50": percentile(latencies, 0.5), "latency_p99": percentile(latencies, 0.99),
+        "handler": {kind: (len(values), percentile(values, 0.5), percentile(values, 0.99))
+                    for kind, values in sorted(durations.items()) + [("усі", everything)]},
+        "api_calls": dict(api.calls), "throttled": sum(api.throttled.values()),
+    }
+    await runner.cleanup()
+    await api.stop()
+    return result
+
+
+def print_ingress(args, result: dict) -> None:
+    print(f"\n{result['mode']}: надіслано {result['sent']} апдейтів за {args.duration} с (ціль {args.rate}/с), "
+          f"HTTP помилок {result['http_errors']}")
+    print(f"Оброблено {result['processed']} → {result['throughput']:.1f} апдейтів/с; наскрізна затримка "
+          f"p50 {result['latency_p50'] * 1000:.1f} мс, p99 {result['latency_p99'] * 1000:.1f} мс")
+    print(f"{'тип':<20}{'к-сть':>8}{'p50, мс':>10}{'p99, мс':>10}")
+    for kind, (count, p50, p99) in result["handler"].items():
+        print(f"{kind:<20}{count:>8}{p50 * 1000:>10.1f}{p99 * 1000:>10.1f}")
+    print(f"Виклики Bot API: {result['api_calls']}; 429: {result['throttled']}")
+
+
+def run_compare(args) -> None:
+    # Кожен режим — окремий процес: bot обирає ingress під час імпорту
+    results = []
+    passthrough = [a for a in sys.argv[2:] if a != "--json"]
+    for mode in ("webhook", "polling"):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), mode, "--json", *passthrough],
+                                check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    print(f"\nНавантаження: {args.rate}/с протягом {args.duration} с, затримка API {args.latency * 1000:.0f} мс")
+    print(f"{'':<28}" + "".join(f"{r['mode']:>12}" for r in results))
+    rows = [("оброблено", "processed", "{:.0f}"), ("апдейтів/с", "throughput", "{:.1f}"),
+            ("затримка p50, мс", "latency_p50", "{:.1f}"), ("затримка p99, мс", "latency_p99", "{:.1f}")]
+    for label, key, fmt in rows:
+        scale = 1000 if key.startswith("latency") else 1
+        print(f"{label:<28}" + "".join(f"{fmt.format(r[key] * scale):>12}" for r in results))
+    print(f"{'виклики getUpdates':<28}" + "".join(f"{r['api_calls'].get('getUpdates', 0):>12}" for r in results))
+
+
+async def run_expiry(args) -> None:
+    api = FakeBotAPI(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    api_url = await api.start(port=args.api_port)
+    configure_env(api_url, args.port, args.global_rate)
+    import bot
+    from migrations import migrate
+
+    print(f"{'users':>8}{'events':>8}{'failed':>8}{'час, с':>10}{'подій/с':>10}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        # Для кожного розміру — своя чиста база
+        bot.db.close()
+        bot.db.path = os.path.join(tempfile.mkdtemp(prefix="bench-expiry-"), "users.db")
+        bot.db.open()
+        migrate(bot.db)
+        bot.subs.cache.clear()
+        await seed_users(bot.db, size, int(time.time()))
+        report = await bot.check_subscriptions()
+        rate = report["processed"] / report["duration"] if report["duration"] else 0
+        print(f"{size:>8}{report['processed']:>8}{report['failed']:>8}{report['duration']:>10.2f}{rate:>10.1f}")
+    await bot.outbox.close()
+    await bot.bot.session.close()
+    await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["webhook", "polling", "compare", "expiry"])
+    parser.add_argument("--rate", type=float, default=100, help="апдейтів на секунду")
+    parser.add_argument("--duration", type=float, default=10, help="тривалість генерації, с")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--latency", type=float, default=0.02, help="затримка fake API, с")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="частка відповідей 429")
+    parser.add_argument("--global-rate", type=float, default=1000,
+                        help="ліміт черги відправки (30 — як у Telegram)")
+    parser.add_argument("--drain-timeout", type=float, default=300,
+                        help="скільки чекати на обробку вже надісланих апдейтів, с")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--api-port", type=int, default=8091)
+    parser.add_argument("--json", action="store_true", help="підсумок одним JSON-рядком (для compare)")
+    args = parser.parse_args()
+    import logging
+    logging.disable(logging.WARNING)
+    if args.mode == "compare":
+        run_compare(args)
+    elif args.mode == "expiry":
+        asyncio.run(run_expiry(args))
+    else:
+        result = asyncio.run(run_ingress(args))
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False))
+        else:
+            print_ingress(args, result)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,48 @@
-import asyncio
+import csv
+import hashlib
 import logging
 import os
-from datetime import datetime, timedelta, timezone
+import tempfile
+import time
+from datetime import datetime, timezone
 from aiohttp import web
 from aiogram import Bot, Dispatcher, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, ChatJoinRequest
-from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, ChatJoinRequest, ChatMemberUpdated
+from aiogram.webhook.aiohttp_server import setup_application
 from dotenv import load_dotenv
-import sqlite3
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from aiogram.types import FSInputFile
+from apscheduler.triggers.interval import IntervalTrigger
+from aiogram.types import BufferedInputFile, FSInputFile
+from analytics import LEGEND, Analytics
+from backup import BackupManager
+from bulk import ADD, ADDSUB_INVITE_TEXT, BulkOps, parse_rows, report as bulk_report, summary as bulk_summary
+from cluster import Cluster, make_backend
+from dedup import UpdateDeduplicator
+from expiry import ExpiryScheduler
+from fanout import fan_out
+from ingress import PollingIngress, WebhookIngress
+from logs import setup_logging
+from invite_jobs import InviteJobs
+from invite_pool import InvitePool
+from membership import MembershipIndex
+from metrics import Gauge, approvals, join_requests, kicks, metrics_handler, registry, startup, timed_job
+from middlewares import (ApiMetricsMiddleware, HandlerNameMiddleware, UpdateContextMiddleware,
+                         UpdateTimingMiddleware)
+from migrations import migrate
+from notifier import AdminNotifier
+from pending import PendingPayments
+from profiles import ProfileCache
+from proofs import ProofQueue
+from sender import OutboundQueue, PRIORITY_BULK, priority
+from storage import Database
+from subscriptions import SubscriptionStore
+from supervisor import TaskSupervisor
+from tariffs import load_tariffs
 
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -24,180 +55,172 @@ PAYMENT_BANK = os.getenv("PAYMENT_BANK")
 WEBHOOK_PATH = "/webhook"
 BASE_WEBHOOK_URL = os.getenv("BASE_WEBHOOK_URL")
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Власний Bot API сервер (локальний telegram-bot-api або заглушка з bench/)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Логи йдуть через чергу в окремий потік: JSON (LOG_FORMAT=text — локально), семплінг через LOG_SAMPLE
+setup_logging()
 logger = logging.getLogger(__name__)
 
-bot = Bot(token=BOT_TOKEN)
+session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(token=BOT_TOKEN, session=session)
+# Відра черги відправки — на процес: у кластері глобальний ліміт Telegram (~30/с) ділиться між інстансами
+outbox = OutboundQueue(global_rate=float(os.getenv("TG_GLOBAL_RATE") or 30 / int(os.getenv("CLUSTER_INSTANCES", 1))))
+bot.session.middleware(outbox)
+bot.session.middleware(ApiMetricsMiddleware())
 dp = Dispatcher()
-waiting_for_proof = {}
+# Першим, щоб і dedup/profiles логували з update_id
+dp.update.outer_middleware(UpdateContextMiddleware(slow=float(os.getenv("LOG_SLOW_UPDATE", 1))))
+for name, observer in dp.observers.items():
+    if name != "update":
+        observer.middleware(HandlerNameMiddleware())
+dp.update.outer_middleware(UpdateTimingMiddleware())
 main_menu = InlineKeyboardMarkup(inline_keyboard=[
     [InlineKeyboardButton(text="Обрати тариф", callback_data="choose_tariff")],
     [InlineKeyboardButton(text="Мій статус / до якої дати", callback_data="my_status")]
 ])
-tariffs_menu = InlineKeyboardMarkup(inline_keyboard=[
-    [InlineKeyboardButton(text="14 днів — 500 грн", callback_data="tariff_14days")],
-    [InlineKeyboardButton(text="1 місяць — 800 грн", callback_data="tariff_1month")],
-    [InlineKeyboardButton(text="← Назад", callback_data="back")]
-])
-DB_FILE = "/data/users.db"
+tariffs = load_tariffs(os.getenv("TARIFFS"), recipient=PAYMENT_RECIPIENT, iban=PAYMENT_IBAN,
+                       ipn=IPN, bank=PAYMENT_BANK)
+DB_FILE = os.getenv("DB_FILE", "/data/users.db")
+db = Database(DB_FILE, readers=int(os.getenv("DB_READERS", 4)))
+dedup = UpdateDeduplicator(db)
+dp.update.outer_middleware(dedup)
+# Після dedup: повтори апдейтів профілі не оновлюють
+profiles = ProfileCache(db, cache_size=int(os.getenv("PROFILE_CACHE_SIZE", 50000)))
+dp.update.outer_middleware(profiles)
+# Кілька інстансів (CLUSTER_BACKEND=sqlite): локи в тій самій базі і лідер для планувальника. Увесь
+# стан бота — у DB_FILE, тож інстанси мусять ділити один файл бази: той самий хост або спільний том
+CLUSTER_BACKEND = os.getenv("CLUSTER_BACKEND")
+cluster = Cluster(make_backend(CLUSTER_BACKEND, db), os.getenv("INSTANCE_ID"),
+                  lease=float(os.getenv("CLUSTER_LEASE", 30)))
+# Кеш підписок інвалідовується лише локально, тож у кластері він живе недовго
+sub_cache_ttl = os.getenv("SUB_CACHE_TTL", "30" if CLUSTER_BACKEND else "")
+subs = SubscriptionStore(db, cache_size=int(os.getenv("SUB_CACHE_SIZE", 50000)),
+                         cache_ttl=float(sub_cache_ttl) if sub_cache_ttl else None)
+invites = InvitePool(db, bot, GROUP_ID, size=int(os.getenv("INVITE_POOL_SIZE", 20)))
+invite_jobs = InviteJobs(db, bot, invites, concurrency=int(os.getenv("INVITE_CONCURRENCY", 10)),
+                         owner=cluster.instance_id, lease=cluster.lease * 2)
+backups = BackupManager(db, os.getenv("BACKUP_DIR", "/data/backups"),
+                        full_every_days=float(os.getenv("BACKUP_FULL_EVERY_DAYS", 7)))
+waiting_for_proof = PendingPayments(db, ttl=float(os.getenv("PENDING_TTL_HOURS", 72)) * 3600,
+                                    max_size=int(os.getenv("PENDING_MAX", 10000)),
+                                    shared=bool(CLUSTER_BACKEND))
+members = MembershipIndex(db)
+analytics = Analytics(db)
+STATS_PERIODS = (7, 30, 90)
+ZAYCEV_KICK_BATCH = int(os.getenv("ZAYCEV_KICK_BATCH", 20))
+bulk = BulkOps(subs, invites, members, bot, concurrency=int(os.getenv("BULK_CONCURRENCY", 10)),
+               kick_batch=ZAYCEV_KICK_BATCH)
+BULK_MAX_BYTES = 20 * 1024 * 1024  # Більше Bot API однаково не дасть завантажити
+tasks = TaskSupervisor(concurrency=int(os.getenv("UPDATE_CONCURRENCY", 50)),
+                       max_pending=int(os.getenv("UPDATE_QUEUE_MAX", 1000)))
+# Сповіщення адміну з хендлерів — дайджестом з окремої задачі, а не в слоті супервізора
+admin_notes = AdminNotifier(bot, ADMIN_ID, linger=float(os.getenv("ADMIN_DIGEST_SECONDS", 2)))
+proofs = ProofQueue(db, bot, ADMIN_ID, admin_notes)
+registry.register(Gauge("bot_task_queue_depth", "Фонові задачі, що чекають у черзі", lambda: tasks.depth))
+registry.register(Gauge("bot_tasks_running", "Фонові задачі, що виконуються", lambda: tasks.running))
+registry.register(Gauge("bot_invite_pool_free", "Вільних посилань у пулі запрошень", lambda: invites.free))
+registry.register(Gauge("bot_admin_digest_depth", "Події для адміна, що чекають відправки", lambda: admin_notes.depth))
+registry.register(Gauge("bot_outbox_depth", "Запити, що чекають у черзі відправки", lambda: outbox.depth))
+registry.register(Gauge("bot_subscription_cache_size", "Записів у кеші підписок", lambda: len(subs.cache)))
+registry.register(Gauge("bot_profile_cache_size", "Профілів користувачів у кеші", lambda: len(profiles.cache)))
+registry.register(Gauge("bot_pending_payments_cached", "Очікуваних оплат у кеші", lambda: len(waiting_for_proof.cache)))
 
 
 def init_db():
-    with sqlite3.connect(DB_FILE) as conn:  # Додано context manager для DB
-        cur = conn.cursor()
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                tariff TEXT,
-                start_date TEXT,
-                end_date TEXT,
-                status TEXT DEFAULT 'pending',
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        conn.commit()
-
-def save_subscription(user_id: int, username: str, tariff: str, days: int):
-    now = datetime.now(timezone.utc)
-    with sqlite3.connect(DB_FILE) as conn:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT end_date, status FROM users WHERE user_id = ?",
-            (user_id,)
-        )
-        existing = cur.fetchone()
-        if existing:
-            old_end_str, status = existing
-            old_end = datetime.fromisoformat(old_end_str)
-            # Визначаємо точку відліку для нових днів
-            if status == 'active' and old_end > now:
-                # ще активна підписка → продовжуємо від кінця старої
-                base_date = old_end
-                action = "Продовжено активну підписку"
-            else:
-                # grace, expired, або інший статус → починаємо з моменту оплати
-                base_date = now
-                action = "Активовано нову підписку (grace/expired)"
-
-            new_end = base_date + timedelta(days=days)
-            cur.execute("""
-                UPDATE users
-                SET 
-                    tariff      = ?,
-                    start_date  = ?,
-                    end_date    = ?,
-                    status      = 'active',
-                    username    = ?
-                WHERE user_id = ?
-            """, (
-                tariff,
-                now.isoformat(),
-                new_end.isoformat(),
-                username,
-                user_id
-            ))
-            logger.info(f"{action} для {user_id}: +{days} днів, нова дата закінчення: {new_end.isoformat()}")
-        else:
-            # Новий користувач — просто додаємо від зараз
-            new_end = now + timedelta(days=days)
-            cur.execute('''
-                INSERT INTO users
-                (user_id, username, tariff, start_date, end_date, status)
-                VALUES (?, ?, ?, ?, ?, 'active')
-            ''', (
-                user_id,
-                username,
-                tariff,
-                now.isoformat(),
-                new_end.isoformat()
-            ))
-            logger.info(f"Нова підписка для {user_id}: {days} днів, закінчення: {new_end.isoformat()}")
-        conn.commit()
-
-async def check_subscriptions():
-    with sqlite3.connect(DB_FILE) as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT user_id, username, tariff, end_date, status
-            FROM users
-            WHERE status IN ('active', 'grace')
-        """)
-        users = cur.fetchall()
-    now = datetime.now(timezone.utc)
-    for user_id, username, tariff, end_date_str, status in users:
-        end_date = datetime.fromisoformat(end_date_str)
-        days_before_end = (end_date - now).days
-        if status == 'active' and days_before_end < 1:
-            new_end = end_date + timedelta(days=2)
-            with sqlite3.connect(DB_FILE) as conn:
-                cur = conn.cursor()
-                cur.execute("UPDATE users SET status = 'grace', end_date = ? WHERE user_id = ?",
-                            (new_end.isoformat(), user_id))
-                conn.commit()
-            await bot.send_message(user_id,
-                                   f"Привіт! Твоя підписка ({tariff}) закінчується сьогодні.\nНе хвилюйся, у тебе буде ще 2 дні grace-періоду, щоб продовжити без втрати доступу! 💪\nОбери тариф у меню і оплати, щоб залишитися з нами ❤️")
-            logger.info(f"Grace почався для {user_id}")
-        elif status == 'grace':
-            days_left_in_grace = (end_date - now).days
-
-            if days_left_in_grace == 1:
-                # сьогодні — перед останній день grace (перший)
-                await bot.send_message(user_id,
-                                       f"Це перший з двох днів grace-періоду!\n"
-                                       f"Підписка закінчиться післязавтра зранку.\n"
-                                       "Продовж, щоб не втратити доступ до тренувань 💙")
-            if days_left_in_grace == 0:
-                # сьогодні — останній день grace (другий)
-                await bot.send_message(user_id,
-                                       f"Це останній день grace-періоду!\n"
-                                       f"Підписка закінчиться завтра зранку.\n"
-                                       "Продовж сьогодні, щоб не втратити доступ до тренувань 💙")
-
-            elif days_left_in_grace < 0:
-                # grace закінчився (сьогодні або раніше)
-                try:
-                    await bot.ban_chat_member(chat_id=GROUP_ID, user_id=user_id)
-                    await bot.unban_chat_member(chat_id=GROUP_ID, user_id=user_id)
-                    logger.info(f"Кік користувача {user_id} після grace")
-                    with sqlite3.connect(DB_FILE) as conn:
-                        cur = conn.cursor()
-                        cur.execute("UPDATE users SET status = 'expired' WHERE user_id = ?", (user_id,))
-                        conn.commit()
-                    await bot.send_message(user_id,
-                                           "На жаль, grace-період закінчився 😔\n"
-                                           "Твій доступ до групи закрито.\n"
-                                           "Щоб повернутися — напиши мені знову та обери тариф. 🚀")
-                except Exception as e:
-                    logger.error(f"Помилка кіку {user_id}: {e}")
-
-
+    db.open()
+    version = migrate(db)
+    logger.info(f"Схема БД версії {version}")
+
+GRACE_NOTICES = {
+    'grace': "Привіт! Твоя підписка ({tariff}) закінчується сьогодні.\nНе хвилюйся, у тебе буде ще 2 дні grace-періоду, щоб продовжити без втрати доступу! 💪\nОбери тариф у меню і оплати, щоб залишитися з нами ❤️",
+    # перед останній день grace (перший)
+    'grace_first': "Це перший з двох днів grace-періоду!\nПідписка закінчиться за 2 дні.\nПродовж, щоб не втратити доступ до тренувань 💙",
+    # останній день grace (другий)
+    'grace_last': "Це останній день grace-періоду!\nПідписка закінчиться за добу.\nПродовж сьогодні, щоб не втратити доступ до тренувань 💙",
+    'expired': "На жаль, grace-період закінчився 😔\nТвій доступ до групи закрито.\nЩоб повернутися — напиши мені знову та обери тариф. 🚀",
+}
+SEND_CONCURRENCY = int(os.getenv("SEND_CONCURRENCY", 20))
+
+
+async def notify_expiry_event(event: tuple[int, str, str]):
+    user_id, tariff, kind = event
+    if kind == 'expired':
+        # grace закінчився (сьогодні або раніше)
+        try:
+            await bot.ban_chat_member(chat_id=GROUP_ID, user_id=user_id)
+            await bot.unban_chat_member(chat_id=GROUP_ID, user_id=user_id)
+        except Exception:
+            # Кік не вдався — повертаємо grace, наступна перевірка спробує знову
+            await subs.restore_grace([user_id])
+            raise
+        kicks.inc("grace")
+        await members.left(user_id)
+        logger.info(f"Кік користувача {user_id} після grace")
+    await bot.send_message(user_id, GRACE_NOTICES[kind].format(tariff=tariff))
+    if kind == 'grace':
+        logger.info(f"Grace почався для {user_id}")
+
+
+async def process_expiry(now: datetime) -> dict:
+    started = time.monotonic()
+    # Всі переходи active→grace, нагадування і grace→expired — однією транзакцією,
+    # а повідомлення/кіки потім паралельно з обмеженням
+    events = await subs.run_expiry_transitions(now)
+    with priority(PRIORITY_BULK):
+        results = await fan_out(events, notify_expiry_event, limit=SEND_CONCURRENCY)
+    failed = 0
+    for (user_id, _, kind), _, error in results:
+        if error:
+            failed += 1
+            logger.error(f"Помилка обробки {kind} для {user_id}: {error}")
+    report = {"processed": len(events), "failed": failed, "duration": time.monotonic() - started}
+    if events:
+        logger.info(f"Переходи підписок: оброблено {report['processed']}, помилок {failed}, "
+                    f"за {report['duration']:.2f} с")
+    return report
+
+
+# Переходи спрацьовують у свій час із купи; щоденна перевірка нижче — лише звірка
+# У кластері зміни з інших інстансів доходять до лідера через expiry_touches
+expiry = ExpiryScheduler(subs, process_expiry, shared=bool(CLUSTER_BACKEND))
+registry.register(Gauge("bot_expiry_scheduled", "Підписок у черзі планувальника закінчень", lambda: len(expiry)))
+
+
+@cluster.exclusive("check_subscriptions")
+@timed_job("check_subscriptions")
+async def check_subscriptions() -> dict:
+    report = await process_expiry(datetime.now(timezone.utc))
+    if expiry.running:
+        # Звірка: зміни з інших інстансів чи поза ботом потрапляють у купу
+        await expiry.load()
+    elif expiry.enabled:
+        logger.error("Планувальник закінчень зупинився — перезапускаю")
+        await expiry.start()
+    logger.info(f"Перевірка підписок: оброблено {report['processed']}, помилок {report['failed']}, "
+                f"за {report['duration']:.2f} с")
+    return report
+
+
+@cluster.exclusive("daily_backup")
+@timed_job("daily_backup")
 async def daily_backup():
     try:
-        await bot.send_document(chat_id=ADMIN_ID, document=FSInputFile(DB_FILE),
-                                caption=f"Щоденний бекап бази даних {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M UTC')}")
+        result = await backups.create()
+        await bot.send_document(chat_id=ADMIN_ID, document=FSInputFile(result.path),
+                                caption=f"Щоденний бекап бази даних\n{result.caption}")
         logger.info("Щоденний бекап бази надіслано адміну")
     except Exception as e:
         logger.error(f"Помилка щоденного бекапу: {e}")
 
 
-def get_user_status(user_id: int) -> dict | None:
-    with sqlite3.connect(DB_FILE) as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT tariff, start_date, end_date, status FROM users WHERE user_id = ?", (user_id,))
-        row = cur.fetchone()
-    if row:
-        return {"tariff": row[0], "start_date": row[1], "end_date": row[2], "status": row[3]}
-    return None
-
-
 @dp.message(Command("admin"))
 async def cmd_admin(message: Message):
     if message.from_user.id != ADMIN_ID:
         await message.answer("Доступ заборонено. Це тільки для адміністратора.")
         return
     admin_menu = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Скріни на перевірку", callback_data="proof:v:0")],
         [InlineKeyboardButton(text="Список підписників", callback_data="admin_listusers")],
         [InlineKeyboardButton(text="Додати підписку", callback_data="admin_addsub")],
         [InlineKeyboardButton(text="Видалити підписку", callback_data="admin_removesub")],
@@ -212,30 +235,153 @@ async def cmd_admin(message: Message):
     await message.answer("Вітаю в адмін-панелі! 💻\nЩо хочеш зробити?", reply_markup=admin_menu)
 
 
+async def find_zaycev() -> tuple[str, list[int]]:
+    # Учасники з індексу без active/grace підписки (адміни й бот не рахуються)
+    total_members = await bot.get_chat_member_count(GROUP_ID)
+    admins = await bot.get_chat_administrators(GROUP_ID)
+    total_admins = len(admins) - 1
+    await members.load()
+    subscribed = set(await subs.current_user_ids())
+    exempt = {admin.user.id for admin in admins}
+    zaycev = members.unauthorized(subscribed, exempt)
+    coverage = members.coverage(total_members, len(admins))
+    lines = [f"В групі {total_members} учасників (з них {total_admins} адмінів).",
+             f"В БД {len(subscribed)} активних підписок.",
+             f"Індекс знає {len(members.members)} учасників ({coverage:.0%} групи)."]
+    if zaycev:
+        shown = ", ".join(str(uid) for uid in zaycev[:50])
+        more = f" і ще {len(zaycev) - 50}" if len(zaycev) > 50 else ""
+        lines = [f"Увага! Знайдено {len(zaycev)} зайців! 🚨", *lines, "", f"ID: {shown}{more}"]
+    else:
+        lines = ["Зайців серед відомих учасників не виявлено! 😊", *lines]
+    unknown = total_members - len(admins) - len(members.members - exempt)
+    if unknown > 0:
+        lines.append(f"Ще {unknown} учасників індекс поки не бачив — вони з'являться після будь-якої зміни їх статусу в групі.")
+    return "\n".join(lines), zaycev
+
+
+async def kick_from_group(user_id: int, reason: str):
+    # ban + unban: користувач вилітає з групи, але може повернутися за новим запрошенням
+    await bot.ban_chat_member(chat_id=GROUP_ID, user_id=user_id)
+    await bot.unban_chat_member(chat_id=GROUP_ID, user_id=user_id)
+    kicks.inc(reason)
+
+
+async def kick_zaycev(user_ids: list[int], message: Message):
+    async def kick_one(user_id: int):
+        await kick_from_group(user_id, "zaycev")
+
+    async def progress(done: int, total: int):
+        await message.edit_text(f"Кікаю зайців: {done}/{total}…")
+
+    with priority(PRIORITY_BULK):
+        results = await members.kick(user_ids, kick_one, batch=ZAYCEV_KICK_BATCH, progress=progress)
+    failed = [(uid, error) for uid, _, error in results if error]
+    text = f"Кікнуто {len(results) - len(failed)} з {len(results)} зайців."
+    if failed:
+        text += "\nНе вдалося: " + ", ".join(f"{uid} ({type(error).__name__})" for uid, error in failed[:20])
+    logger.info(f"Кік зайців: {len(results) - len(failed)}/{len(results)}")
+    await message.edit_text(text)
+
+
+USERS_PAGE_SIZE = 20
+TARIFF_BUTTONS_PER_ROW = 3
+LIST_STATUSES = {"*": "Всі", "active": "active", "grace": "grace", "expired": "expired"}
+
+
+def tariff_key(tariff: str) -> str:
+    # Назва тарифу може бути довгою/з пробілами, а callback_data обмежена 64 байтами
+    return hashlib.md5(tariff.encode()).hexdigest()[:8]
+
+
+async def resolve_tariff_key(key: str) -> str | None:
+    if key == "*":
+        return None
+    for tariff in await subs.tariffs():
+        if tariff_key(tariff) == key:
+            return tariff
+    return None
+
+
+async def render_users_page(status: str, tariff: str | None, cursor: tuple[int | None, int] | None,
+                            backwards: bool) -> tuple[str, InlineKeyboardMarkup]:
+    rows, more = await subs.page(None if status == "*" else status, tariff, cursor, backwards, USERS_PAGE_SIZE)
+    tkey = tariff_key(tariff) if tariff else "*"
+    has_prev = more if backwards else cursor is not None
+    has_next = more if not backwards else True
+    if not rows:
+        lines = ["Підписників поки що немає."]
+    else:
+        lines = [f"Список підписників ({LIST_STATUSES.get(status, status)}, {tariff or 'всі тарифи'}):", ""]
+        for uid, uname, tar, edate, stat in rows:
+            edate = datetime.fromtimestamp(edate, timezone.utc).strftime('%Y-%m-%d %H:%M') if edate else '—'
+            lines.append(f"ID: {uid} | @{uname or 'немає'} | {tar} | До: {edate} | {stat}")
+    tariff_buttons = [InlineKeyboardButton(text=("✓ " if tariff is None else "") + "Всі тарифи",
+                                           callback_data=f"admin_lu:{status}:*:-:0:0")]
+    tariff_buttons += [InlineKeyboardButton(text=("✓ " if t == tariff else "") + t,
+                                            callback_data=f"admin_lu:{status}:{tariff_key(t)}:-:0:0")
+                       for t in await subs.tariffs()]
+    keyboard = [
+        [InlineKeyboardButton(text=("✓ " if code == status else "") + label,
+                              callback_data=f"admin_lu:{code}:{tkey}:-:0:0")
+         for code, label in LIST_STATUSES.items()],
+        # Усі тарифи, по TARIFF_BUTTONS_PER_ROW у ряд
+        *(tariff_buttons[i:i + TARIFF_BUTTONS_PER_ROW]
+          for i in range(0, len(tariff_buttons), TARIFF_BUTTONS_PER_ROW)),
+    ]
+    nav = []
+    # Курсор — (end_date, user_id); користувач без дати кодується як "-"
+    if rows and has_prev:
+        first = rows[0]
+        nav.append(InlineKeyboardButton(
+            text="← Попередні",
+            callback_data=f"admin_lu:{status}:{tkey}:p:{'-' if first[3] is None else first[3]}:{first[0]}"))
+    if rows and has_next:
+        last = rows[-1]
+        nav.append(InlineKeyboardButton(
+            text="Наступні →",
+            callback_data=f"admin_lu:{status}:{tkey}:n:{'-' if last[3] is None else last[3]}:{last[0]}"))
+    if nav:
+        keyboard.append(nav)
+    keyboard.append([InlineKeyboardButton(text="Експорт CSV", callback_data=f"admin_lucsv:{status}:{tkey}")])
+    return "\n".join(lines), InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
 @dp.callback_query(F.data.startswith("admin_"))
 async def admin_callback(callback: CallbackQuery):
     if callback.from_user.id != ADMIN_ID:
         await callback.answer("Доступ заборонено!", show_alert=True)
         return
     data = callback.data
-    if data == "admin_listusers":
-        with sqlite3.connect(DB_FILE) as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT user_id, username, tariff, end_date, status FROM users ORDER BY end_date DESC")
-            users = cur.fetchall()
-        if not users:
-            text = "Підписників поки що немає."
-        else:
-            text = "Список підписників:\n\n"
-            for uid, uname, tar, edate, stat in users:
-                text += f"ID: {uid} | @{uname or 'немає'} | {tar} | До: {edate} | {stat}\n"
-        await callback.message.edit_text(text)
+    if data == "admin_listusers" or data.startswith("admin_lu:"):
+        status, tkey, direction, end, uid = (data.split(":")[1:] if ":" in data else ("*", "*", "-", "0", "0"))
+        tariff = await resolve_tariff_key(tkey)
+        cursor = (None if end == "-" else int(end), int(uid)) if direction != "-" else None
+        text, kb = await render_users_page(status, tariff, cursor, backwards=direction == "p")
+        try:
+            await callback.message.edit_text(text, reply_markup=kb)
+        except TelegramBadRequest as e:
+            # Повторне натискання того ж фільтра — текст не змінився
+            if "not modified" not in str(e):
+                raise
+    elif data.startswith("admin_lucsv:"):
+        _, status, tkey = data.split(":")
+        await callback.answer("Готую CSV…")
+        path = os.path.join(tempfile.gettempdir(), f"users_{int(time.time())}.csv")
+        try:
+            count = await subs.export_csv(path, None if status == "*" else status, await resolve_tariff_key(tkey))
+            await callback.message.answer_document(FSInputFile(path, filename="users.csv"),
+                                                   caption=f"Експорт підписників: {count} записів")
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
     elif data == "admin_addsub":
         example = "/addsub 123456789 14days 14"
         await callback.message.edit_text(
             "Формат: /addsub [user_id] [tariff] [days]\n\n"
             f"Приклад (натисни, щоб скопіювати):\n"
-            f"`{example}`",
+            f"`{example}`\n\n"
+            "Для багатьох одразу надішли CSV (`user_id,tariff,days`) з підписом /addsub",
             parse_mode="Markdown"
         )
         await callback.answer()
@@ -245,88 +391,179 @@ async def admin_callback(callback: CallbackQuery):
         await callback.message.edit_text(
             "Формат: /removesub [user_id]\n\n"
             f"Приклад (натисни, щоб скопіювати):\n"
-            f"`{example}`",
+            f"`{example}`\n\n"
+            "Для багатьох одразу надішли CSV зі стовпцем `user_id` з підписом /removesub",
             parse_mode="Markdown"
         )
         await callback.answer()
-    elif data == "admin_stats":
-        with sqlite3.connect(DB_FILE) as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT COUNT(*) FROM users WHERE status = 'active'")
-            active = cur.fetchone()[0]
-            cur.execute("SELECT COUNT(*) FROM users")
-            total = cur.fetchone()[0]
-        text = f"Статистика:\nАктивних підписників: {active}\nВсього записів: {total}"
-        await callback.message.edit_text(text)
+    elif data == "admin_stats" or data.startswith("admin_stats:"):
+        days = int(data.split(":")[1]) if ":" in data else 30
+        text = Analytics.format(await analytics.summary(days))
+        text += f"\n\nКеш підписок: {len(subs.cache)} записів, влучань {subs.cache.hits}, промахів {subs.cache.misses}"
+        kb = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=f"{'• ' if d == days else ''}{d} днів", callback_data=f"admin_stats:{d}")
+             for d in STATS_PERIODS],
+            [InlineKeyboardButton(text="📈 Графік", callback_data=f"admin_statschart:{days}")],
+            [InlineKeyboardButton(text="Закрити меню", callback_data="admin_close")]
+        ])
+        try:
+            await callback.message.edit_text(text, reply_markup=kb)
+        except TelegramBadRequest:
+            pass  # той самий період натиснуто ще раз — текст не змінився
+    elif data.startswith("admin_statschart:"):
+        days = int(data.split(":")[1])
+        await callback.answer("Малюю графік…")
+        chart = await analytics.chart(days)
+        await callback.message.answer_photo(BufferedInputFile(chart, filename=f"stats_{days}d.png"),
+                                            caption=f"Останні {days} днів. {LEGEND}")
     elif data == "admin_checksubs":
-        await check_subscriptions()
+        report = await check_subscriptions()
+        if report is None:
+            await callback.answer("Перевірка вже виконується", show_alert=True)
+            return
         await callback.message.edit_text(
-            "Перевірку закінчення підписок виконано вручну!\nНагадування/кіки відправлено, якщо потрібно.")
+            "Перевірку закінчення підписок виконано вручну!\nНагадування/кіки відправлено, якщо потрібно.\n"
+            f"Оброблено: {report['processed']}, помилок: {report['failed']}, час: {report['duration']:.1f} с")
         await callback.answer("Перевірку виконано!")
     elif data == "admin_checkzaycev":
         try:
-            total_members = await bot.get_chat_member_count(GROUP_ID)
-            admins = await bot.get_chat_administrators(GROUP_ID)
-            total_admins = len(admins) - 1
-            with sqlite3.connect(DB_FILE) as conn:
-                cur = conn.cursor()
-                cur.execute("SELECT COUNT(*) FROM users WHERE status IN ('active', 'grace')")
-                db_active = cur.fetchone()[0]
-            potential_zaycev = total_members - total_admins - db_active
-            if potential_zaycev <= 0:
-                text = f"Зайців не виявлено! 😊\nВ групі {total_members} учасників (з них {total_admins} адмінів).\nВ БД {db_active} активних підписок."
-            else:
-                text = f"Увага! Виявлено {potential_zaycev} можливих зайців! 🚨\nВ групі {total_members} учасників (з них {total_admins} адмінів).\nВ БД {db_active} активних підписок.\nПеревірте учасників групи вручну."
-            await callback.message.edit_text(text)
+            text, zaycev = await find_zaycev()
+            kb = None
+            if zaycev:
+                kb = InlineKeyboardMarkup(inline_keyboard=[
+                    [InlineKeyboardButton(text=f"Кікнути {len(zaycev)} зайців", callback_data="admin_zaycev_kick")],
+                    [InlineKeyboardButton(text="Закрити меню", callback_data="admin_close")]
+                ])
+            await callback.message.edit_text(text, reply_markup=kb)
             await callback.answer("Перевірку завершено!")
         except Exception as e:
             await callback.message.edit_text(f"Помилка перевірки: {str(e)}")
             await callback.answer("Помилка!", show_alert=True)
+    elif data == "admin_zaycev_kick":
+        # Список рахуємо заново: між перевіркою і натисканням хтось міг оплатити
+        _, zaycev = await find_zaycev()
+        if not zaycev:
+            await callback.answer("Зайців уже немає 😊", show_alert=True)
+            return
+        await callback.message.edit_text(f"Кікаю {len(zaycev)} зайців…")
+        await callback.answer()
+        tasks.spawn("zaycev_kick", kick_zaycev, zaycev, callback.message)
     elif data == "admin_clean_expired":
-        with sqlite3.connect(DB_FILE) as conn:
-            cur = conn.cursor()
-            cur.execute("DELETE FROM users WHERE status = 'expired'")
-            deleted_count = cur.rowcount
-            conn.commit()
+        deleted_count = await subs.delete_expired()
 
         await callback.message.edit_text(
             f"Очищено {deleted_count} записів зі статусом 'expired'.\nБаза чиста! 🧹")
         await callback.answer("База почищена!")
     elif data == "admin_backupdb":
         try:
-            await callback.message.answer_document(FSInputFile(DB_FILE),
-                                                   caption=f"Ручний бекап бази даних {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M UTC')}")
+            result = await backups.create(full=True)
+            await callback.message.answer_document(FSInputFile(result.path),
+                                                   caption=f"Ручний бекап бази даних\n{result.caption}")
             await callback.message.edit_text("Бекап бази надіслано тобі як документ!")
         except Exception as e:
             await callback.message.edit_text(f"Помилка бекапу: {str(e)}")
         await callback.answer("Бекап надіслано!")
     elif data == "admin_sendinvites":
-        with sqlite3.connect(DB_FILE) as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT user_id FROM users WHERE status IN ('active', 'grace')")
-            users = [row[0] for row in cur.fetchall()]
-        sent = 0
-        errors = 0
-        for uid in users:
-            try:
-                expire_date = datetime.now(timezone.utc) + timedelta(hours=24)
-                invite = await bot.create_chat_invite_link(GROUP_ID, creates_join_request=True,
-                                                           name=f"Відновлення доступу для {uid}",
-                                                           expire_date=expire_date)
-                link = invite.invite_link
-                await bot.send_message(uid,
-                                       f"Доступ відновлено! 🎉\nПриєднуйся назад до групи:\n{link}\nПосилання діє 24 години. Бот схвалить запит автоматично 💪")
-                sent += 1
-            except Exception as e:
-                logger.error(f"Помилка розсилки запрошення {uid}: {e}")
-                errors += 1
-        await callback.message.edit_text(
-            f"Розсилку завершено. Надіслано {sent} запрошень з {len(users)}. Помилок: {errors}")
-        await callback.answer("Розсилка запрошень завершено")
+        if invite_jobs.running:
+            await callback.answer("Розсилка вже йде, дочекайся завершення", show_alert=True)
+            return
+        users = await subs.current_user_ids()
+        await callback.message.edit_text(f"Розсилку запрошень запущено: 0/{len(users)}")
+        await invite_jobs.start(callback.message.chat.id, callback.message.message_id, users)
+        await callback.answer("Розсилку запущено у фоні")
     elif data == "admin_close":
         await callback.message.delete()
     await callback.answer()
 
+
+# Реєструється раніше за cmd_addsub/cmd_removesub (Command дивиться і в підпис) і handle_proof
+@dp.message(F.document, F.caption.regexp(r"^/(addsub|removesub)(@\w+)?(\s|$)"), F.chat.type == "private")
+async def cmd_bulk(message: Message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    mode = message.caption.split()[0][1:].split("@")[0]
+    if message.document.file_size and message.document.file_size > BULK_MAX_BYTES:
+        await message.answer("Файл завеликий (максимум 20 МБ).")
+        return
+    # Превʼю читає поточні підписки — поки йде apply, вони змінюються, тож слот тримаємо й тут
+    if not bulk.reserve():
+        await message.answer("Інша масова операція ще йде, надішли файл пізніше.")
+        return
+    try:
+        rows = list(parse_rows(await bot.download(message.document), mode))
+        if not rows:
+            await message.answer("У файлі немає жодного рядка.")
+            return
+        await bulk.preview(mode, rows)
+    except (UnicodeDecodeError, csv.Error, ValueError) as e:
+        logger.warning(f"Не вдалося розібрати файл для /{mode}: {e}")
+        await message.answer(f"Не вдалося прочитати файл: {e}\nПотрібен CSV у UTF-8.")
+        return
+    finally:
+        bulk.release()
+    valid = sum(1 for row in rows if not row["error"])
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"✅ Застосувати ({valid})", callback_data="bulk:apply")],
+        [InlineKeyboardButton(text="Скасувати", callback_data="bulk:cancel")],
+    ])
+    preview = await message.answer_document(
+        BufferedInputFile(bulk_report(rows), filename=f"{mode}_preview.csv"),
+        caption=f"Попередній перегляд (ще нічого не змінено)\n\n{bulk_summary(mode, rows)}",
+        reply_markup=kb if valid else None)
+    bulk.hold(preview.message_id, mode, rows)
+
+
+async def run_bulk(mode: str, rows: list[dict], message: Message):
+    async def kick_one(user_id: int):
+        await kick_from_group(user_id, "removesub")
+
+    async def progress(done: int, total: int):
+        await message.edit_text(f"Обробляю: {done}/{total}…")
+
+    try:
+        await bulk.apply(mode, rows, kick_one=kick_one, progress=progress)
+    except Exception as e:
+        logger.error(f"Помилка масового {mode}: {e}")
+        await message.edit_text(f"Помилка: {e}")
+        return
+    column = "invite" if mode == ADD else "kick"
+    failed = sum(1 for row in rows if str(row.get(column, "")).startswith("failed"))
+    await message.edit_text(f"Готово: {sum(1 for row in rows if not row['error'])} рядків застосовано, "
+                            f"{'запрошень' if mode == ADD else 'кіків'} не вдалося: {failed}.")
+    await message.answer_document(BufferedInputFile(bulk_report(rows), filename=f"{mode}_result.csv"),
+                                  caption="Результат по кожному рядку")
+
+
+@dp.callback_query(F.data.startswith("bulk:"))
+async def bulk_callback(callback: CallbackQuery):
+    if callback.from_user.id != ADMIN_ID:
+        await callback.answer()
+        return
+    if callback.data == "bulk:cancel":
+        bulk.held.pop(callback.message.message_id, None)
+        await callback.message.edit_reply_markup(reply_markup=None)
+        await callback.answer("Скасовано")
+        return
+    if callback.message.message_id not in bulk.held:
+        await callback.message.edit_reply_markup(reply_markup=None)
+        await callback.answer("Превʼю застаріло — надішли файл ще раз", show_alert=True)
+        return
+    # Кнопка лишається, поки йде інша операція: превʼю можна застосувати пізніше
+    if not bulk.reserve():
+        await callback.answer("Інша масова операція ще йде, спробуй пізніше", show_alert=True)
+        return
+    held = bulk.held.pop(callback.message.message_id)
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+        await callback.answer("Застосовую…")
+        status = await callback.message.answer("Записую в БД…")
+        tasks.spawn("bulk", run_bulk, *held, status)
+    except Exception:
+        bulk.release()
+        bulk.hold(callback.message.message_id, *held)
+        raise
+
+
 @dp.message(Command("addsub"))
 async def cmd_addsub(message: Message):
     if message.from_user.id != ADMIN_ID:
@@ -338,7 +575,8 @@ async def cmd_addsub(message: Message):
         await message.answer(
             "Формат: /addsub [user_id] [tariff] [days]\n\n"
             f"Приклад (натисни, щоб скопіювати):\n"
-            f"`{example}`",
+            f"`{example}`\n\n"
+            "Для багатьох одразу надішли CSV (`user_id,tariff,days`) з підписом /addsub",
             parse_mode="Markdown"
         )
         return
@@ -351,25 +589,12 @@ async def cmd_addsub(message: Message):
         await message.answer("Неправильний формат.")
         return
 
-    username = (await bot.get_chat(user_id)).username or f"id{user_id}"
-    save_subscription(user_id, username, tariff, days)
+    username = await profiles.username(user_id, bot)
+    await subs.save(user_id, username, tariff, days)
     # Автоматичне надсилання запрошення
     try:
-        expire_date = datetime.now(timezone.utc) + timedelta(hours=24)
-        invite = await bot.create_chat_invite_link(
-            GROUP_ID,
-            creates_join_request=True,
-            name=f"Доступ для {user_id} після addsub",
-            expire_date=expire_date
-        )
-        link = invite.invite_link
-        await bot.send_message(
-            user_id,
-            f"Підписка активована вручну адміном! 🎉\n"
-            f"Приєднуйся до групи (посилання діє 24 години):\n"
-            f"{link}\n"
-            "Бот автоматично схвалить запит 💪"
-        )
+        link = await invites.take(user_id)
+        await bot.send_message(user_id, ADDSUB_INVITE_TEXT.format(link=link))
         await message.answer(
             f"Підписка додана/продовжена для {user_id} ({tariff}, {days} днів)\n"
             f"Запрошення надіслано користувачу: `{link}`"
@@ -389,7 +614,8 @@ async def cmd_removesub(message: Message):
         await message.answer(
             "Формат: /removesub [user_id]\n\n"
             f"Приклад (натисни, щоб скопіювати):\n"
-            f"`{example}`",
+            f"`{example}`\n\n"
+            "Для багатьох одразу надішли CSV зі стовпцем `user_id` з підписом /removesub",
             parse_mode="Markdown"
         )
         return
@@ -400,14 +626,11 @@ async def cmd_removesub(message: Message):
         await message.answer("user_id має бути числом.")
         return
 
-    with sqlite3.connect(DB_FILE) as conn:
-        cur = conn.cursor()
-        cur.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
-        conn.commit()
+    await subs.delete(user_id)
 
     try:
-        await bot.ban_chat_member(chat_id=GROUP_ID, user_id=user_id)
-        await bot.unban_chat_member(chat_id=GROUP_ID, user_id=user_id)
+        await kick_from_group(user_id, "removesub")
+        await members.left(user_id)
         logger.info(f"Користувач {user_id} видалений з групи після removesub")
         await message.answer(f"Підписка для {user_id} видалена з БД і користувач видалений з групи.")
     except Exception as e:
@@ -418,65 +641,113 @@ async def cmd_removesub(message: Message):
 async def cmd_checksubs(message: Message):
     if message.from_user.id != ADMIN_ID:
         return
-    await check_subscriptions()
-    await message.answer("Перевірку закінчення підписок виконано вручну!")
-
-
-def get_payment_kb(user_id: int, tariff: str) -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Я оплатив", callback_data=f"paid_{user_id}_{tariff}")],
-        [InlineKeyboardButton(text="← Назад до меню", callback_data="back")]
-    ])
+    report = await check_subscriptions()
+    if report is None:
+        await message.answer("Перевірка вже виконується — дочекайтесь її завершення.")
+        return
+    await message.answer("Перевірку закінчення підписок виконано вручну!\n"
+                         f"Оброблено: {report['processed']}, помилок: {report['failed']}, "
+                         f"час: {report['duration']:.1f} с")
 
 
 @dp.message(F.photo | F.document | F.video, F.chat.type == "private")
 async def handle_proof(message: Message):
     user_id = message.from_user.id
-    logger.info(f"Отримано медіа від {user_id} (тип: {message.content_type})")
-    if user_id in waiting_for_proof:
-        data = waiting_for_proof[user_id]
-        username = data["username"]
-        tariff_name = data["tariff"]
-        period = data["period"]
+    logger.info("Отримано медіа від %s (тип: %s)", user_id, message.content_type)
+    # Забираємо очікування одразу: скрін стає в чергу, пересилання адміну — фоном
+    data = await waiting_for_proof.pop(user_id)
+    if data:
+        await proofs.submit(user_id, data["username"], data["tariff"], data["period"],
+                            message.chat.id, message.message_id, message.content_type)
         await message.answer("Скрін/чек успішно надіслано адміністратору! ❤️\nЗачекайте на підтвердження.")
-        forwarded = await bot.forward_message(ADMIN_ID, message.chat.id, message.message_id)
-        approve_button = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="Апрув цього платежу", callback_data=f"approve_{user_id}_{period}")]
-        ])
-        await bot.send_message(ADMIN_ID,
-                               f"Ось скрін/чек від @{username} (ID: {user_id})\nТариф: {tariff_name}\nПеревірте, будь ласка!",
-                               reply_markup=approve_button, reply_to_message_id=forwarded.message_id)
-        del waiting_for_proof[user_id]
     else:
         await message.answer("Якщо це оплата — спочатку натисніть «Я оплатив» після вибору тарифу 🙏")
 
 
 async def approve_user(user_id: int, period: str,
-                       message_or_callback):  # Нова функція для консолідації апрув-логіки (видалено дублювання з cmd_approve і callback)
-    tariff_name = "14 днів" if period == "14days" else "1 місяць"
-    days = 14 if period == "14days" else 30
+                       message_or_callback) -> bool:  # Нова функція для консолідації апрув-логіки (видалено дублювання з cmd_approve і callback)
+    # Невідомий ключ (тариф прибрали з конфігурації) — як раніше, падаємо на перший тариф
+    tariff = tariffs.get(period) or tariffs.default
+    tariff_name = tariff.name
     try:
-        expire_date = datetime.now(timezone.utc) + timedelta(hours=24)
-        invite = await bot.create_chat_invite_link(GROUP_ID, creates_join_request=True, name=f"Доступ для {user_id}",
-                                                   expire_date=expire_date)
-        link = invite.invite_link
-        username = (await bot.get_chat(user_id)).username or f"id{user_id}"
-        save_subscription(user_id, username, tariff_name, days)
+        link = await invites.take(user_id)
+        username = await profiles.username(user_id, bot)
+        await subs.save(user_id, username, tariff_name, tariff.days, tariff.amount)
         await bot.send_message(user_id,
                                f"Вітаємо в нашій дружній спільноті! 🎉\nДоступ активовано!\n\nНатисни посилання (діє 24 години):\n{link}\n\nПісля натискання бот автоматично схвалить твій запит 💪")
-        logger.info(f"Апрув + збереження підписки для {user_id} ({tariff_name})")
+        approvals.inc()
+        logger.info("Апрув + збереження підписки для %s (%s)", user_id, tariff_name)
         if isinstance(message_or_callback, Message):
             await message_or_callback.answer(f"Посилання створено (24 год):\n{link}\nПідписка збережена в БД.")
         else:  # CallbackQuery
             await message_or_callback.message.edit_text(
                 f"Апрув виконано для {user_id} ({tariff_name})!\nПосилання створено (24 год):\n{link}\nПідписка збережена.")
             await message_or_callback.answer("Апрув успішний!")
+        return True
     except Exception as e:
         logger.error(f"Помилка в апруві: {e}")
         if isinstance(message_or_callback, Message):
             await message_or_callback.answer(f"Помилка: {str(e)}")
         else:
             await message_or_callback.answer(f"Помилка: {str(e)}", show_alert=True)
+        return False
+
+
+async def approve_proof(proof: dict, message: Message):
+    ok = await approve_user(proof["user_id"], proof["period"], message)
+    await proofs.finish(proof["proof_id"], 'approved' if ok else 'failed')
+
+
+async def reject_proof(proof: dict):
+    # Повертаємо очікування, щоб користувач міг одразу надіслати правильний скрін
+    await waiting_for_proof.put(proof["user_id"], proof["username"], proof["tariff"], proof["period"])
+    await bot.send_message(proof["user_id"],
+                           "На жаль, адміністратор не зміг підтвердити оплату за цим скріном 😔\n"
+                           "Перевір суму й реквізити та надішли інший скрін або чек сюди.")
+    logger.info(f"Скрін #{proof['proof_id']} від {proof['user_id']} відхилено")
+
+
+@dp.message(Command("proofs"))
+async def cmd_proofs(message: Message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    await proofs.show(await proofs.neighbour())
+
+
+@dp.callback_query(F.data.startswith("proof:"))
+async def proof_callback(callback: CallbackQuery):
+    if callback.from_user.id != ADMIN_ID:
+        await callback.answer("Доступ заборонено!", show_alert=True)
+        return
+    _, action, proof_id = callback.data.split(":")
+    proof_id = int(proof_id)
+    proof = await proofs.get(proof_id)
+    if action == "v":
+        target = proof if proof and proof["status"] in ('new', 'pending', 'failed') else await proofs.neighbour()
+        await callback.answer()
+    elif action in ("n", "p"):
+        target = await proofs.neighbour(proof_id, backwards=action == "p")
+        await callback.answer()
+    elif action in ("a", "r"):
+        if proof is None or not await proofs.claim(proof_id, 'approving' if action == "a" else 'rejected'):
+            await callback.answer("Цей скрін уже оброблено", show_alert=True)
+            return
+        if action == "a":
+            await callback.answer("Апрув прийнято, обробляю…")
+            tasks.spawn(proof["user_id"], approve_proof, proof, callback.message)
+        else:
+            await callback.answer("Скрін відхилено")
+            tasks.spawn(proof["user_id"], reject_proof, proof)
+        target = await proofs.neighbour(proof_id)
+    else:
+        await callback.answer()
+        return
+    # Картка завжди відповідає на своє медіа, тож не редагуємо, а перевідправляємо
+    try:
+        await callback.message.delete()
+    except TelegramBadRequest:
+        pass
+    await proofs.show(target)
 
 
 @dp.message(Command("approve"))
@@ -493,10 +764,10 @@ async def cmd_approve(message: Message):
     except ValueError:
         await message.answer("user_id має бути числом.")
         return
-    period = "14days"  # Дефолт, якщо не з waiting_for_proof (спрощено, бо ручний апрув не залежить від стану)
-    if user_id in waiting_for_proof:
-        period = waiting_for_proof[user_id]["period"]
-        del waiting_for_proof[user_id]
+    period = tariffs.default.key  # Дефолт, якщо не з waiting_for_proof (спрощено, бо ручний апрув не залежить від стану)
+    data = await waiting_for_proof.pop(user_id)
+    if data:
+        period = data["period"]
     await approve_user(user_id, period, message)
 
 
@@ -505,8 +776,9 @@ async def cmd_backupdb(message: Message):
     if message.from_user.id != ADMIN_ID:
         return
     try:
-        await message.answer_document(FSInputFile(DB_FILE),
-                                      caption=f"Ручний бекап бази даних {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M UTC')}")
+        result = await backups.create(full=True)
+        await message.answer_document(FSInputFile(result.path),
+                                      caption=f"Ручний бекап бази даних\n{result.caption}")
         logger.info(f"Ручний бекап бази надіслано адміну {ADMIN_ID}")
     except Exception as e:
         await message.answer(f"Помилка надсилання бази: {str(e)}")
@@ -518,17 +790,30 @@ async def auto_approve_join(request: ChatJoinRequest):
     if request.chat.id != GROUP_ID:
         return
     user_id = request.from_user.id
-    data = get_user_status(user_id)
+    data = await subs.get_status(user_id)
     if data and data['status'] in ['active', 'grace']:
         await bot.approve_chat_join_request(request.chat.id, user_id)
-        logger.info(f"Автосхвалено вступ {user_id} (має підписку)")
+        # Лише після схвалення: відхилена заявка за пересланим посиланням не спалює його власнику
+        await invites.used(request.invite_link.invite_link if request.invite_link else None, user_id)
+        join_requests.inc("approved")
+        await members.joined(user_id, "join_request")
+        logger.info("Автосхвалено вступ %s (має підписку)", user_id, extra={"sample": "join_request"})
         await bot.send_message(user_id,
                                "Вітаємо в групі! 🎉\nТепер ти в нашій дружній спільноті з тренуваннями Ірини 💪")
     else:
         await bot.decline_chat_join_request(request.chat.id, user_id)
-        logger.warning(f"Відхилено вступ {user_id} — немає активної підписки")
-        await bot.send_message(ADMIN_ID,
-                               f"Хтось ({user_id} / @{request.from_user.username or 'без імені'}) спробував вступити без підписки!")
+        join_requests.inc("declined")
+        logger.warning("Відхилено вступ %s — немає активної підписки", user_id)
+        admin_notes.notify(f"Хтось ({user_id} / @{request.from_user.username or 'без імені'}) спробував вступити без підписки!")
+
+
+@dp.chat_member(F.chat.id == GROUP_ID)
+async def track_member(update: ChatMemberUpdated):
+    member = update.new_chat_member
+    if member.status in ("member", "administrator", "creator") or getattr(member, "is_member", False):
+        await members.joined(member.user.id, "chat_member")
+    else:
+        await members.left(member.user.id)
 
 
 @dp.message(F.chat.type == "private")
@@ -543,10 +828,8 @@ async def welcome(message: Message):
 
 @dp.callback_query(F.data == "choose_tariff")
 async def show_tariffs(callback: CallbackQuery):
-    logger.info("Натиснуто 'Обрати тариф'")
-    await callback.message.edit_text(
-        "Обери тариф для доступу до тренувань Ірини 💪\n\n• 14 днів — 500 грн\n• 1 місяць — 800 грн",
-        reply_markup=tariffs_menu)
+    logger.info("Натиснуто 'Обрати тариф'", extra={"sample": "choose_tariff"})
+    await callback.message.edit_text(tariffs.menu_text, reply_markup=tariffs.menu_kb)
     await callback.answer("Тарифи відкрито!")
 
 
@@ -561,11 +844,11 @@ async def back_to_main(callback: CallbackQuery):
 @dp.callback_query(F.data == "my_status")
 async def my_status(callback: CallbackQuery):
     user_id = callback.from_user.id
-    data = get_user_status(user_id)
+    data = await subs.get_status(user_id)
     if not data or data["status"] not in ["active", "grace"]:
         text = "Твій статус підписки поки що не активовано.\nОбери тариф, щоб отримати доступ! 💪"
     else:
-        end_date = datetime.fromisoformat(data["end_date"])
+        end_date = datetime.fromtimestamp(data["end_date"], timezone.utc)
         days_left = (end_date - datetime.now(timezone.utc)).days
         text = f"Твоя підписка в статусі: **{data['status']}**\nАктивна до: **{end_date.strftime('%d.%m.%Y')}**\nЗалишилось приблизно {max(0, days_left)} днів\n\nПродовжуй рухатись до мети! 🚀"
     await callback.message.edit_text(text, reply_markup=main_menu, parse_mode="Markdown")
@@ -574,13 +857,12 @@ async def my_status(callback: CallbackQuery):
 
 @dp.callback_query(F.data.startswith("tariff_"))
 async def tariff_chosen(callback: CallbackQuery):
-    period = callback.data.split("_")[1]
-    tariff_name = "14 днів" if period == "14days" else "1 місяць"
-    price = "500 грн" if period == "14days" else "800 грн"
-    user_id = callback.from_user.id
-    payment_code = f"За тренування" # {user_id} це для перевірки апі монобанкока
-    text = f"Ти обрав(ла) тариф: **{tariff_name} — {price}** ✅\n\nПерекажіть **{price}** на рахунок (просто натисни на те, що треба скопіювати):\n\nОтримувач: `{PAYMENT_RECIPIENT}`\nIBAN: `{PAYMENT_IBAN}`\nІПН/ЄДРПОУ отримувача: `{IPN}`\nБанк: {PAYMENT_BANK}\n\n**Призначення платежу (обов’язково!):** `{payment_code}`\n\nПісля оплати натисни кнопку нижче і надішли скрін або чек оплати."
-    await callback.message.edit_text(text, reply_markup=get_payment_kb(user_id, period), parse_mode="Markdown")
+    tariff = tariffs.get(callback.data.removeprefix("tariff_"))
+    if tariff is None:
+        await callback.message.edit_text(tariffs.menu_text, reply_markup=tariffs.menu_kb)
+        await callback.answer("Цей тариф більше недоступний", show_alert=True)
+        return
+    await callback.message.edit_text(tariff.payment_text, reply_markup=tariff.payment_kb, parse_mode="Markdown")
     await callback.answer()
 
 
@@ -592,67 +874,140 @@ async def admin_approve_callback(callback: CallbackQuery):
     _, user_id_str, period = callback.data.split("_")
     user_id = int(user_id_str)
     await callback.answer("Апрув прийнято, обробляю…")
-    asyncio.create_task(approve_user(user_id, period, callback))
+    tasks.spawn(user_id, approve_user, user_id, period, callback)
 
 
 @dp.callback_query(F.data.startswith("paid_"))
 async def user_paid(callback: CallbackQuery):
-    _, user_id_str, period = callback.data.split("_")
-    user_id = int(user_id_str)
+    # paid_<tariff>; у старих повідомленнях ще лишились кнопки paid_<user_id>_<tariff>
+    tariff = tariffs.get(callback.data.rsplit("_", 1)[1]) or tariffs.default
+    period = tariff.key
+    tariff_name = tariff.name
+    user_id = callback.from_user.id
     username = callback.from_user.username or "без @username"
-    tariff_name = "14 днів" if period == "14days" else "1 місяць"
-    logger.info(f"Користувач {user_id} (@{username}) натиснув 'Я оплатив'")
+    logger.info("Користувач %s (@%s) натиснув 'Я оплатив'", user_id, username)
     await callback.message.edit_text(
         "Дякуємо! Тепер надішліть скрін або чек оплати прямо сюди.\nАдміністратор перевірить і активує доступ!",
         reply_markup=main_menu)
     await callback.answer("Дякуємо!")
-    waiting_for_proof[user_id] = {"tariff": tariff_name, "username": username, "period": period}
-    await bot.send_message(ADMIN_ID,
-                           f"Новий запит на перевірку!\nКористувач: @{username} (ID: {user_id})\nТариф: {tariff_name}\nЧекаємо скрін/чек...")
+    await waiting_for_proof.put(user_id, username, tariff_name, period)
+    admin_notes.notify(f"Новий запит на перевірку!\nКористувач: @{username} (ID: {user_id})\nТариф: {tariff_name}\nЧекаємо скрін/чек...")
+
+
+# webhook — бойовий режим на Render; polling — локально і як запасний, коли вебхук-хост лежить.
+# За замовчуванням polling, якщо BASE_WEBHOOK_URL не задано.
+# chat_member Telegram не шле без явного запиту — в обох режимах беремо всі типи, на які є хендлери
+UPDATE_MODE = os.getenv("UPDATE_MODE") or ("webhook" if BASE_WEBHOOK_URL else "polling")
+if UPDATE_MODE == "webhook":
+    ingress = WebhookIngress(dp, bot, tasks, db, f"{(BASE_WEBHOOK_URL or '').rstrip('/')}{WEBHOOK_PATH}",
+                             WEBHOOK_PATH, WEBHOOK_SECRET, dp.resolve_used_update_types())
+else:
+    ingress = PollingIngress(dp, bot, tasks, dp.resolve_used_update_types(),
+                             limit=int(os.getenv("POLLING_LIMIT", 100)),
+                             timeout=int(os.getenv("POLLING_TIMEOUT", 25)))
 
 
 async def on_startup(bot: Bot):  # Об'єднано дублювання: webhook + scheduler
-    if not BASE_WEBHOOK_URL:
-        logger.error("BASE_WEBHOOK_URL не встановлено в змінних середовища!")
+    if ingress.mode == "webhook" and not BASE_WEBHOOK_URL:
+        logger.error("UPDATE_MODE=webhook, але BASE_WEBHOOK_URL не встановлено в змінних середовища!")
         raise SystemExit(1)  # Замість sys.exit для asyncio
-    webhook_url = f"{BASE_WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}"
-    await bot.set_webhook(url=webhook_url, secret_token=WEBHOOK_SECRET, drop_pending_updates=True)
-    logger.info(f"Webhook встановлено на {webhook_url}")
+    await dedup.load()
+    startup.mark("dedup")
+    if ingress.mode == "webhook":
+        await ingress.start()
+        startup.mark("webhook")
     scheduler = AsyncIOScheduler()
-    scheduler.add_job(check_subscriptions, CronTrigger(hour=8, minute=0), id='daily_subscription_check')
-    scheduler.add_job(daily_backup, CronTrigger(hour=20, minute=0), id='daily_backup')
+    # Кластерні задачі стартують на паузі й вмикаються лише на лідері
+    scheduler.add_job(check_subscriptions, CronTrigger(hour=8, minute=0), id='daily_subscription_check',
+                      next_run_time=None)
+    scheduler.add_job(daily_backup, CronTrigger(hour=20, minute=0), id='daily_backup', next_run_time=None)
+    scheduler.add_job(waiting_for_proof.sweep, IntervalTrigger(minutes=30), id='pending_sweep', next_run_time=None)
+    # Розсилки, чий власник помер, підхоплюємо, щойно спливе його лізинг, а не лише при виборах
+    scheduler.add_job(invite_jobs.resume, IntervalTrigger(seconds=cluster.lease), id='invite_jobs_resume',
+                      next_run_time=None)
+    # Апруви, що зависли на впалому процесі, — не лише при старті, бо рестарт буває швидшим за таймаут
+    scheduler.add_job(proofs.recover, IntervalTrigger(minutes=5), id='proofs_recover', next_run_time=None)
+    leader_jobs = ('daily_subscription_check', 'daily_backup', 'pending_sweep', 'invite_jobs_resume',
+                   'proofs_recover')
+    # Свої апдейти dedup зберігає сам за пачкою; інтервал — щоб підтягувати вікно інших інстансів
+    scheduler.add_job(dedup.save, IntervalTrigger(seconds=10), id='dedup_save')
+    scheduler.add_job(profiles.flush, IntervalTrigger(seconds=30), id='profiles_flush')
     scheduler.start()
-    logger.info("Планувальник запущено (перевірка щодня о 11:00 + бекап о 23:00)")
+    startup.mark("scheduler")
+
+    async def on_elected():
+        for job_id in leader_jobs:
+            scheduler.resume_job(job_id)
+        await expiry.start()
+        await invites.start()
+        await invite_jobs.resume()
+
+    async def on_demoted():
+        for job_id in leader_jobs:
+            scheduler.pause_job(job_id)
+        await expiry.stop()
+        await invites.stop()
+
+    await cluster.start(on_elected, on_demoted)
+    startup.mark("cluster")
+    await waiting_for_proof.load()
+    await members.load()
+    await proofs.resume()
+    startup.mark("state")
+    if ingress.mode == "polling":
+        # Апдейти одразу йдуть у хендлери, тож polling — останнім, коли стан уже завантажено
+        await ingress.start()
+        startup.mark("polling")
+    logger.info(f"Планувальник запущено (перевірка щодня о 11:00 + бекап о 23:00), "
+                f"інстанс {cluster.instance_id}, лідер: {cluster.is_leader}")
+    logger.info(f"Старт за {startup.summary()}")
 
 
 async def on_shutdown(bot: Bot):
     logger.warning("Shutdown detected, webhook not removed (Render safe)")
-
-
-def main():
-    print("Бот запускається...")
-    print(f"ADMIN_ID: {ADMIN_ID}")
-    print(f"GROUP_ID: {GROUP_ID}")
-    port = int(os.getenv("PORT", 8080))
-    print(f"Запуск сервера на порту: {port}")
-    print(f"BASE_WEBHOOK_URL: {BASE_WEBHOOK_URL}")
-    print(f"WEBHOOK_SECRET: {WEBHOOK_SECRET[:5]}... (скрито)")
+    await ingress.stop()
+    await admin_notes.close()
+    await outbox.close()
+    await dedup.close()
+    await profiles.flush()
+    await cluster.stop()
+    # У polling сесію бота ніхто інший не закриває; у webhook її закриває хендлер, але дайджест
+    # адміну вище міг відкрити нову. close() ідемпотентний
+    await bot.session.close()
+    db.close()
+
+
+def build_app() -> web.Application:
     init_db()
-    print("База даних ініціалізована")
+    startup.mark("db")
+    logger.info("База даних ініціалізована")
     app = web.Application()
 
     async def healthcheck(request):
         return web.Response(text="ok")
 
     app.router.add_get("/", healthcheck)
+    app.router.add_get("/metrics", metrics_handler)
 
-    webhook_handler = SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET,
-                                           handle_in_background=True)
-    webhook_handler.register(app, path=WEBHOOK_PATH)
+    ingress.setup(app)
     setup_application(app, dp, bot=bot)
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
-    web.run_app(app, host="0.0.0.0", port=port)
+    return app
+
+
+def main():
+    startup.mark("import")
+    print("Бот запускається...")
+    print(f"ADMIN_ID: {ADMIN_ID}")
+    print(f"GROUP_ID: {GROUP_ID}")
+    port = int(os.getenv("PORT", 8080))
+    print(f"Запуск сервера на порту: {port}")
+    print(f"Режим апдейтів: {UPDATE_MODE}")
+    if UPDATE_MODE == "webhook":
+        print(f"BASE_WEBHOOK_URL: {BASE_WEBHOOK_URL}")
+        print(f"WEBHOOK_SECRET: {(WEBHOOK_SECRET or '')[:5]}... (скрито)")
+    web.run_app(build_app(), host="0.0.0.0", port=port)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,201 @@
+import csv
+import io
+import itertools
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, BinaryIO, Callable, Iterator
+
+from aiogram import Bot
+
+from fanout import fan_out
+from invite_pool import InvitePool
+from membership import MembershipIndex
+from sender import PRIORITY_BULK, priority
+from subscriptions import DAY, SubscriptionStore
+
+logger = logging.getLogger(__name__)
+
+ADD = "addsub"
+REMOVE = "removesub"
+MAX_DAYS = 3650
+ADDSUB_INVITE_TEXT = ("Підписка активована вручну адміном! 🎉\n"
+                      "Приєднуйся до групи (посилання діє 24 години):\n{link}\n"
+                      "Бот автоматично схвалить запит 💪")
+REPORT_FIELDS = ["line", "user_id", "tariff", "days", "action", "end_date", "invite", "kick", "error"]
+_CHUNK = 500  # Менше за ліміт змінних SQLite в одному IN (...)
+
+
+def parse_rows(stream: BinaryIO, mode: str) -> Iterator[dict]:
+    # Рядки читаються по одному через csv.reader: addsub — user_id,tariff,days[,username],
+    # removesub — user_id. Роздільник «,» або «;» (Excel з українською локаллю), заголовок необов'язковий
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    first = text.readline()
+    delimiter = ";" if first.count(";") > first.count(",") else ","
+    for line, cells in enumerate(csv.reader(itertools.chain([first], text), delimiter=delimiter), start=1):
+        cells = [cell.strip() for cell in cells]
+        if not any(cells) or cells[0].startswith("#"):
+            continue
+        if line == 1 and not cells[0].lstrip("-").isdigit():
+            continue  # заголовок
+        row = {"line": line, "user_id": cells[0], "error": ""}
+        try:
+            row["user_id"] = int(cells[0])
+            if row["user_id"] <= 0:
+                raise ValueError
+        except ValueError:
+            row["error"] = "user_id має бути додатним числом"
+            yield row
+            continue
+        if mode == ADD:
+            if len(cells) < 3 or not cells[1]:
+                row["error"] = "потрібно user_id,tariff,days"
+            else:
+                row["tariff"] = cells[1]
+                row["username"] = cells[3].lstrip("@") if len(cells) > 3 and cells[3] else f"id{row['user_id']}"
+                try:
+                    row["days"] = int(cells[2])
+                    if not 0 < row["days"] <= MAX_DAYS:
+                        raise ValueError
+                except ValueError:
+                    row["error"] = f"days має бути числом від 1 до {MAX_DAYS}"
+        yield row
+
+
+def report(rows: list[dict]) -> bytes:
+    out = io.StringIO()
+    writer = csv.DictWriter(out, REPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for row in rows:
+        end = row.get("end_date")
+        writer.writerow({**row, "end_date": datetime.fromtimestamp(end, timezone.utc).strftime('%Y-%m-%d %H:%M')
+                         if end else ""})
+    return out.getvalue().encode("utf-8")
+
+
+def summary(mode: str, rows: list[dict]) -> str:
+    errors = sum(1 for row in rows if row["error"])
+    counts: dict[str, int] = {}
+    for row in rows:
+        if not row["error"]:
+            counts[row["action"]] = counts.get(row["action"], 0) + 1
+    labels = {"new": "нових", "extend": "продовжень активних", "renew": "відновлень",
+              "remove": "видалень", "missing": "без підписки в БД (лише кік)"}
+    lines = [f"{'Додавання' if mode == ADD else 'Видалення'} підписок: {len(rows)} рядків"]
+    lines += [f"• {labels.get(action, action)}: {count}" for action, count in counts.items()]
+    if errors:
+        first = next(row for row in rows if row["error"])
+        lines.append(f"• з помилками (буде пропущено): {errors}, перша — рядок {first['line']}: {first['error']}")
+    return "\n".join(lines)
+
+
+class BulkOps:
+    """Масові /addsub і /removesub з CSV.
+
+    Спершу preview — розбір файлу і прогноз без жодних змін (dry-run), адміну йде звіт
+    по рядках. Після підтвердження apply пише всі рядки в БД однією транзакцією, а вже
+    потім розсилає запрошення (fan_out під PRIORITY_BULK, темп тримає черга відправки)
+    або кікає пачками через MembershipIndex.kick.
+    """
+
+    def __init__(self, subs: SubscriptionStore, invites: InvitePool, members: MembershipIndex, bot: Bot,
+                 concurrency: int = 10, kick_batch: int = 20, keep: int = 5):
+        self.subs = subs
+        self.invites = invites
+        self.members = members
+        self.bot = bot
+        self.concurrency = concurrency
+        self.kick_batch = kick_batch
+        self.keep = keep
+        # Розібрані файли, що чекають підтвердження: id повідомлення з превʼю → (режим, рядки)
+        self.held: dict[int, tuple[str, list[dict]]] = {}
+        self.running = False
+
+    def reserve(self) -> bool:
+        # Синхронно, до першого await: два підтвердження поспіль не запустять apply двічі.
+        # Знімає резерв finally в apply (або release, якщо до apply не дійшло)
+        if self.running:
+            return False
+        self.running = True
+        return True
+
+    def release(self) -> None:
+        self.running = False
+
+    def hold(self, preview_id: int, mode: str, rows: list[dict]) -> None:
+        self.held[preview_id] = (mode, rows)
+        while len(self.held) > self.keep:
+            self.held.pop(next(iter(self.held)))
+
+    async def preview(self, mode: str, rows: list[dict]) -> list[dict]:
+        valid = [row for row in rows if not row["error"]]
+        current: dict[int, tuple[str, int]] = {}
+        ids = list({row["user_id"] for row in valid})
+        for start in range(0, len(ids), _CHUNK):
+            chunk = ids[start:start + _CHUNK]
+            found = await self.subs.db.fetchall(
+                f"SELECT user_id, status, end_date FROM users WHERE user_id IN ({','.join('?' * len(chunk))})", chunk)
+            current.update({uid: (status, end) for uid, status, end in found})
+        now = int(time.time())
+        for row in valid:
+            status, end = current.get(row["user_id"], (None, None))
+            if mode == REMOVE:
+                row["action"] = "remove" if status else "missing"
+                continue
+            # Те саме правило, що в SubscriptionStore._save; повтори одного user_id у файлі складаються
+            if status == 'active' and end and end > now:
+                row["action"], base = "extend", end
+            else:
+                row["action"], base = ("renew" if status else "new"), now
+            row["end_date"] = base + row["days"] * DAY
+            current[row["user_id"]] = ('active', row["end_date"])
+        return rows
+
+    async def apply(self, mode: str, rows: list[dict],
+                    kick_one: Callable[[int], Awaitable[Any]] | None = None,
+                    progress: Callable[[int, int], Awaitable[Any]] | None = None) -> list[dict]:
+        valid = [row for row in rows if not row["error"]]
+        self.running = True
+        try:
+            with priority(PRIORITY_BULK):
+                if mode == ADD:
+                    await self._add(valid, progress)
+                else:
+                    await self._remove(valid, kick_one, progress)
+        finally:
+            self.running = False
+        logger.info(f"Масовий {mode}: {len(valid)} з {len(rows)} рядків застосовано")
+        return rows
+
+    async def _add(self, rows: list[dict], progress) -> None:
+        ends = await self.subs.save_many([(row["user_id"], row["username"], row["tariff"], row["days"])
+                                          for row in rows])
+        for row, end in zip(rows, ends):
+            row["end_date"] = int(end.timestamp())
+        # Одне запрошення на користувача, навіть якщо він у файлі кілька разів
+        latest = {row["user_id"]: row for row in rows}
+        done = 0
+
+        async def invite(row: dict):
+            nonlocal done
+            try:
+                link = await self.invites.take(row["user_id"])
+                await self.bot.send_message(row["user_id"], ADDSUB_INVITE_TEXT.format(link=link))
+                row["invite"] = "sent"
+            except Exception as e:
+                row["invite"] = f"failed: {e}"
+            done += 1
+            if progress and done % 50 == 0:
+                await progress(done, len(latest))
+
+        await fan_out(latest.values(), invite, limit=self.concurrency)
+
+    async def _remove(self, rows: list[dict], kick_one, progress) -> None:
+        removed = await self.subs.delete_many([row["user_id"] for row in rows])
+        for row in rows:
+            row["action"] = "remove" if row["user_id"] in removed else "missing"
+        user_ids = list(dict.fromkeys(row["user_id"] for row in rows))
+        results = await self.members.kick(user_ids, kick_one, batch=self.kick_batch, progress=progress)
+        outcome = {uid: "ok" if error is None else f"failed: {error}" for uid, _, error in results}
+        for row in rows:
+            row["kick"] = outcome.get(row["user_id"], "")
@@ -0,0 +1,68 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU-кеш з обмеженням розміру та часом життя записів.
+
+    get/set/pop — O(1). Записи старші за ttl вважаються відсутніми і
+    прибираються лениво при доступі або пачкою через sweep().
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def get(self, key: Hashable, default: Any = _MISSING) -> Any:
+        item = self._data.get(key)
+        if item is not None:
+            if not self._expired(item[0], time.monotonic()):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            del self._data[key]
+        self.misses += 1
+        return None if default is _MISSING else default
+
+    def __contains__(self, key: Hashable) -> bool:
+        item = self._data.get(key)
+        return item is not None and not self._expired(item[0], time.monotonic())
+
+    def set(self, key: Hashable, value: Any, stored_at: float | None = None) -> None:
+        self._data[key] = (time.monotonic() if stored_at is None else stored_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def sweep(self) -> int:
+        # get() переставляє записи в кінець, не змінюючи час запису,
+        # тому порядок LRU не збігається з віком — проходимо весь словник
+        if self.ttl is None:
+            return 0
+        now = time.monotonic()
+        expired = [key for key, (stored_at, _) in self._data.items() if self._expired(stored_at, now)]
+        for key in expired:
+            del self._data[key]
+        self.evictions += len(expired)
+        return len(expired)
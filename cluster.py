@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from abc import ABC, abstractmethod
+from functools import wraps
+from typing import Any, Awaitable, Callable
+
+from storage import Database
+
+logger = logging.getLogger(__name__)
+
+
+class LockBackend(ABC):
+    """Спільне сховище лізингових локів між інстансами бота.
+
+    acquire() бере лок на ttl секунд або продовжує його, якщо ним уже володіє owner.
+    Лок, який ніхто не продовжив, сам звільняється після ttl — так падіння інстансу
+    не блокує кластер.
+    """
+
+    @abstractmethod
+    async def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        ...
+
+    @abstractmethod
+    async def release(self, name: str, owner: str) -> None:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalLockBackend(LockBackend):
+    # Один процес: локи в пам'яті, поведінка та сама, що й у кластері
+    def __init__(self):
+        self._locks: dict[str, tuple[str, float]] = {}
+
+    async def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.monotonic()
+        holder = self._locks.get(name)
+        if holder and holder[0] != owner and holder[1] > now:
+            return False
+        self._locks[name] = (owner, now + ttl)
+        return True
+
+    async def release(self, name: str, owner: str) -> None:
+        if self._locks.get(name, (None,))[0] == owner:
+            del self._locks[name]
+
+
+class SqliteLockBackend(LockBackend):
+    # Кілька процесів на одному хості зі спільним файлом бази: атомарність дає файловий лок SQLite
+    def __init__(self, db: Database):
+        self.db = db
+
+    async def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        return await self.db.execute(
+            "INSERT INTO locks (name, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE locks.owner = excluded.owner OR locks.expires_at < ?",
+            (name, owner, now + ttl, now)) == 1
+
+    async def release(self, name: str, owner: str) -> None:
+        await self.db.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+
+
+def make_backend(spec: str | None, db: Database) -> LockBackend:
+    # CLUSTER_BACKEND: порожньо — один процес, "sqlite" — кілька процесів зі спільним файлом бази.
+    # Увесь стан бота (підписки, оплати, скріни, пул запрошень, dedup) живе в SQLite, тож кластер —
+    # це один хост або спільний том; окремий сервер локів нічого б не додав
+    if not spec:
+        return LocalLockBackend()
+    if spec == "sqlite":
+        return SqliteLockBackend(db)
+    raise ValueError(f"Невідомий CLUSTER_BACKEND: {spec} (підтримується лише sqlite)")
+
+
+class Cluster:
+    """Лідерство і ексклюзивні задачі поверх LockBackend.
+
+    Планувальник працює лише на лідері: лідер продовжує свій лок кожну третину lease,
+    а решта інстансів пробують його перехопити. Задачі з exclusive() додатково беруть
+    власний лок — на випадок, коли лідерство переходить посеред задачі або задачу
+    запускає адмін вручну на іншому інстансі.
+    """
+
+    def __init__(self, backend: LockBackend, instance_id: str | None = None, lease: float = 30):
+        self.backend = backend
+        self.instance_id = instance_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.lease = lease
+        self.is_leader = False
+        self._task: asyncio.Task | None = None
+        self._on_elected: Callable[[], Awaitable[Any]] | None = None
+        self._on_demoted: Callable[[], Awaitable[Any]] | None = None
+
+    async def start(self, on_elected: Callable[[], Awaitable[Any]],
+                    on_demoted: Callable[[], Awaitable[Any]]) -> None:
+        self._on_elected = on_elected
+        self._on_demoted = on_demoted
+        await self._tick()
+        self._task = asyncio.create_task(self._loop())
+
+    async def _tick(self) -> None:
+        try:
+            held = await self.backend.acquire("leader", self.instance_id, self.lease)
+        except Exception as e:
+            # Без зв'язку з бекендом лідерство не гарантоване — краще зупинити планувальник
+            logger.error(f"Кластер: помилка продовження лідерства: {e}")
+            held = False
+        if held and not self.is_leader:
+            self.is_leader = True
+            logger.info(f"Інстанс {self.instance_id} став лідером")
+            await self._on_elected()
+        elif not held and self.is_leader:
+            self.is_leader = False
+            logger.warning(f"Інстанс {self.instance_id} втратив лідерство")
+            await self._on_demoted()
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await self._tick()
+            except Exception as e:
+                logger.error(f"Кластер: помилка зміни ролі: {e}")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+        if self.is_leader:
+            self.is_leader = False
+            await self._on_demoted()
+            try:
+                await self.backend.release("leader", self.instance_id)
+            except Exception as e:
+                logger.error(f"Кластер: не вдалося звільнити лідерство: {e}")
+        await self.backend.close()
+
+    def exclusive(self, name: str, ttl: float = 3600):
+        # Задача виконується не більше ніж на одному інстансі; інакше повертає None
+        def decorator(func: Callable[..., Awaitable[Any]]):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                lock = f"job:{name}"
+                # Окремий власник на кожен запуск — і на тому самому інстансі задача не йде двічі
+                owner = f"{self.instance_id}:{uuid.uuid4().hex[:8]}"
+                if not await self.backend.acquire(lock, owner, ttl):
+                    logger.info(f"Задача {name} вже виконується на іншому інстансі — пропускаємо")
+                    return None
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    await self.backend.release(lock, owner)
+            return wrapper
+        return decorator
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import struct
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from metrics import duplicate_updates
+from storage import Database
+
+logger = logging.getLogger(__name__)
+
+KV_KEY = "update_dedup"
+_HEADER = struct.Struct(">qI")
+
+
+class UpdateDeduplicator(BaseMiddleware):
+    """Відкидає повторно доставлені апдейти до того, як їх побачить хоч один хендлер.
+
+    update_id у Telegram зростають, тож достатньо вікна з останніх window ідентифікаторів:
+    бітсет-кільце (біт id % window) плюс high-water mark — найбільший прийнятий id.
+    Усе, що старше за вікно, вважається повтором. Стан зливається зі станом у kv
+    (OR бітсетів, max high-water mark), а не перезаписує його: за linger секунд після
+    пачки нових апдейтів, раз на кілька секунд (щоб бачити апдейти інших інстансів на
+    одній БД) і при зупинці. Після рестарту ретраї Telegram теж відсіюються — окрім
+    апдейтів з останніх linger секунд перед падінням: запис не атомарний з ефектами хендлерів.
+    """
+
+    def __init__(self, db: Database, window: int = 65536, linger: float = 0.2):
+        self.db = db
+        self.window = window
+        self.linger = linger
+        self.bits = bytearray(window // 8)
+        self.high: int | None = None
+        self.dirty = False
+        self._flush: asyncio.Task | None = None
+
+    def _clear(self, start: int, stop: int, bits: bytearray | None = None) -> None:
+        # Звільняє біти для id у [start, stop) — вони переходять до нового кола
+        bits = self.bits if bits is None else bits
+        if stop - start >= self.window:
+            bits[:] = bytes(len(bits))
+            return
+        for update_id in range(start, stop):
+            slot = update_id % self.window
+            bits[slot >> 3] &= ~(1 << (slot & 7)) & 0xFF
+
+    def _merge(self, high: int | None, bits: bytes, other_high: int | None,
+               other_bits: bytes) -> tuple[int | None, bytearray]:
+        # Об'єднання двох вікон: менше спершу доганяє більший high-water mark, далі OR
+        if other_high is None:
+            return high, bytearray(bits)
+        if high is None:
+            return other_high, bytearray(other_bits)
+        merged_high = max(high, other_high)
+        ours, theirs = bytearray(bits), bytearray(other_bits)
+        self._clear(high + 1, merged_high + 1, ours)
+        self._clear(other_high + 1, merged_high + 1, theirs)
+        return merged_high, bytearray(a | b for a, b in zip(ours, theirs))
+
+    def _unpack(self, value: bytes) -> tuple[int, bytes]:
+        high, window = _HEADER.unpack_from(value)
+        if window == self.window:
+            return high, value[_HEADER.size:]
+        # Вікно змінили в конфігурації — старий бітсет не підходить, тож усе до межі вважаємо баченим
+        return high, b"\xff" * len(self.bits)
+
+    def seen(self, update_id: int) -> bool:
+        # True — повтор; інакше id позначається як прийнятий
+        if self.high is None:
+            self.high = update_id
+        elif update_id > self.high:
+            self._clear(self.high + 1, update_id + 1)
+            self.high = update_id
+        elif update_id <= self.high - self.window:
+            return True
+        slot = update_id % self.window
+        mask = 1 << (slot & 7)
+        if self.bits[slot >> 3] & mask:
+            return True
+        self.bits[slot >> 3] |= mask
+        self.dirty = True
+        return False
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        if isinstance(event, Update) and self.seen(event.update_id):
+            duplicate_updates.inc()
+            logger.warning("Апдейт %s уже оброблявся — пропускаємо", event.update_id)
+            return None
+        if self._flush is None or self._flush.done():
+            # Одна відкладена збірка на пачку: апдейти за linger секунд ідуть одним записом
+            self._flush = asyncio.create_task(self._flush_soon())
+        return await handler(event, data)
+
+    async def _flush_soon(self) -> None:
+        await asyncio.sleep(self.linger)
+        try:
+            await self.save()
+        except Exception as e:
+            # Не страшно: наступна пачка або інтервальна задача збережуть вікно
+            logger.error(f"Не вдалося зберегти вікно дедуплікації: {e}")
+
+    async def load(self) -> None:
+        row = await self.db.fetchone("SELECT value FROM kv WHERE key = ?", (KV_KEY,))
+        if not row:
+            return
+        self.high, self.bits = self._merge(self.high, self.bits, *self._unpack(row[0]))
+        logger.info(f"Дедуплікація апдейтів: high-water mark {self.high}")
+
+    async def close(self) -> None:
+        if self._flush is not None and not self._flush.done():
+            self._flush.cancel()
+        await self.save()
+
+    async def save(self) -> None:
+        if not self.dirty:
+            # Своїх змін нема, але інші інстанси могли додати свої
+            await self.load()
+            return
+        self.dirty = False
+        high, bits = self.high, bytes(self.bits)
+
+        def merge(conn) -> tuple[int | None, bytearray]:
+            # Читання і запис в одній транзакції writer-а: паралельний save іншого інстансу не загубиться
+            row = conn.execute("SELECT value FROM kv WHERE key = ?", (KV_KEY,)).fetchone()
+            merged = self._merge(high, bits, *self._unpack(row[0])) if row else (high, bytearray(bits))
+            conn.execute(
+                "INSERT INTO kv (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, "
+                "updated_at = CAST(strftime('%s', 'now') AS INTEGER)",
+                (KV_KEY, _HEADER.pack(merged[0], self.window) + bytes(merged[1])))
+            return merged
+        try:
+            merged = await self.db.write(merge)
+        except Exception:
+            self.dirty = True
+            raise
+        # Поки писали, event loop міг прийняти нові апдейти — зливаємо, а не замінюємо
+        self.high, self.bits = self._merge(self.high, self.bits, *merged)
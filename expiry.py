@@ -0,0 +1,212 @@
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Iterable
+
+from subscriptions import DAY, SubscriptionStore
+
+logger = logging.getLogger(__name__)
+
+
+def next_due(status: str, end_date: int, notice: str | None) -> float | None:
+    # Момент, коли для користувача спрацює наступний перехід з SubscriptionStore._expiry_transitions
+    # (+1 с, бо межі там строгі): старт grace за добу до кінця, далі два нагадування і кік
+    if end_date is None:
+        return None
+    if status == 'active':
+        return end_date - DAY + 1
+    if status == 'grace':
+        if notice in (None, 'grace'):
+            return end_date - 2 * DAY + 1
+        if notice == 'grace_first':
+            return end_date - DAY + 1
+        return end_date + 1
+    return None
+
+
+class ExpiryScheduler:
+    """Переходи підписок у точний час замість раз на добу.
+
+    Min-heap (час, user_id) з лінивим видаленням: актуальний лише запис, що збігається
+    з self._due[user_id]. Зміни підписок приходять через SubscriptionStore.on_change —
+    змінених користувачів перечитуємо з БД і перекладаємо в купу (O(log n) на кожного).
+    Коли настає час, викликається fire(now): вона запускає ті самі ідемпотентні
+    переходи, що й щоденна перевірка, тож cron лишається лише звіркою.
+
+    Працює лише на лідері кластера. У кластері (shared) touch() на інших інстансах пише
+    id змінених користувачів у expiry_touches, а лідер забирає їх звідти раз на
+    poll_interval — зміни з /addsub чи апруву на будь-якому інстансі доходять до купи
+    із запізненням до poll_interval, а не до щоденної звірки.
+    """
+
+    def __init__(self, subs: SubscriptionStore, fire: Callable[[datetime], Awaitable[Any]],
+                 max_sleep: float = 3600, retry_delay: float = 300, shared: bool = False,
+                 poll_interval: float = 30):
+        self.subs = subs
+        self.fire = fire
+        self.max_sleep = max_sleep
+        self.retry_delay = retry_delay
+        self.shared = shared
+        self.poll_interval = poll_interval
+        self._heap: list[tuple[float, int]] = []
+        self._due: dict[int, float] = {}
+        self._touched: set[int] = set()
+        self._published: set[int] = set()
+        self._publish: asyncio.Task | None = None
+        self._polled = 0.0
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.enabled = False  # start() без stop(): задача мала б працювати
+        subs.on_change = self.touch
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _push(self, user_id: int, due: float | None) -> None:
+        if due is None:
+            self._due.pop(user_id, None)
+            return
+        self._due[user_id] = due
+        heapq.heappush(self._heap, (due, user_id))
+
+    def touch(self, user_ids: Iterable[int]) -> None:
+        if not self.running:
+            if self.shared:
+                self._published.update(user_ids)
+                if self._publish is None or self._publish.done():
+                    self._publish = asyncio.create_task(self._publish_touches())
+            return
+        self._touched.update(user_ids)
+        self._wakeup.set()
+
+    async def _publish_touches(self) -> None:
+        # Один запис на пачку змін; якщо БД зайнята — лідер однаково побачить їх на звірці
+        while self._published:
+            user_ids, self._published = self._published, set()
+            now = int(time.time())
+            try:
+                await self.subs.db.executemany(
+                    "INSERT INTO expiry_touches (user_id, touched_at) VALUES (?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET touched_at = excluded.touched_at",
+                    [(user_id, now) for user_id in user_ids])
+            except Exception as e:
+                logger.error(f"Не вдалося передати лідеру {len(user_ids)} змін підписок: {e}")
+                return
+
+    async def _poll(self) -> None:
+        self._polled = time.monotonic()
+        rows = await self.subs.db.write(
+            lambda conn: conn.execute("DELETE FROM expiry_touches RETURNING user_id").fetchall())
+        self._touched.update(user_id for user_id, in rows)
+
+    async def load(self) -> None:
+        if self.shared:
+            # До читання стану: усе, що позначили до цього моменту, load() і так побачить
+            await self.subs.db.execute("DELETE FROM expiry_touches")
+            self._polled = time.monotonic()
+        rows = await self.subs.due_state()
+        self._due = {}
+        for user_id, status, end_date, notice in rows:
+            due = next_due(status, end_date, notice)
+            if due is not None:
+                self._due[user_id] = due
+        self._heap = [(due, user_id) for user_id, due in self._due.items()]
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+        logger.info(f"Планувальник закінчень: {len(self._heap)} підписок у черзі")
+
+    async def _refresh(self) -> None:
+        # Перечитує змінених користувачів; те, що вже мало спрацювати і не спрацювало
+        # (наприклад, кік не вдався), повторюємо не раніше ніж через retry_delay
+        user_ids = list(self._touched)
+        self._touched.clear()
+        try:
+            rows = await self.subs.due_state(user_ids)
+        except Exception:
+            # Не губимо: перечитаємо на наступному колі
+            self._touched.update(user_ids)
+            raise
+        now = time.time()
+        found = set()
+        for user_id, status, end_date, notice in rows:
+            found.add(user_id)
+            due = next_due(status, end_date, notice)
+            self._push(user_id, max(due, now + self.retry_delay) if due is not None and due <= now else due)
+        for user_id in user_ids:
+            if user_id not in found:
+                self._due.pop(user_id, None)
+
+    def _pop_due(self, now: float) -> list[int]:
+        users = []
+        while self._heap and self._heap[0][0] <= now:
+            due, user_id = heapq.heappop(self._heap)
+            if self._due.get(user_id) == due:
+                del self._due[user_id]
+                users.append(user_id)
+        return users
+
+    async def _run(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                await self._step()
+                backoff = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Напр., "database is locked" під час бекапу: задача не має тихо вмерти
+                logger.exception(f"Планувальник закінчень: помилка, повтор через {backoff:.0f} с")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.retry_delay)
+
+    async def _step(self) -> None:
+        self._wakeup.clear()
+        if self.shared and time.monotonic() - self._polled >= self.poll_interval:
+            await self._poll()
+        if self._touched:
+            await self._refresh()
+        # Прибираємо з верхівки неактуальні записи
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        delay = self.poll_interval if self.shared else self.max_sleep
+        if self._heap:
+            delay = min(delay, self._heap[0][0] - time.time())
+        if delay > 0:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            return
+        users = self._pop_due(time.time())
+        try:
+            await self.fire(datetime.now(timezone.utc))
+        except Exception as e:
+            logger.error(f"Помилка переходів підписок: {e}")
+        # Ті, в кого нічого не змінилось, теж перечитуються — щоб не загубити їх з купи
+        self._touched.update(users)
+
+    async def start(self) -> None:
+        self.enabled = True
+        if self.running:
+            return
+        await self.load()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self.enabled = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._heap.clear()
+        self._due.clear()
+        self._touched.clear()
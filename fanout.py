@@ -0,0 +1,23 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Iterable, TypeVar
+
+T = TypeVar("T")
+
+
+async def fan_out(items: Iterable[T], worker: Callable[[T], Awaitable[Any]],
+                  limit: int = 20) -> list[tuple[T, Any, BaseException | None]]:
+    # Запускає worker(item) для всіх елементів, але не більше limit одночасно.
+    # Помилки не зупиняють решту — повертаємо (item, результат, виняток) для кожного.
+    # limit воркерів тягнуть елементи з одного ітератора, тож корутини не створюються наперед.
+    source = iter(items)
+    results: list[tuple[T, Any, BaseException | None]] = []
+
+    async def run():
+        for item in source:
+            try:
+                results.append((item, await worker(item), None))
+            except Exception as e:
+                results.append((item, None, e))
+
+    await asyncio.gather(*(run() for _ in range(max(1, limit))))
+    return results
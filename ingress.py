@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+from aiohttp import web
+
+from storage import Database
+from supervisor import SupervisedRequestHandler, SupervisorClosed, TaskSupervisor
+
+logger = logging.getLogger(__name__)
+
+
+def event_key(update: Update) -> int | None:
+    # Те саме, що supervisor.update_key, але для вже розібраного Update з getUpdates
+    event = update.event
+    sender = getattr(event, "from_user", None) or getattr(event, "user", None) or getattr(event, "chat", None)
+    return sender.id if sender else None
+
+
+class WebhookIngress:
+    """Апдейти через вебхук: aiohttp-хендлер кладе їх у TaskSupervisor."""
+
+    mode = "webhook"
+
+    def __init__(self, dp: Dispatcher, bot: Bot, supervisor: TaskSupervisor, db: Database,
+                 url: str | None, path: str, secret: str | None, allowed_updates: list[str]):
+        self.dp = dp
+        self.bot = bot
+        self.supervisor = supervisor
+        self.db = db
+        self.url = url
+        self.path = path
+        self.secret = secret
+        self.allowed_updates = sorted(allowed_updates)
+
+    def setup(self, app: web.Application) -> None:
+        handler = SupervisedRequestHandler(dispatcher=self.dp, bot=self.bot, secret_token=self.secret,
+                                           supervisor=self.supervisor)
+        handler.register(app, path=self.path)
+
+    async def start(self) -> bool:
+        # set_webhook на кожен рестарт зайвий: якщо Telegram уже шле туди ж і з тими ж
+        # параметрами, лишаємо як є. Секрет get_webhook_info не віддає, тож звіряємо його відбиток з kv
+        fingerprint = hashlib.sha256(
+            f"{self.url}|{self.secret}|{','.join(self.allowed_updates)}".encode()).hexdigest()
+        info = await self.bot.get_webhook_info()
+        row = await self.db.fetchone("SELECT value FROM kv WHERE key = 'webhook'")
+        if (info.url == self.url and sorted(info.allowed_updates or []) == self.allowed_updates
+                and row and row[0] == fingerprint):
+            logger.info(f"Webhook уже встановлено на {self.url}, pending: {info.pending_update_count}")
+            return False
+        # Апдейти, що накопичились під час рестарту, не губимо — повтори відсіє dedup
+        await self.bot.set_webhook(url=self.url, secret_token=self.secret, drop_pending_updates=False,
+                                   allowed_updates=self.allowed_updates)
+        await self.db.execute(
+            "INSERT INTO kv (key, value) VALUES ('webhook', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, "
+            "updated_at = CAST(strftime('%s', 'now') AS INTEGER)", (fingerprint,))
+        logger.info(f"Webhook встановлено на {self.url}")
+        return True
+
+    async def stop(self) -> None:
+        # Дренаж задач робить сам хендлер на on_shutdown застосунку
+        pass
+
+
+class PollingIngress:
+    """Long polling для локального запуску і як запасний варіант, коли вебхук-хост недоступний.
+
+    getUpdates забирає до limit апдейтів за раз; offset наступного запиту підтверджує
+    всю попередню пачку. Апдейти йдуть у той самий TaskSupervisor, що й у вебхуку, тож
+    паралельність і порядок у межах користувача однакові; коли черга повна, submit
+    чекає — і наступний getUpdates не робиться, поки не звільниться місце.
+    """
+
+    mode = "polling"
+
+    def __init__(self, dp: Dispatcher, bot: Bot, supervisor: TaskSupervisor, allowed_updates: list[str],
+                 limit: int = 100, timeout: int = 25, drain_timeout: float = 25, max_backoff: float = 30):
+        self.dp = dp
+        self.bot = bot
+        self.supervisor = supervisor
+        self.allowed_updates = sorted(allowed_updates)
+        self.limit = limit
+        self.timeout = timeout
+        self.drain_timeout = drain_timeout
+        self.max_backoff = max_backoff
+        self.offset: int | None = None
+        self._task: asyncio.Task | None = None
+
+    def setup(self, app: web.Application) -> None:
+        pass
+
+    async def start(self) -> None:
+        # getUpdates не працює, поки встановлено вебхук; накопичені апдейти лишаються в черзі Telegram
+        await self.bot.delete_webhook(drop_pending_updates=False)
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Long polling запущено (limit {self.limit}, timeout {self.timeout} с)")
+
+    async def _feed(self, update: Update) -> None:
+        result = await self.dp.feed_update(self.bot, update)
+        if isinstance(result, TelegramMethod):
+            await self.dp.silent_call_request(self.bot, result)
+
+    async def _run(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                updates = await self.bot.get_updates(offset=self.offset, limit=self.limit, timeout=self.timeout,
+                                                     allowed_updates=self.allowed_updates,
+                                                     request_timeout=self.timeout + 10)
+            except Exception as e:
+                logger.error(f"getUpdates не вдався: {e}; повтор через {backoff:.0f} с")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            backoff = 1.0
+            for update in updates:
+                try:
+                    await self.supervisor.submit(event_key(update), self._feed, update)
+                except SupervisorClosed:
+                    return
+            if updates:
+                self.offset = updates[-1].update_id + 1
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.supervisor.close(self.drain_timeout)
@@ -0,0 +1,188 @@
+import asyncio
+import csv
+import io
+import logging
+import sqlite3
+import time
+
+from aiogram import Bot
+from aiogram.types import BufferedInputFile
+
+from fanout import fan_out
+from invite_pool import InvitePool
+from sender import PRIORITY_BULK, priority
+from storage import Database
+
+logger = logging.getLogger(__name__)
+
+INVITE_TEXT = "Доступ відновлено! 🎉\nПриєднуйся назад до групи:\n{link}\nПосилання діє 24 години. Бот схвалить запит автоматично 💪"
+
+
+class InviteJobs:
+    """Фонова розсилка запрошень з чекпойнтами в БД.
+
+    Кожен користувач — окремий рядок invite_job_items; результати скидаються в БД
+    пачками разом з оновленням прогресу. Після рестарту незавершені задачі
+    продовжуються з тих, хто ще pending (тобто максимум одна пачка піде повторно).
+    Задачу веде той інстанс, що тримає її лізинг (owner, lease_until) і продовжує його
+    кожну третину lease; інший інстанс підхопить її, лише коли лізинг спливе.
+    """
+
+    def __init__(self, db: Database, bot: Bot, invites: InvitePool, concurrency: int = 10,
+                 progress_interval: float = 3.0, owner: str = "local", lease: float = 60):
+        self.db = db
+        self.bot = bot
+        self.invites = invites
+        self.concurrency = concurrency
+        self.progress_interval = progress_interval
+        self.owner = owner
+        self.lease = lease
+        self._tasks: dict[int, asyncio.Task] = {}
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks.values())
+
+    async def start(self, chat_id: int, message_id: int, user_ids: list[int]) -> int:
+        def create(conn: sqlite3.Connection) -> int:
+            cur = conn.execute("INSERT INTO invite_jobs (chat_id, message_id, total, owner, lease_until) "
+                               "VALUES (?, ?, ?, ?, ?)",
+                               (chat_id, message_id, len(user_ids), self.owner, time.time() + self.lease))
+            job_id = cur.lastrowid
+            conn.executemany("INSERT INTO invite_job_items (job_id, user_id) VALUES (?, ?)",
+                             [(job_id, uid) for uid in user_ids])
+            return job_id
+        job_id = await self.db.write(create)
+        self._spawn(job_id)
+        return job_id
+
+    async def _claim(self, job_id: int) -> bool:
+        # Бере або продовжує лізинг; False — задачу веде інший живий інстанс
+        now = time.time()
+        return await self.db.execute(
+            "UPDATE invite_jobs SET owner = ?, lease_until = ? WHERE job_id = ? AND status = 'running' "
+            "AND (owner IS NULL OR owner = ? OR lease_until IS NULL OR lease_until < ?)",
+            (self.owner, now + self.lease, job_id, self.owner, now)) == 1
+
+    async def resume(self) -> None:
+        rows = await self.db.fetchall("SELECT job_id FROM invite_jobs WHERE status = 'running'")
+        for (job_id,) in rows:
+            if job_id in self._tasks or not await self._claim(job_id):
+                continue
+            logger.info(f"Продовжую розсилку запрошень #{job_id} після рестарту")
+            self._spawn(job_id)
+
+    async def _heartbeat(self, job_id: int, task: asyncio.Task) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                claimed = await self._claim(job_id)
+            except Exception as e:
+                logger.error(f"Не вдалося продовжити лізинг розсилки #{job_id}: {e}")
+                continue
+            if not claimed:
+                # Лізинг уже в іншого інстансу — далі розсилку веде він, тут зупиняємось
+                logger.warning(f"Розсилку #{job_id} перехопив інший інстанс — зупиняю")
+                task.cancel()
+                return
+
+    def _spawn(self, job_id: int) -> None:
+        self._tasks[job_id] = asyncio.create_task(self._run(job_id))
+        self._tasks[job_id].add_done_callback(lambda task: self._finished(job_id, task))
+
+    def _finished(self, job_id: int, task: asyncio.Task) -> None:
+        self._tasks.pop(job_id, None)
+        if task.cancelled() or task.exception() is None:
+            return
+        error = task.exception()
+        logger.error(f"Розсилка запрошень #{job_id} впала: {error!r}", exc_info=error)
+        # Інакше задача лишиться 'running' і resume підхопить її лише після рестарту
+        asyncio.create_task(self._fail(job_id, error))
+
+    async def _fail(self, job_id: int, error: BaseException) -> None:
+        try:
+            # Якщо впала лише відправка звіту, розсилка вже 'done' — її не чіпаємо
+            if not await self.db.execute("UPDATE invite_jobs SET status = 'failed', finished_at = CURRENT_TIMESTAMP "
+                                         "WHERE job_id = ? AND status = 'running'", (job_id,)):
+                return
+            chat_id, message_id = await self.db.fetchone(
+                "SELECT chat_id, message_id FROM invite_jobs WHERE job_id = ?", (job_id,))
+            await self._progress(chat_id, message_id, f"Розсилка #{job_id} перервалась з помилкою: {error}")
+        except Exception as e:
+            logger.error(f"Не вдалося позначити розсилку #{job_id} як failed: {e}")
+
+    async def _invite(self, user_id: int) -> str:
+        link = await self.invites.take(user_id)
+        await self.bot.send_message(user_id, INVITE_TEXT.format(link=link))
+        return link
+
+    async def _flush(self, job_id: int, results: list[tuple[str, str | None, str | None, int]]) -> None:
+        def save(conn: sqlite3.Connection):
+            conn.executemany("UPDATE invite_job_items SET status = ?, link = ?, error = ? "
+                             "WHERE job_id = ? AND user_id = ?",
+                             [(status, link, error, job_id, uid) for status, link, error, uid in results])
+        await self.db.write(save)
+
+    async def _progress(self, chat_id: int, message_id: int, text: str) -> None:
+        try:
+            await self.bot.edit_message_text(text, chat_id=chat_id, message_id=message_id)
+        except Exception as e:
+            logger.warning(f"Не вдалося оновити прогрес розсилки: {e}")
+
+    async def _run(self, job_id: int) -> None:
+        chat_id, message_id, total = await self.db.fetchone(
+            "SELECT chat_id, message_id, total FROM invite_jobs WHERE job_id = ?", (job_id,))
+        done, errors = await self.db.fetchone(
+            "SELECT COUNT(*) FILTER (WHERE status != 'pending'), COUNT(*) FILTER (WHERE status = 'failed') "
+            "FROM invite_job_items WHERE job_id = ?", (job_id,))
+        pending = [row[0] for row in await self.db.fetchall(
+            "SELECT user_id FROM invite_job_items WHERE job_id = ? AND status = 'pending'", (job_id,))]
+        batch: list[tuple[str, str | None, str | None, int]] = []
+        last_report = time.monotonic()
+        started = last_report
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, asyncio.current_task()))
+
+        async def worker(user_id: int):
+            nonlocal done, errors, batch, last_report
+            try:
+                link = await self._invite(user_id)
+                batch.append(('sent', link, None, user_id))
+            except Exception as e:
+                logger.error(f"Помилка розсилки запрошення {user_id}: {e}")
+                batch.append(('failed', None, str(e), user_id))
+                errors += 1
+            done += 1
+            if time.monotonic() - last_report >= self.progress_interval:
+                last_report = time.monotonic()
+                results, batch = batch, []
+                await self._flush(job_id, results)
+                await self._progress(chat_id, message_id,
+                                     f"Розсилка запрошень: {done}/{total}\nПомилок: {errors}")
+
+        with priority(PRIORITY_BULK):
+            try:
+                await fan_out(pending, worker, limit=self.concurrency)
+            finally:
+                heartbeat.cancel()
+            if batch:
+                await self._flush(job_id, batch)
+            await self.db.execute("UPDATE invite_jobs SET status = 'done', finished_at = CURRENT_TIMESTAMP "
+                                  "WHERE job_id = ?", (job_id,))
+            sent = total - errors
+            logger.info(f"Розсилка #{job_id} завершена: {sent}/{total}, помилок {errors}, "
+                        f"за {time.monotonic() - started:.1f} с")
+            await self._progress(chat_id, message_id,
+                                 f"Розсилку завершено. Надіслано {sent} запрошень з {total}. Помилок: {errors}")
+            await self.bot.send_document(chat_id, BufferedInputFile(await self.report(job_id),
+                                                                    filename=f"invites_{job_id}.csv"),
+                                         caption=f"Звіт по розсилці #{job_id}")
+
+    async def report(self, job_id: int) -> bytes:
+        rows = await self.db.fetchall(
+            "SELECT user_id, status, link, error FROM invite_job_items WHERE job_id = ? ORDER BY user_id",
+            (job_id,))
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(["user_id", "status", "link", "error"])
+        writer.writerows(rows)
+        return out.getvalue().encode("utf-8")
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+
+from fanout import fan_out
+from metrics import invite_links
+from sender import PRIORITY_BULK, priority
+from storage import Database
+
+logger = logging.getLogger(__name__)
+
+HOUR = 3600
+
+
+class InvitePool:
+    """Пул заздалегідь створених посилань-заявок до групи.
+
+    На апрув посилання береться з таблиці invite_links одним UPDATE … RETURNING, без
+    запиту до Bot API; фоновий цикл доповнює пул до size і пачками відкликає посилання,
+    що вже використані, прострочені або надто старі, щоб їх видавати. Посилання в пулі
+    живуть link_ttl, а користувачу гарантовано issue_ttl від моменту видачі — після
+    цього посилання відкликається. Повторна видача тому ж користувачу повертає те саме
+    посилання й подовжує його строк, якщо запас link_ttl дозволяє.
+    """
+
+    def __init__(self, db: Database, bot: Bot, group_id: int, size: int = 20,
+                 link_ttl: float = 7 * 24 * HOUR, issue_ttl: float = 24 * HOUR,
+                 interval: float = 300, revoke_batch: int = 20, concurrency: int = 5):
+        self.db = db
+        self.bot = bot
+        self.group_id = group_id
+        self.size = size
+        self.link_ttl = link_ttl
+        self.issue_ttl = issue_ttl
+        self.interval = interval
+        self.revoke_batch = revoke_batch
+        self.concurrency = concurrency
+        self.free = 0
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def _create(self, name: str) -> tuple[str, int]:
+        expires_at = int(time.time() + self.link_ttl)
+        invite = await self.bot.create_chat_invite_link(
+            self.group_id, creates_join_request=True, name=name,
+            expire_date=datetime.fromtimestamp(expires_at, timezone.utc))
+        return invite.invite_link, expires_at
+
+    async def take(self, user_id: int) -> str:
+        now = int(time.time())
+        valid_until = now + int(self.issue_ttl)
+
+        def claim(conn: sqlite3.Connection) -> str | None:
+            # Спершу — вже видане цьому користувачу й ще не використане посилання
+            row = conn.execute(
+                "UPDATE invite_links SET valid_until = ? WHERE link = ("
+                "  SELECT link FROM invite_links WHERE user_id = ? AND status = 'issued' AND expires_at >= ?"
+                "  ORDER BY issued_at DESC LIMIT 1) RETURNING link",
+                (valid_until, user_id, valid_until)).fetchone()
+            if row is None:
+                row = conn.execute(
+                    "UPDATE invite_links SET status = 'issued', user_id = ?, issued_at = ?, valid_until = ? "
+                    "WHERE link = (SELECT link FROM invite_links WHERE status = 'free' AND expires_at >= ? "
+                    "  ORDER BY expires_at LIMIT 1) RETURNING link",
+                    (user_id, now, valid_until, valid_until)).fetchone()
+                if row is not None:
+                    self.free = max(0, self.free - 1)
+            return row[0] if row else None
+
+        link = await self.db.write(claim)
+        if link is not None:
+            invite_links.inc("pool")
+        else:
+            # Пул порожній — створюємо посилання напряму, як раніше
+            link, expires_at = await self._create(f"Доступ для {user_id}")
+            await self.db.execute(
+                "INSERT INTO invite_links (link, status, user_id, created_at, expires_at, issued_at, valid_until) "
+                "VALUES (?, 'issued', ?, ?, ?, ?, ?)", (link, user_id, now, expires_at, now, valid_until))
+            invite_links.inc("direct")
+        if self.free < self.size // 2:
+            self._wakeup.set()
+        return link
+
+    async def used(self, link: str | None, user_id: int) -> None:
+        # Схвалений вступ за посиланням — воно своє відслужило, відкличемо в наступній пачці.
+        # Лише якщо вступив той, кому його видали: переслане чуже посилання власнику ще потрібне
+        if link:
+            await self.db.execute(
+                "UPDATE invite_links SET status = 'used', used_by = ?, used_at = CAST(strftime('%s', 'now') AS INTEGER) "
+                "WHERE link = ? AND status IN ('free', 'issued') AND (user_id IS NULL OR user_id = ?)",
+                (user_id, link, user_id))
+
+    async def refill(self) -> int:
+        missing = self.size - await self._count_free()
+        if missing <= 0:
+            return 0
+
+        async def create(_):
+            link, expires_at = await self._create("Пул запрошень")
+            await self.db.execute(
+                "INSERT INTO invite_links (link, status, created_at, expires_at) VALUES (?, 'free', ?, ?)",
+                (link, int(time.time()), expires_at))
+
+        results = await fan_out(range(missing), create, limit=self.concurrency)
+        errors = [e for _, _, e in results if e is not None]
+        if errors:
+            logger.warning(f"Пул запрошень: не вдалося створити {len(errors)} з {missing}: {errors[0]}")
+        self.free = await self._count_free()
+        return missing - len(errors)
+
+    async def revoke_stale(self) -> int:
+        # Використані, прострочені після видачі і вільні, яким уже не вистачить строку на видачу
+        now = int(time.time())
+        rows = await self.db.fetchall(
+            "SELECT link FROM invite_links WHERE status = 'used' "
+            "OR (status = 'issued' AND valid_until < ?) OR (status = 'free' AND expires_at < ?) "
+            "LIMIT ?", (now, now + int(self.issue_ttl), self.revoke_batch))
+        if not rows:
+            return 0
+
+        async def revoke(link: str):
+            try:
+                await self.bot.revoke_chat_invite_link(self.group_id, link)
+            except TelegramBadRequest as e:
+                # Посилання вже недійсне на боці Telegram — відкликати нічого
+                logger.info(f"Посилання {link} не відкликано: {e}")
+
+        results = await fan_out([row[0] for row in rows], revoke, limit=self.concurrency)
+        revoked = [(link,) for link, _, error in results if error is None]
+        await self.db.executemany("UPDATE invite_links SET status = 'revoked' WHERE link = ?", revoked)
+        self.free = await self._count_free()
+        return len(revoked)
+
+    async def _count_free(self) -> int:
+        row = await self.db.fetchone("SELECT COUNT(*) FROM invite_links WHERE status = 'free' AND expires_at >= ?",
+                                     (int(time.time() + self.issue_ttl),))
+        return row[0]
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                with priority(PRIORITY_BULK):
+                    revoked = await self.revoke_stale()
+                    created = await self.refill()
+                if revoked or created:
+                    logger.info(f"Пул запрошень: +{created}, відкликано {revoked}, вільних {self.free}")
+                if revoked >= self.revoke_batch:
+                    self._wakeup.set()  # Є ще що відкликати — наступна пачка одразу
+            except Exception as e:
+                logger.error(f"Помилка обслуговування пулу запрошень: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self.free = await self._count_free()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,138 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any
+
+from metrics import log_records
+
+# Контекст апдейту, що обробляється: update_id (він же correlation id), user_id, тип, хендлер.
+# Словник змінний — inner middleware дописує в нього назву хендлера вже після outer
+update_context: ContextVar[dict | None] = ContextVar("update_context", default=None)
+
+# Високочастотні записи (extra={"sample": ключ}) пишуться лише з такою часткою; WARNING і вище — завжди
+DEFAULT_SAMPLE = "update=0.05,choose_tariff=0.1,join_request=0.2"
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# Рядок на кожен апдейт від aiogram замінює наш семплований "update handled"; APScheduler
+# пише два рядки на кожен запуск інтервальних задач (dedup, profiles — щодесять секунд)
+QUIET_LOGGERS = ("aiogram.event", "apscheduler.executors.default")
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "sample"}
+
+
+def parse_rates(spec: str) -> dict[str, float]:
+    rates = {}
+    for part in spec.split(","):
+        key, _, rate = part.partition("=")
+        if key.strip() and rate:
+            rates[key.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+def _fields(record: logging.LogRecord) -> dict[str, Any]:
+    return {key: value for key, value in vars(record).items() if key not in _RESERVED}
+
+
+class ContextFilter(logging.Filter):
+    """Семплінг і контекст апдейту — у потоці, що логує, ще до черги.
+
+    Відкинутий запис не форматується і не потрапляє в чергу. Контекст копіюється
+    в атрибути запису, бо в потоці слухача contextvars уже інші.
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "sample", None)
+        if key is not None and record.levelno < logging.WARNING:
+            rate = self.rates.get(key, 1.0)
+            if rate < 1.0 and random.random() >= rate:
+                log_records.inc("sampled")
+                return False
+        context = update_context.get()
+        if context:
+            for field, value in context.items():
+                # Явно передане в extra має пріоритет
+                if field not in record.__dict__:
+                    setattr(record, field, value)
+        return True
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    # Стандартний prepare() форматує запис одразу; тут форматування відкладене до потоку
+    # слухача. Аргументи мають бути незмінними після виклику — у хендлерах це числа й рядки
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # Traceback тримає кадри стеку живими — рендеримо його тут, поки вони актуальні
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # Повільний stdout не має гальмувати event loop: коли черга повна, запис губиться
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records.inc("dropped")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+                 "level": record.levelname, "logger": record.name, "msg": record.getMessage()}
+        entry.update(_fields(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    # Для локального запуску: звичний формат, поля контексту — хвостом key=value
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        fields = _fields(record)
+        line = super().formatMessage(record)
+        return f"{line} [{' '.join(f'{k}={v}' for k, v in fields.items())}]" if fields else line
+
+
+def setup_logging(level: str | None = None, fmt: str | None = None, sample: str | None = None,
+                  queue_size: int | None = None) -> logging.handlers.QueueListener | None:
+    """Кореневий логер пише в чергу, у stderr — окремий потік QueueListener.
+
+    Параметри за замовчуванням — з LOG_LEVEL, LOG_FORMAT (json|text), LOG_SAMPLE, LOG_QUEUE_MAX.
+    Повторний виклик нічого не робить: server.py налаштовує логи до імпорту bot.
+    """
+    root = logging.getLogger()
+    if any(isinstance(handler, AsyncQueueHandler) for handler in root.handlers):
+        return None
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    fmt = fmt or os.getenv("LOG_FORMAT", "json")
+    sample = os.getenv("LOG_SAMPLE", DEFAULT_SAMPLE) if sample is None else sample
+    queue_size = queue_size or int(os.getenv("LOG_QUEUE_MAX", 10000))
+
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter(TEXT_FORMAT))
+    records: queue.Queue = queue.Queue(maxsize=queue_size)
+    handler = AsyncQueueHandler(records)
+    handler.addFilter(ContextFilter(parse_rates(sample)))
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+    listener = logging.handlers.QueueListener(records, stream)
+    listener.start()
+    # stop() дописує все, що лишилось у черзі
+    atexit.register(listener.stop)
+    return listener
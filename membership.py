@@ -0,0 +1,67 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+from fanout import fan_out
+from storage import Database
+
+logger = logging.getLogger(__name__)
+
+
+class MembershipIndex:
+    """Локальний індекс учасників групи.
+
+    Bot API не віддає список учасників, тож індекс будується з того, що бот бачить сам:
+    апдейти chat_member (вступ, вихід, кік, зміна прав) і схвалені заявки на вступ.
+    Хто був у групі ще до появи індексу і відтоді нічого не робив, у ньому відсутній —
+    coverage() показує, яку частку групи індекс уже знає.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        self.members: set[int] = set()
+
+    async def load(self) -> None:
+        rows = await self.db.fetchall("SELECT user_id FROM group_members")
+        self.members = {row[0] for row in rows}
+        logger.info(f"Індекс учасників групи: {len(self.members)}")
+
+    async def joined(self, user_id: int, source: str) -> None:
+        self.members.add(user_id)
+        await self.db.execute(
+            "INSERT INTO group_members (user_id, source, joined_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET source = excluded.source",
+            (user_id, source, int(time.time())))
+
+    async def left(self, *user_ids: int) -> None:
+        self.members.difference_update(user_ids)
+        await self.db.executemany("DELETE FROM group_members WHERE user_id = ?", [(uid,) for uid in user_ids])
+
+    def unauthorized(self, subscribed: set[int], exempt: set[int]) -> list[int]:
+        # Учасники без активної/grace підписки, крім адмінів і самого бота
+        return sorted(self.members - subscribed - exempt)
+
+    def coverage(self, member_count: int, admins: int) -> float:
+        known = len(self.members)
+        return min(1.0, known / max(1, member_count - admins))
+
+    async def kick(self, user_ids: list[int], kick_one: Callable[[int], Awaitable[Any]],
+                   batch: int = 20, interval: float = 1.0,
+                   progress: Callable[[int, int], Awaitable[Any]] | None = None
+                   ) -> list[tuple[int, Any, BaseException | None]]:
+        # Кікає пачками з паузою між ними: ban/unban не проходять через ліміти черги
+        # відправки, тож темп тримаємо тут, щоб не впертись у flood control
+        results = []
+        for start in range(0, len(user_ids), batch):
+            chunk = user_ids[start:start + batch]
+            results += await fan_out(chunk, kick_one, limit=batch)
+            kicked = [uid for uid, _, error in results[-len(chunk):] if error is None]
+            if kicked:
+                await self.left(*kicked)
+            if progress:
+                await progress(min(start + batch, len(user_ids)), len(user_ids))
+            if start + batch < len(user_ids):
+                await asyncio.sleep(interval)
+        return results
+
@@ -0,0 +1,196 @@
+import time
+from functools import wraps
+from typing import Any, Awaitable, Callable
+
+from aiohttp import web
+
+# Мінімальна реалізація формату Prometheus text exposition — без зовнішніх залежностей
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.doc = doc
+        self.label_names = labels
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Gauge:
+    # Значення читається функцією в момент збору метрик
+    def __init__(self, name: str, doc: str, read: Callable[[], float]):
+        self.name = name
+        self.doc = doc
+        self.read = read
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} gauge", f"{self.name} {self.read()}"]
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.label_names = labels
+        self.buckets = buckets
+        self._values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def time(self, *labels: str) -> "_Timer":
+        return _Timer(self, labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                le = _labels(self.label_names, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _labels(self.label_names, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: tuple[str, ...]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class StartupTimer:
+    # Розбивка холодного старту по фазах: кожна фаза — час від попередньої позначки
+    def __init__(self, name: str, doc: str):
+        self.name = name
+        self.doc = doc
+        self.started = self._last = time.perf_counter()
+        self.phases: dict[str, float] = {}
+
+    def rebase(self, started: float) -> None:
+        # Точка відліку раніше за імпорт metrics — щоб імпорти до неї теж потрапили у першу фазу
+        if not self.phases:
+            self.started = self._last = started
+
+    def mark(self, phase: str) -> None:
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    @property
+    def total(self) -> float:
+        return self._last - self.started
+
+    def summary(self) -> str:
+        parts = ", ".join(f"{phase} {seconds * 1000:.0f} мс" for phase, seconds in self.phases.items())
+        return f"{self.total * 1000:.0f} мс ({parts})"
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} gauge"]
+        for phase, seconds in self.phases.items():
+            lines.append(f'{self.name}{{phase="{phase}"}} {seconds}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+update_duration = registry.register(Histogram(
+    "bot_update_duration_seconds", "Час обробки апдейту диспетчером", ("type",)))
+update_errors = registry.register(Counter(
+    "bot_update_errors_total", "Апдейти, обробка яких впала з винятком", ("type",)))
+db_duration = registry.register(Histogram(
+    "bot_db_query_duration_seconds", "Час запиту до SQLite разом з чергою до потоку", ("op",)))
+api_duration = registry.register(Histogram(
+    "bot_api_call_duration_seconds", "Час виклику Bot API", ("method",)))
+api_errors = registry.register(Counter(
+    "bot_api_errors_total", "Помилки викликів Bot API", ("method", "error")))
+job_duration = registry.register(Histogram(
+    "bot_job_duration_seconds", "Тривалість задач планувальника", ("job",),
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600)))
+join_requests = registry.register(Counter(
+    "bot_join_requests_total", "Заявки на вступ до групи", ("result",)))
+approvals = registry.register(Counter(
+    "bot_approvals_total", "Апруви оплат адміном"))
+kicks = registry.register(Counter(
+    "bot_kicks_total", "Кіки з групи", ("reason",)))
+duplicate_updates = registry.register(Counter(
+    "bot_duplicate_updates_total", "Повторно доставлені апдейти, відкинуті до хендлерів"))
+task_wait = registry.register(Histogram(
+    "bot_task_queue_wait_seconds", "Час очікування фонової задачі в черзі супервізора"))
+task_errors = registry.register(Counter(
+    "bot_task_errors_total", "Фонові задачі, що впали з винятком", ("task",)))
+invite_links = registry.register(Counter(
+    "bot_invite_links_total", "Видані посилання-запрошення: з пулу чи створені напряму", ("source",)))
+profile_lookups = registry.register(Counter(
+    "bot_profile_lookups_total", "Звідки взято username на апруві: кеш, БД чи get_chat", ("source",)))
+log_records = registry.register(Counter(
+    "bot_log_records_skipped_total", "Записи логу, відкинуті семплінгом або через повну чергу", ("reason",)))
+startup = registry.register(StartupTimer(
+    "bot_startup_phase_seconds", "Тривалість фаз останнього старту процесу"))
+
+
+def timed_job(name: str):
+    def decorator(func: Callable[..., Awaitable[Any]]):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with job_duration.time(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
@@ -0,0 +1,89 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.types import TelegramObject, Update
+
+from logs import update_context
+from metrics import api_duration, api_errors, update_duration, update_errors
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateTimingMiddleware(BaseMiddleware):
+    # Зовнішній middleware на dp.update: міряє весь шлях апдейту до хендлера і назад
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        update_type = event.event_type if isinstance(event, Update) else type(event).__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            update_errors.inc(update_type)
+            raise
+        finally:
+            update_duration.observe(time.perf_counter() - started, update_type)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot,
+                       method: TelegramMethod) -> Response:
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            api_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            api_duration.observe(time.perf_counter() - started, name)
+
+
+class UpdateContextMiddleware(BaseMiddleware):
+    """Outer middleware на dp.update: контекст для всіх логів апдейту і підсумковий запис.
+
+    Підсумок ("update handled" з duration_ms) семплюється ключем "update"; повільні
+    (довші за slow) і ті, що впали, пишуться завжди як WARNING.
+    """
+
+    def __init__(self, slow: float = 1.0):
+        self.slow = slow
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        context = {"update_id": event.update_id if isinstance(event, Update) else None,
+                   "user_id": user.id if user else None,
+                   "update_type": event.event_type if isinstance(event, Update) else type(event).__name__}
+        token = update_context.set(context)
+        started = time.perf_counter()
+        error = None
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            fields = {"duration_ms": round(duration * 1000, 1), "sample": "update"}
+            if error:
+                logger.warning("update failed", extra={**fields, "error": error})
+            elif duration > self.slow:
+                logger.warning("update slow", extra=fields)
+            else:
+                logger.info("update handled", extra=fields)
+            update_context.reset(token)
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    # Inner middleware: лише тут відомо, який хендлер спрацював
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        context = update_context.get()
+        handler_object = data.get("handler")
+        if context is not None and handler_object is not None:
+            context["handler"] = getattr(handler_object.callback, "__name__", None)
+        return await handler(event, data)
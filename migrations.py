@@ -0,0 +1,302 @@
+import logging
+import sqlite3
+
+from storage import Database
+
+logger = logging.getLogger(__name__)
+
+
+def _baseline(conn: sqlite3.Connection):
+    # Схема, яка існувала до появи міграцій (IF NOT EXISTS — на старих базах нічого не змінює)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            tariff TEXT,
+            start_date TEXT,
+            end_date TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS invite_jobs (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            message_id INTEGER,
+            status TEXT DEFAULT 'running',
+            total INTEGER,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            finished_at TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS invite_job_items (
+            job_id INTEGER,
+            user_id INTEGER,
+            status TEXT DEFAULT 'pending',
+            link TEXT,
+            error TEXT,
+            PRIMARY KEY (job_id, user_id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pending_payments (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            tariff TEXT,
+            period TEXT,
+            created_at INTEGER
+        )
+    ''')
+
+
+def _epoch_dates_and_indexes(conn: sqlite3.Connection):
+    # Дати в users були ISO-рядками з TEXT-афінністю, тому колонки треба саме перестворити:
+    # у TEXT-колонці число збереглося б як рядок і порівняння в SQL знову були б рядковими
+    conn.execute('''
+        CREATE TABLE users_new (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            tariff TEXT,
+            start_date INTEGER,
+            end_date INTEGER,
+            status TEXT NOT NULL DEFAULT 'pending',
+            created_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO users_new (user_id, username, tariff, start_date, end_date, status, created_at)
+        SELECT user_id, username, tariff,
+               CAST(strftime('%s', start_date) AS INTEGER),
+               CAST(strftime('%s', end_date) AS INTEGER),
+               COALESCE(status, 'pending'),
+               CAST(strftime('%s', created_at) AS INTEGER)
+        FROM users
+    ''')
+    conn.execute("DROP TABLE users")
+    conn.execute("ALTER TABLE users_new RENAME TO users")
+    conn.execute("CREATE INDEX idx_users_status_end ON users (status, end_date)")
+    conn.execute("CREATE INDEX idx_users_end ON users (end_date)")
+
+
+def _payments_history(conn: sqlite3.Connection):
+    # Кожна оплата/продовження — окремий рядок; users тримає лише поточний стан
+    conn.execute('''
+        CREATE TABLE payments (
+            payment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            tariff TEXT,
+            days INTEGER,
+            prev_status TEXT,
+            prev_end_date INTEGER,
+            start_date INTEGER,
+            end_date INTEGER,
+            created_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+        )
+    ''')
+    conn.execute("CREATE INDEX idx_payments_user ON payments (user_id, created_at)")
+    # Для наявних підписок зберігаємо хоча б останній відомий період
+    conn.execute('''
+        INSERT INTO payments (user_id, tariff, start_date, end_date, created_at)
+        SELECT user_id, tariff, start_date, end_date, start_date FROM users WHERE end_date IS NOT NULL
+    ''')
+
+
+def _backup_log(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE backups (
+            backup_id TEXT PRIMARY KEY,
+            kind TEXT,
+            base_id TEXT,
+            duration_ms INTEGER,
+            raw_size INTEGER,
+            size INTEGER,
+            created_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+        )
+    ''')
+
+
+def _kv_store(conn: sqlite3.Connection):
+    # Дрібний службовий стан (вікно дедуплікації апдейтів тощо)
+    conn.execute('''
+        CREATE TABLE kv (
+            key TEXT PRIMARY KEY,
+            value BLOB,
+            updated_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+        )
+    ''')
+
+
+def _cluster_locks(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE locks (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+
+
+def _grace_notice(conn: sqlite3.Connection):
+    # Останнє надіслане grace-нагадування — щоб переходи були ідемпотентними
+    conn.execute("ALTER TABLE users ADD COLUMN grace_notice TEXT")
+    conn.execute("UPDATE users SET grace_notice = 'grace' WHERE status = 'grace'")
+
+
+def _group_members(conn: sqlite3.Connection):
+    # Індекс учасників групи з chat_member апдейтів і схвалених заявок
+    conn.execute('''
+        CREATE TABLE group_members (
+            user_id INTEGER PRIMARY KEY,
+            source TEXT,
+            joined_at INTEGER
+        )
+    ''')
+
+
+def _proofs(conn: sqlite3.Connection):
+    # Черга скрінів оплати на перевірку адміном
+    conn.execute('''
+        CREATE TABLE proofs (
+            proof_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            username TEXT,
+            tariff TEXT,
+            period TEXT,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            content_type TEXT,
+            status TEXT NOT NULL DEFAULT 'new',
+            admin_message_id INTEGER,
+            error TEXT,
+            created_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+            reviewed_at INTEGER
+        )
+    ''')
+    conn.execute("CREATE INDEX idx_proofs_status ON proofs (status, proof_id)")
+
+
+def _invite_links(conn: sqlite3.Connection):
+    # Пул посилань-заявок: free → issued (кому й до коли) → used → revoked
+    conn.execute('''
+        CREATE TABLE invite_links (
+            link TEXT PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'free',
+            user_id INTEGER,
+            used_by INTEGER,
+            created_at INTEGER,
+            expires_at INTEGER,
+            issued_at INTEGER,
+            valid_until INTEGER,
+            used_at INTEGER
+        )
+    ''')
+    conn.execute("CREATE INDEX idx_invite_links_status ON invite_links (status, expires_at)")
+    conn.execute("CREATE INDEX idx_invite_links_user ON invite_links (user_id)")
+
+
+def _profiles(conn: sqlite3.Connection):
+    # Останній відомий username з апдейтів — щоб апрув не питав get_chat
+    conn.execute('''
+        CREATE TABLE profiles (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            seen_at INTEGER
+        )
+    ''')
+
+
+def _analytics(conn: sqlite3.Connection):
+    # Append-only журнал подій підписок і денні агрегати, що оновлюються в тій самій транзакції
+    conn.execute('''
+        CREATE TABLE sub_events (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            tariff TEXT NOT NULL DEFAULT '',
+            days INTEGER,
+            amount INTEGER NOT NULL DEFAULT 0,
+            created_at INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX idx_sub_events_user ON sub_events (user_id, created_at)")
+    conn.execute('''
+        CREATE TABLE daily_stats (
+            day TEXT NOT NULL,
+            tariff TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            revenue INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, tariff, kind)
+        ) WITHOUT ROWID
+    ''')
+    # Минулі оплати відновлюємо з payments (суми тоді не зберігались — 0)
+    conn.execute('''
+        INSERT INTO sub_events (user_id, kind, tariff, days, created_at)
+        SELECT user_id,
+               CASE prev_status WHEN 'active' THEN 'renewal' WHEN 'grace' THEN 'grace_conversion'
+                                WHEN 'expired' THEN 'reactivation' ELSE 'new' END,
+               COALESCE(tariff, ''), days, COALESCE(created_at, start_date, 0)
+        FROM payments ORDER BY payment_id
+    ''')
+    conn.execute('''
+        INSERT INTO daily_stats (day, tariff, kind, count, revenue)
+        SELECT strftime('%Y-%m-%d', created_at, 'unixepoch'), tariff, kind, COUNT(*), SUM(amount)
+        FROM sub_events GROUP BY 1, 2, 3
+    ''')
+
+
+def _invite_job_lease(conn: sqlite3.Connection):
+    # Власник розсилки і строк його лізингу: новий лідер не підхоплює задачу, яку ще веде попередній
+    conn.execute("ALTER TABLE invite_jobs ADD COLUMN owner TEXT")
+    conn.execute("ALTER TABLE invite_jobs ADD COLUMN lease_until REAL")
+
+
+def _expiry_touches(conn: sqlite3.Connection):
+    # Змінені на не-лідерах підписки: лідер забирає їх звідси у свій планувальник закінчень
+    conn.execute('''
+        CREATE TABLE expiry_touches (
+            user_id INTEGER PRIMARY KEY,
+            touched_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+
+MIGRATIONS = [
+    (1, "baseline", _baseline),
+    (2, "epoch dates + indexes on users", _epoch_dates_and_indexes),
+    (3, "payments history", _payments_history),
+    (4, "backup log", _backup_log),
+    (5, "kv store", _kv_store),
+    (6, "cluster locks", _cluster_locks),
+    (7, "grace notice stage", _grace_notice),
+    (8, "group members index", _group_members),
+    (9, "proof review queue", _proofs),
+    (10, "invite link pool", _invite_links),
+    (11, "user profiles", _profiles),
+    (12, "subscription events + daily stats", _analytics),
+    (13, "invite job lease", _invite_job_lease),
+    (14, "expiry touches", _expiry_touches),
+]
+
+
+def migrate(db: Database) -> int:
+    # Версія схеми зберігається в PRAGMA user_version; кожна міграція — окрема транзакція
+    def current(conn: sqlite3.Connection) -> int:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    version = db.write_sync(current)
+    for number, name, apply in MIGRATIONS:
+        if number <= version:
+            continue
+
+        def run(conn: sqlite3.Connection):
+            apply(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+
+        db.write_sync(run)
+        version = number
+        logger.info(f"Міграція {number} ({name}) застосована")
+    return version
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+from aiogram import Bot
+
+from sender import PRIORITY_BULK, priority
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE = 4000  # Ліміт Telegram — 4096 символів, лишаємо запас
+
+
+def _chunks(lines: list[str], limit: int = MAX_MESSAGE) -> list[str]:
+    chunks, current = [], ""
+    for line in lines:
+        line = line[:limit]
+        if current and len(current) + len(line) + 2 > limit:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{line}" if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class AdminNotifier:
+    """Усе, що йде в приватний чат адміна з хендлерів, — одною фоновою задачею.
+
+    Telegram пускає в один приватний чат ~1 повідомлення/с, тож хендлер, який шле адміну
+    напряму, тримає воркер супервізора, поки чекає токен цього чату. Тут notify() лише
+    кладе рядок у буфер, а задача раз на linger секунд відправляє все накопичене одним
+    дайджестом (PRIORITY_BULK). Інші відправки адміну (пересилання скрінів) ставляться
+    в ту саму задачу через run() і виконуються по черзі.
+    """
+
+    def __init__(self, bot: Bot, admin_id: int, linger: float = 2.0):
+        self.bot = bot
+        self.admin_id = admin_id
+        self.linger = linger
+        self._lines: list[str] = []
+        self._jobs: list[tuple[Callable[..., Awaitable[Any]], tuple]] = []
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+    @property
+    def depth(self) -> int:
+        return len(self._lines) + len(self._jobs)
+
+    def _kick(self) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+        self._wakeup.set()
+
+    def notify(self, text: str) -> None:
+        self._lines.append(text)
+        self._kick()
+
+    def run(self, fn: Callable[..., Awaitable[Any]], *args: Any) -> None:
+        self._jobs.append((fn, args))
+        self._kick()
+
+    async def _flush(self) -> None:
+        jobs, self._jobs = self._jobs, []
+        lines, self._lines = self._lines, []
+        with priority(PRIORITY_BULK):
+            for fn, args in jobs:
+                try:
+                    await fn(*args)
+                except Exception as e:
+                    logger.error(f"Задача для адміна {getattr(fn, '__name__', fn)} впала: {e}")
+            for text in _chunks(lines):
+                try:
+                    await self.bot.send_message(self.admin_id, text)
+                except Exception as e:
+                    logger.error(f"Не вдалося надіслати дайджест адміну ({len(lines)} подій): {e}")
+
+    async def _loop(self) -> None:
+        while not self._closing:
+            await self._wakeup.wait()
+            if not self._closing:
+                # Чекаємо, поки назбирається пачка: сплеск заявок — одне повідомлення, а не сотня
+                await asyncio.sleep(self.linger)
+            self._wakeup.clear()
+            await self._flush()
+        if self._lines or self._jobs:
+            await self._flush()
+
+    async def close(self, timeout: float = 10) -> None:
+        # Дописуємо накопичене, не чекаючи linger
+        self._closing = True
+        if self._task is None or self._task.done():
+            if self._lines or self._jobs:
+                await self._flush()
+            return
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не встигли надіслати адміну {self.depth} подій до зупинки")
+        self._task = None
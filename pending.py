@@ -0,0 +1,81 @@
+import logging
+import time
+
+from cache import TTLCache
+from storage import Database
+
+logger = logging.getLogger(__name__)
+
+
+class PendingPayments:
+    """Хто натиснув «Я оплатив» і ще не надіслав скрін/чек.
+
+    Джерело правди — таблиця pending_payments, тож стан переживає рестарт.
+    Гарячі записи тримаються в TTLCache, щоб handle_proof не ходив у БД.
+    Записи старші за ttl прибирає sweep() і з кешу, і з таблиці.
+    З shared=True (кілька інстансів) кеш не використовується для читань: запис міг
+    зробити чи забрати інший процес, тож get/pop завжди йдуть у БД.
+    """
+
+    def __init__(self, db: Database, ttl: float = 72 * 3600, max_size: int = 10000, shared: bool = False):
+        self.db = db
+        self.ttl = ttl
+        self.shared = shared
+        self.cache = TTLCache(maxsize=max_size, ttl=ttl)
+
+    @staticmethod
+    def _entry(username: str, tariff: str, period: str) -> dict:
+        return {"username": username, "tariff": tariff, "period": period}
+
+    async def load(self) -> None:
+        # Прогріваємо кеш найсвіжішими записами, що ще не протухли
+        now = time.time()
+        rows = await self.db.fetchall(
+            "SELECT user_id, username, tariff, period, created_at FROM pending_payments "
+            "WHERE created_at > ? ORDER BY created_at DESC LIMIT ?",
+            (now - self.ttl, self.cache.maxsize))
+        mono = time.monotonic()
+        for user_id, username, tariff, period, created_at in reversed(rows):
+            self.cache.set(user_id, self._entry(username, tariff, period), stored_at=mono - (now - created_at))
+        logger.info(f"Завантажено {len(rows)} очікуваних оплат")
+
+    async def put(self, user_id: int, username: str, tariff: str, period: str) -> None:
+        self.cache.set(user_id, self._entry(username, tariff, period))
+        await self.db.execute(
+            "INSERT OR REPLACE INTO pending_payments (user_id, username, tariff, period, created_at) "
+            "VALUES (?, ?, ?, ?, ?)", (user_id, username, tariff, period, int(time.time())))
+
+    async def get(self, user_id: int) -> dict | None:
+        data = None if self.shared else self.cache.get(user_id)
+        if data is not None:
+            return data
+        # Запис міг випасти з кешу через ліміт розміру, але ще жити в БД
+        row = await self.db.fetchone(
+            "SELECT username, tariff, period, created_at FROM pending_payments "
+            "WHERE user_id = ? AND created_at > ?", (user_id, time.time() - self.ttl))
+        if row is None:
+            return None
+        data = self._entry(*row[:3])
+        self.cache.set(user_id, data, stored_at=time.monotonic() - (time.time() - row[3]))
+        return data
+
+    async def pop(self, user_id: int) -> dict | None:
+        if self.shared:
+            # Атомарно забираємо запис — скрін від того самого користувача обробить лише один інстанс
+            self.cache.pop(user_id)
+            row = await self.db.write(lambda conn: conn.execute(
+                "DELETE FROM pending_payments WHERE user_id = ? RETURNING username, tariff, period, created_at",
+                (user_id,)).fetchone())
+            if row is None or row[3] <= time.time() - self.ttl:
+                return None
+            return self._entry(*row[:3])
+        data = await self.get(user_id)
+        self.cache.pop(user_id)
+        await self.db.execute("DELETE FROM pending_payments WHERE user_id = ?", (user_id,))
+        return data
+
+    async def sweep(self) -> None:
+        evicted = self.cache.sweep()
+        deleted = await self.db.execute("DELETE FROM pending_payments WHERE created_at <= ?",
+                                        (time.time() - self.ttl,))
+        logger.info(f"Очищено очікуваних оплат: {deleted} з БД, {evicted} з кешу (в кеші {len(self.cache)})")
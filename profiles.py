@@ -0,0 +1,94 @@
+import logging
+import sqlite3
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import TelegramObject, User
+
+from cache import TTLCache
+from metrics import profile_lookups
+from storage import Database
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400
+
+
+class ProfileCache(BaseMiddleware):
+    """user_id → username, зібраний з апдейтів, щоб апрув не ходив у get_chat.
+
+    Outer middleware бачить from_user кожного апдейту і лише позначає змінені профілі;
+    у таблицю profiles вони пишуться пачкою через flush(). Запис, що не оновлювався
+    довше за stale_after, вважається застарілим — тоді username() один раз питає Bot API.
+    """
+
+    def __init__(self, db: Database, cache_size: int = 50000, stale_after: float = 30 * DAY,
+                 touch_every: float = DAY):
+        self.db = db
+        self.stale_after = stale_after
+        self.touch_every = touch_every
+        self.cache = TTLCache(maxsize=cache_size)
+        self._dirty: dict[int, tuple[str | None, str | None, int]] = {}
+
+    def seen(self, user: User) -> None:
+        now = int(time.time())
+        cached = self.cache.get(user.id)
+        # Сам факт, що користувач пише, освіжає профіль, але писати в БД на кожен апдейт нема сенсу
+        if cached and cached[0] == user.username and now - cached[2] < self.touch_every:
+            return
+        profile = (user.username, user.first_name, now)
+        self.cache.set(user.id, profile)
+        self._dirty[user.id] = profile
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        if user is not None and not user.is_bot:
+            self.seen(user)
+        return await handler(event, data)
+
+    async def flush(self) -> int:
+        if not self._dirty:
+            return 0
+        batch, self._dirty = self._dirty, {}
+
+        def save(conn: sqlite3.Connection):
+            conn.executemany(
+                "INSERT INTO profiles (user_id, username, first_name, seen_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET username = excluded.username, "
+                "first_name = excluded.first_name, seen_at = excluded.seen_at",
+                [(user_id, *profile) for user_id, profile in batch.items()])
+        try:
+            await self.db.write(save)
+        except Exception:
+            # Не губимо: новіші дані, що прийшли за цей час, мають пріоритет
+            self._dirty = {**batch, **self._dirty}
+            raise
+        return len(batch)
+
+    async def username(self, user_id: int, bot: Bot) -> str:
+        now = int(time.time())
+        profile = self.cache.get(user_id)
+        source = "cache"
+        if profile is None:
+            row = await self.db.fetchone("SELECT username, first_name, seen_at FROM profiles WHERE user_id = ?",
+                                         (user_id,))
+            if row:
+                profile = tuple(row)
+                self.cache.set(user_id, profile)
+                source = "db"
+        if profile is None or now - profile[2] > self.stale_after:
+            try:
+                chat = await bot.get_chat(user_id)
+                profile = (chat.username, chat.first_name, now)
+                self.cache.set(user_id, profile)
+                self._dirty[user_id] = profile
+                source = "api"
+            except Exception as e:
+                # Застарілий username кращий за зірваний апрув
+                if profile is None:
+                    raise
+                logger.warning(f"Не вдалося оновити профіль {user_id}: {e}")
+        profile_lookups.inc(source)
+        return profile[0] or f"id{user_id}"
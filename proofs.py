@@ -0,0 +1,156 @@
+import logging
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from aiogram import Bot
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from analytics import PAYMENT_KINDS
+from notifier import AdminNotifier
+from storage import Database
+
+logger = logging.getLogger(__name__)
+
+# new — ще не переслано адміну, pending — чекає рішення, approving — апрув у роботі,
+# failed — апрув впав (можна повторити), approved / rejected — фінальні
+REVIEWABLE = ('new', 'pending', 'failed')
+STATUS_LABELS = {'new': "пересилається", 'pending': "чекає перевірки", 'approving': "апрув у роботі",
+                 'failed': "апрув не вдався", 'approved': "схвалено", 'rejected': "відхилено"}
+_COLUMNS = "proof_id, user_id, username, tariff, period, chat_id, message_id, status, admin_message_id, error, created_at"
+_REVIEWABLE_SQL = "status IN ('new', 'pending', 'failed')"
+# Апрув, що стільки секунд лишається 'approving', уже ніхто не веде — процес, що його почав, помер
+APPROVING_TIMEOUT = 600
+
+
+def _proof(row: tuple | None) -> dict | None:
+    if row is None:
+        return None
+    return dict(zip(("proof_id", "user_id", "username", "tariff", "period", "chat_id", "message_id",
+                     "status", "admin_message_id", "error", "created_at"), row))
+
+
+class ProofQueue:
+    """Персистентна черга скрінів оплати на перевірку.
+
+    Користувач отримує відповідь одразу, а пересилання медіа адміну йде фоном через
+    AdminNotifier — по черзі, не займаючи воркерів супервізора. Адмін гортає чергу по одному скріну («наступний» / «попередній»)
+    і апрувить чи відхиляє; стан кожного скріну живе в таблиці proofs, тож черга
+    переживає рестарт, а повторне натискання кнопки нічого не робить двічі.
+    """
+
+    def __init__(self, db: Database, bot: Bot, admin_id: int, notifier: AdminNotifier):
+        self.db = db
+        self.bot = bot
+        self.admin_id = admin_id
+        self.notifier = notifier
+
+    async def submit(self, user_id: int, username: str, tariff: str, period: str,
+                     chat_id: int, message_id: int, content_type: str) -> int:
+        def insert(conn: sqlite3.Connection) -> tuple[int, int]:
+            proof_id = conn.execute(
+                "INSERT INTO proofs (user_id, username, tariff, period, chat_id, message_id, content_type) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, username, tariff, period, chat_id, message_id, content_type)).lastrowid
+            queued = conn.execute(f"SELECT COUNT(*) FROM proofs WHERE {_REVIEWABLE_SQL}").fetchone()[0]
+            return proof_id, queued
+        proof_id, queued = await self.db.write(insert)
+        self.notifier.run(self.deliver, proof_id, queued == 1)
+        return proof_id
+
+    async def deliver(self, proof_id: int, notify: bool = False) -> None:
+        proof = await self.get(proof_id)
+        if proof is None or proof["admin_message_id"]:
+            return
+        try:
+            # Тихо: сповіщення адміну одне — коли черга стала непорожньою
+            forwarded = await self.bot.forward_message(self.admin_id, proof["chat_id"], proof["message_id"],
+                                                       disable_notification=True)
+            await self.db.execute(
+                "UPDATE proofs SET admin_message_id = ?, error = NULL, "
+                "status = CASE WHEN status = 'new' THEN 'pending' ELSE status END WHERE proof_id = ?",
+                (forwarded.message_id, proof_id))
+        except Exception as e:
+            logger.error(f"Не вдалося переслати скрін #{proof_id}: {e}")
+            await self.db.execute("UPDATE proofs SET error = ? WHERE proof_id = ?", (str(e), proof_id))
+        if notify:
+            await self.bot.send_message(
+                self.admin_id, "Новий скрін/чек на перевірку!",
+                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+                    [InlineKeyboardButton(text="Переглянути чергу", callback_data=f"proof:v:{proof_id}")]]))
+
+    async def recover(self, timeout: float = APPROVING_TIMEOUT) -> int:
+        # Завислий апрув: якщо після claim з'явилась оплата цього користувача — підписку вже
+        # видано, скрін схвалено; інакше — failed, і адмін повторить апрув (повтор продовжив би
+        # підписку вдруге, тому сліпо не перезапускаємо)
+        kinds = ", ".join(f"'{kind}'" for kind in PAYMENT_KINDS)
+        paid = (f"EXISTS (SELECT 1 FROM sub_events e WHERE e.user_id = proofs.user_id "
+                f"AND e.kind IN ({kinds}) AND e.created_at >= proofs.reviewed_at)")
+        count = await self.db.execute(
+            f"UPDATE proofs SET status = CASE WHEN {paid} THEN 'approved' ELSE 'failed' END, "
+            f"error = CASE WHEN {paid} THEN NULL ELSE 'апрув перервано рестартом' END "
+            f"WHERE status = 'approving' AND reviewed_at < ?", (int(time.time() - timeout),))
+        if count:
+            logger.warning(f"Відновлено {count} завислих апрувів скрінів")
+        return count
+
+    async def resume(self) -> None:
+        await self.recover()
+        rows = await self.db.fetchall("SELECT proof_id, user_id FROM proofs WHERE status = 'new'")
+        for proof_id, _ in rows:
+            self.notifier.run(self.deliver, proof_id)
+        if rows:
+            logger.info(f"Допересилаю {len(rows)} скрінів після рестарту")
+
+    async def get(self, proof_id: int) -> dict | None:
+        return _proof(await self.db.fetchone(f"SELECT {_COLUMNS} FROM proofs WHERE proof_id = ?", (proof_id,)))
+
+    async def neighbour(self, proof_id: int = 0, backwards: bool = False) -> dict | None:
+        # Наступний (або попередній) скрін, що ще чекає рішення; по колу, якщо далі нічого
+        sign, order = ("<", "DESC") if backwards else (">", "ASC")
+        sql = f"SELECT {_COLUMNS} FROM proofs WHERE {_REVIEWABLE_SQL} AND proof_id {sign} ? ORDER BY proof_id {order} LIMIT 1"
+        row = await self.db.fetchone(sql, (proof_id,))
+        if row is None and proof_id:
+            row = await self.db.fetchone(sql, (2 ** 62 if backwards else 0,))
+        return _proof(row)
+
+    async def position(self, proof_id: int) -> tuple[int, int]:
+        return await self.db.fetchone(
+            f"SELECT COUNT(*) FILTER (WHERE proof_id <= ?), COUNT(*) FROM proofs WHERE {_REVIEWABLE_SQL}",
+            (proof_id,))
+
+    async def claim(self, proof_id: int, status: str) -> bool:
+        # Переводить скрін у новий стан лише з тих, що чекають рішення — подвійний клік не пройде
+        return await self.db.execute(
+            f"UPDATE proofs SET status = ?, reviewed_at = CAST(strftime('%s', 'now') AS INTEGER) "
+            f"WHERE proof_id = ? AND {_REVIEWABLE_SQL}", (status, proof_id)) == 1
+
+    async def finish(self, proof_id: int, status: str, error: str | None = None) -> None:
+        await self.db.execute("UPDATE proofs SET status = ?, error = ? WHERE proof_id = ?",
+                              (status, error, proof_id))
+
+    async def show(self, proof: dict | None) -> None:
+        # Картка скріну — відповідь на переслане медіа, щоб у чаті адміна воно було поруч
+        if proof is None:
+            await self.bot.send_message(self.admin_id, "Черга скрінів порожня ✅")
+            return
+        if not proof["admin_message_id"]:
+            await self.deliver(proof["proof_id"])
+            proof = await self.get(proof["proof_id"])
+        index, total = await self.position(proof["proof_id"])
+        created = datetime.fromtimestamp(proof["created_at"], timezone.utc).strftime('%d.%m %H:%M')
+        text = (f"Скрін #{proof['proof_id']} ({index}/{total} у черзі)\n"
+                f"Від: @{proof['username']} (ID: {proof['user_id']})\nТариф: {proof['tariff']}\n"
+                f"Надіслано: {created} UTC\nСтатус: {STATUS_LABELS.get(proof['status'], proof['status'])}")
+        if proof["error"]:
+            text += f"\nПомилка: {proof['error']}"
+        pid = proof["proof_id"]
+        kb = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="✅ Апрув", callback_data=f"proof:a:{pid}"),
+             InlineKeyboardButton(text="❌ Відхилити", callback_data=f"proof:r:{pid}")],
+            [InlineKeyboardButton(text="◀ Попередній", callback_data=f"proof:p:{pid}"),
+             InlineKeyboardButton(text="Наступний ▶", callback_data=f"proof:n:{pid}")],
+        ])
+        await self.bot.send_message(self.admin_id, text, reply_markup=kb,
+                                    reply_to_message_id=proof["admin_message_id"],
+                                    allow_sending_without_reply=True)
@@ -0,0 +1,199 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+
+# Пріоритет береться з контексту: масові розсилки обгортаються в with priority(PRIORITY_BULK),
+# а відповіді в хендлерах лишаються інтерактивними за замовчуванням.
+send_priority: ContextVar[int] = ContextVar("send_priority", default=PRIORITY_INTERACTIVE)
+
+# Методи, на які Telegram рахує ліміти повідомлень (глобальний ~30/с і на чат)
+LIMITED_PREFIXES = ("Send", "Forward", "Copy", "EditMessage")
+
+
+@contextmanager
+def priority(level: int):
+    token = send_priority.set(level)
+    try:
+        yield
+    finally:
+        send_priority.reset(token)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        # Скільки секунд чекати до наступного токена (0 — можна зараз)
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class OutboundQueue(BaseRequestMiddleware):
+    """Центральна черга вихідних запитів до Bot API.
+
+    Підключається як middleware сесії бота, тому через неї йдуть усі виклики —
+    і bot.send_message, і message.answer/edit_text. Повідомлення чекають у купі за
+    пріоритетом; диспетчер видає слот, коли є токен у глобальному відрі й у відрі чату.
+    На TelegramRetryAfter вся черга ставиться на паузу, а запит повторюється.
+    """
+
+    def __init__(self, global_rate: float = 30, global_burst: float = 5,
+                 private_rate: float = 1, group_rate: float = 20 / 60, chat_burst: float = 3,
+                 max_retries: int = 5, max_chat_buckets: int = 10000):
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chat_buckets = max_chat_buckets
+        self._global: TokenBucket | None = None
+        self._chats: dict[int | str, TokenBucket] = {}
+        self._heap: list[tuple[int, int, int | str, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wakeup: asyncio.Event | None = None
+        self._dispatcher: asyncio.Task | None = None
+        self._paused_until = 0.0
+        self.sent = 0
+        self.retries = 0
+        self.dropped = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._heap)
+
+    def _chat_bucket(self, chat_id: int | str, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_chat_buckets:
+                # Повні відра нічим не відрізняються від нових — їх можна викинути
+                self._chats = {k: b for k, b in self._chats.items() if not b.is_full(now)}
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = self.group_rate if is_group else self.private_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, self.chat_burst, now)
+        return bucket
+
+    async def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = loop.time()
+            if self._paused_until > now:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            wait = self._global.delay(now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            # Беремо найпріоритетніший запит, чий чат не впирається у свій ліміт,
+            # щоб один «гарячий» чат не блокував решту черги
+            chosen = None
+            skipped = []
+            chat_wait = None
+            while self._heap:
+                item = heapq.heappop(self._heap)
+                if item[3].done():
+                    continue
+                delay = self._chat_bucket(item[2], now).delay(now)
+                if delay <= 0:
+                    chosen = item
+                    break
+                skipped.append(item)
+                chat_wait = delay if chat_wait is None else min(chat_wait, delay)
+            for item in skipped:
+                heapq.heappush(self._heap, item)
+            if chosen is None:
+                if chat_wait is not None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), chat_wait)
+                    except asyncio.TimeoutError:
+                        pass
+                continue
+            self._global.consume()
+            self._chats[chosen[2]].consume()
+            chosen[3].set_result(None)
+
+    async def acquire(self, chat_id: int | str, level: int) -> None:
+        loop = asyncio.get_running_loop()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._global = self._global or TokenBucket(self.global_rate, self.global_burst, loop.time())
+            self._wakeup = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch())
+        future = loop.create_future()
+        heapq.heappush(self._heap, (level, next(self._seq), chat_id, future))
+        self._wakeup.set()
+        await future
+
+    def pause(self, seconds: float) -> None:
+        until = asyncio.get_running_loop().time() + seconds
+        self._paused_until = max(self._paused_until, until)
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot,
+                       method: TelegramMethod) -> Response:
+        chat_id = getattr(method, "chat_id", None)
+        limited = chat_id is not None and type(method).__name__.startswith(LIMITED_PREFIXES)
+        level = send_priority.get()
+        attempt = 0
+        while True:
+            if limited:
+                await self.acquire(chat_id, level)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    self.dropped += 1
+                    raise
+                self.retries += 1
+                self.pause(e.retry_after)
+                logger.warning(f"Flood control на {type(method).__name__} (чат {chat_id}), "
+                               f"пауза {e.retry_after} с, спроба {attempt}")
+                if not limited:
+                    await asyncio.sleep(e.retry_after)
+                continue
+            if limited:
+                self.sent += 1
+            return response
+
+    async def close(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
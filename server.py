@@ -0,0 +1,101 @@
+"""Легкий вхід для Render: спершу порт і healthcheck, потім усе важке.
+
+Render вважає сервіс живим, щойно відповідає `/`, а `python bot.py` відкриває порт
+лише після імпорту aiogram/APScheduler, міграцій і set_webhook. Тут порт слухається
+одразу; bot імпортується і БД ініціалізується в окремому потоці, далі запускається
+startup бота. До готовності все, крім `/` і `/metrics`, отримує 503 — Telegram
+такі апдейти повторить сам.
+"""
+import time
+
+STARTED = time.perf_counter()  # До решти імпортів: вони теж частина шляху до відкритого порту
+
+import asyncio  # noqa: E402
+import importlib  # noqa: E402
+import logging  # noqa: E402
+import os  # noqa: E402
+import signal  # noqa: E402
+
+from aiohttp import web  # noqa: E402
+from dotenv import load_dotenv  # noqa: E402
+
+# Лише stdlib, aiohttp, dotenv і легкі модулі без aiogram — порт має відкритись до важких імпортів
+from logs import setup_logging  # noqa: E402
+from metrics import metrics_handler, startup  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+
+class LazyApp:
+    def __init__(self):
+        self.app: web.Application | None = None
+        self.runner: web.AppRunner | None = None
+
+    async def healthcheck(self, request: web.Request) -> web.Response:
+        return web.Response(text="ok" if self.app else "starting")
+
+    async def dispatch(self, request: web.Request) -> web.StreamResponse:
+        # Маршрути самого бота (webhook тощо) — через роутер його застосунку
+        if self.app is None:
+            return web.Response(status=503, text="starting", headers={"Retry-After": "1"})
+        match = await self.app.router.resolve(request)
+        return await match.handler(request)
+
+    def _load(self) -> web.Application:
+        bot = importlib.import_module("bot")
+        startup.mark("import")
+        return bot.build_app()
+
+    async def start(self) -> None:
+        app = await asyncio.to_thread(self._load)
+        # AppRunner без сайту лише проганяє on_startup застосунку (setup_application → dp.startup)
+        self.runner = web.AppRunner(app, handle_signals=False)
+        await self.runner.setup()
+        self.app = app
+
+    async def stop(self) -> None:
+        if self.runner:
+            await self.runner.cleanup()
+
+
+async def serve(port: int) -> None:
+    lazy = LazyApp()
+    app = web.Application()
+    app.router.add_get("/", lazy.healthcheck)
+    app.router.add_get("/metrics", metrics_handler)
+    app.router.add_route("*", "/{tail:.*}", lazy.dispatch)
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    site = web.TCPSite(runner, "0.0.0.0", port)
+    await site.start()
+    startup.rebase(STARTED)
+    startup.mark("bind")
+    logger.info(f"Порт {port} слухається, завантажую бота...")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        starting = asyncio.create_task(lazy.start())
+        await asyncio.wait([starting, asyncio.create_task(stop.wait())], return_when=asyncio.FIRST_COMPLETED)
+        if starting.done():
+            starting.result()
+            await stop.wait()
+        else:
+            starting.cancel()
+    finally:
+        # Спершу перестаємо приймати запити, потім зупиняємо бота (дренаж задач, БД)
+        await site.stop()
+        await lazy.stop()
+        await runner.cleanup()
+
+
+def main():
+    load_dotenv()
+    setup_logging()
+    asyncio.run(serve(int(os.getenv("PORT", 8080))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, TypeVar
+
+from metrics import db_duration
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Кеш підготовлених запитів на кожне з'єднання (sqlite3 тримає їх сам за текстом SQL)
+STATEMENT_CACHE_SIZE = 256
+
+
+class Database:
+    """Асинхронна обгортка над SQLite.
+
+    Один довгоживучий writer-потік (всі записи серіалізовані через нього) і пул
+    reader-потоків, кожен зі своїм з'єднанням. У WAL-режимі читачі не блокують
+    запис, а event loop взагалі не чекає на диск.
+    """
+
+    def __init__(self, path: str, readers: int = 4):
+        self.path = path
+        self.readers = readers
+        self._writer_pool: ThreadPoolExecutor | None = None
+        self._reader_pool: ThreadPoolExecutor | None = None
+        self._writer_conn: sqlite3.Connection | None = None
+        self._local = threading.local()
+        self._reader_conns: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                               check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute("PRAGMA busy_timeout = 30000")
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def _open_writer(self) -> None:
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        self._writer_conn = conn
+
+    def open(self) -> None:
+        if self._writer_pool is not None:
+            return
+        self._writer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._reader_pool = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix="db-reader")
+        # З'єднання writer'а створюється у власному потоці й живе до close()
+        self._writer_pool.submit(self._open_writer).result()
+        logger.info(f"База {self.path} відкрита (WAL, {self.readers} читачів)")
+
+    def close(self) -> None:
+        if self._writer_pool is None:
+            return
+        self._writer_pool.submit(self._writer_conn.close).result()
+        self._writer_pool.shutdown(wait=True)
+        self._reader_pool.shutdown(wait=True)
+        with self._lock:
+            for conn in self._reader_conns:
+                conn.close()
+            self._reader_conns.clear()
+        self._writer_pool = self._reader_pool = self._writer_conn = None
+
+    def _reader_conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            conn.execute("PRAGMA query_only = ON")
+            self._local.conn = conn
+            with self._lock:
+                self._reader_conns.append(conn)
+        return conn
+
+    def _run_write(self, fn: Callable[..., T], args: tuple) -> T:
+        conn = self._writer_conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn, *args)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def _run_read(self, fn: Callable[..., T], args: tuple) -> T:
+        return fn(self._reader_conn(), *args)
+
+    async def write(self, fn: Callable[..., T], *args: Any) -> T:
+        # fn(conn, *args) виконується у writer-потоці в одній транзакції
+        loop = asyncio.get_running_loop()
+        with db_duration.time("write"):
+            return await loop.run_in_executor(self._writer_pool, self._run_write, fn, args)
+
+    async def read(self, fn: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        with db_duration.time("read"):
+            return await loop.run_in_executor(self._reader_pool, self._run_read, fn, args)
+
+    def write_sync(self, fn: Callable[..., T], *args: Any) -> T:
+        # Для коду поза event loop (старт, міграції)
+        return self._writer_pool.submit(self._run_write, fn, args).result()
+
+    async def fetchone(self, sql: str, params: Iterable = ()) -> tuple | None:
+        return await self.read(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params: Iterable = ()) -> list[tuple]:
+        return await self.read(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def execute(self, sql: str, params: Iterable = ()) -> int:
+        return await self.write(lambda conn: conn.execute(sql, params).rowcount)
+
+    async def executemany(self, sql: str, seq: Iterable[Iterable]) -> int:
+        return await self.write(lambda conn: conn.executemany(sql, seq).rowcount)
@@ -0,0 +1,296 @@
+import csv
+import logging
+import sqlite3
+import time
+from datetime import datetime, timezone
+from typing import Callable
+
+from analytics import payment_kind, record
+from cache import TTLCache
+from storage import Database
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400
+GRACE_DAYS = 2
+
+SQL_GET_STATUS = "SELECT tariff, start_date, end_date, status FROM users WHERE user_id = ?"
+SQL_GET_END = "SELECT end_date, status FROM users WHERE user_id = ?"
+SQL_UPDATE_SUB = """
+    UPDATE users
+    SET
+        tariff      = ?,
+        start_date  = ?,
+        end_date    = ?,
+        status      = 'active',
+        grace_notice = NULL,
+        username    = ?
+    WHERE user_id = ?
+"""
+SQL_INSERT_PAYMENT = """
+    INSERT INTO payments
+    (user_id, tariff, days, prev_status, prev_end_date, start_date, end_date)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+# Переходи підписок. Дати — epoch-секунди, межі рахуються в Python від одного now,
+# тож одна транзакція бачить узгоджений зріз таблиці. grace_notice — останнє надіслане
+# нагадування: кожен UPDATE спрацьовує для користувача рівно раз, тому переходи можна
+# запускати будь-коли і скільки завгодно разів (таймер, щоденна звірка, вручну).
+SQL_GRACE_FIRST = """
+    UPDATE users SET grace_notice = 'grace_first'
+    WHERE status = 'grace' AND end_date >= ? AND end_date < ? AND grace_notice = 'grace'
+    RETURNING user_id, tariff
+"""
+SQL_GRACE_LAST = """
+    UPDATE users SET grace_notice = 'grace_last'
+    WHERE status = 'grace' AND end_date >= ? AND end_date < ? AND grace_notice IN ('grace', 'grace_first')
+    RETURNING user_id, tariff
+"""
+SQL_MARK_EXPIRED = "UPDATE users SET status = 'expired' WHERE status = 'grace' AND end_date < ? RETURNING user_id, tariff"
+SQL_START_GRACE = f"""
+    UPDATE users SET status = 'grace', end_date = end_date + {GRACE_DAYS * DAY}, grace_notice = 'grace'
+    WHERE status = 'active' AND end_date < ?
+    RETURNING user_id, tariff
+"""
+SQL_DUE_STATE = "SELECT user_id, status, end_date, grace_notice FROM users WHERE status IN ('active', 'grace')"
+SQL_INSERT_SUB = """
+    INSERT INTO users
+    (user_id, username, tariff, start_date, end_date, status)
+    VALUES (?, ?, ?, ?, ?, 'active')
+"""
+
+
+def _iso(ts: int | None) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts is not None else ""
+
+
+# Кешуємо й відсутність запису: відхилені заявки на вступ теж не мають ходити в БД
+_ABSENT = {}
+
+
+class SubscriptionStore:
+    def __init__(self, db: Database, cache_size: int = 50000, cache_ttl: float | None = None):
+        self.db = db
+        # Read-through кеш user_id → статус. Інвалідовується при кожному записі через цей клас,
+        # тому auto_approve_join і my_status зазвичай не чіпають диск
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._version = 0
+        # Підписник на зміни (планувальник закінчень); викликається з id змінених користувачів
+        self.on_change: Callable[[tuple[int, ...]], None] | None = None
+
+    def invalidate(self, *user_ids: int) -> None:
+        self._version += 1
+        for user_id in user_ids:
+            self.cache.pop(user_id)
+        if self.on_change and user_ids:
+            self.on_change(user_ids)
+
+    @staticmethod
+    def _save(conn: sqlite3.Connection, user_id: int, username: str, tariff: str, days: int,
+              amount: int = 0) -> datetime:
+        now = int(time.time())
+        existing = conn.execute(SQL_GET_END, (user_id,)).fetchone()
+        prev_end, prev_status = existing or (None, None)
+        if existing:
+            # Визначаємо точку відліку для нових днів
+            if prev_status == 'active' and prev_end and prev_end > now:
+                # ще активна підписка → продовжуємо від кінця старої
+                base_date = prev_end
+                action = "Продовжено активну підписку"
+            else:
+                # grace, expired, або інший статус → починаємо з моменту оплати
+                base_date = now
+                action = "Активовано нову підписку (grace/expired)"
+            new_end = base_date + days * DAY
+            conn.execute(SQL_UPDATE_SUB, (tariff, now, new_end, username, user_id))
+        else:
+            # Новий користувач — просто додаємо від зараз
+            new_end = now + days * DAY
+            conn.execute(SQL_INSERT_SUB, (user_id, username, tariff, now, new_end))
+            action = "Нова підписка"
+        conn.execute(SQL_INSERT_PAYMENT, (user_id, tariff, days, prev_status, prev_end, now, new_end))
+        record(conn, [(user_id, payment_kind(prev_status), tariff, days, amount)], now)
+        new_end_dt = datetime.fromtimestamp(new_end, timezone.utc)
+        logger.info(f"{action} для {user_id}: +{days} днів, нова дата закінчення: {new_end_dt.isoformat()}")
+        return new_end_dt
+
+    async def save(self, user_id: int, username: str, tariff: str, days: int, amount: int = 0) -> datetime:
+        # amount — сума оплати в гривнях для звітів (0, якщо підписку додано вручну)
+        try:
+            return await self.db.write(self._save, user_id, username, tariff, days, amount)
+        finally:
+            self.invalidate(user_id)
+
+    async def save_many(self, rows: list[tuple[int, str, str, int]]) -> list[datetime]:
+        # Масове додавання: усі рядки в одній транзакції (або жоден)
+        def save_all(conn: sqlite3.Connection) -> list[datetime]:
+            return [self._save(conn, *row) for row in rows]
+        try:
+            return await self.db.write(save_all)
+        finally:
+            self.invalidate(*{row[0] for row in rows})
+
+    @staticmethod
+    def _expiry_transitions(conn: sqlite3.Connection, now: datetime) -> list[tuple[int, str, str]]:
+        # Повертає список (user_id, tariff, подія) для розсилки після коміту.
+        # Порядок важливий: нагадування і кік рахуються по grace-записах до того,
+        # як сьогоднішні active перейдуть у grace (як у старому циклі по знімку).
+        now_s = int(now.timestamp())
+        day1 = now_s + DAY
+        day2 = now_s + 2 * DAY
+        events = [(uid, tariff, 'grace_first') for uid, tariff in conn.execute(SQL_GRACE_FIRST, (day1, day2))]
+        events += [(uid, tariff, 'grace_last') for uid, tariff in conn.execute(SQL_GRACE_LAST, (now_s, day1))]
+        events += [(uid, tariff, 'expired') for uid, tariff in conn.execute(SQL_MARK_EXPIRED, (now_s,))]
+        events += [(uid, tariff, 'grace') for uid, tariff in conn.execute(SQL_START_GRACE, (day1,))]
+        record(conn, [(uid, 'churn' if kind == 'expired' else kind, tariff, None, 0)
+                      for uid, tariff, kind in events if kind in ('expired', 'grace')], now_s)
+        return events
+
+    async def run_expiry_transitions(self, now: datetime) -> list[tuple[int, str, str]]:
+        events = await self.db.write(self._expiry_transitions, now)
+        self.invalidate(*(user_id for user_id, _, _ in events))
+        return events
+
+    async def get_status(self, user_id: int) -> dict | None:
+        data = self.cache.get(user_id)
+        if data is not None:
+            return data or None
+        version = self._version
+        row = await self.db.fetchone(SQL_GET_STATUS, (user_id,))
+        data = {"tariff": row[0], "start_date": row[1], "end_date": row[2], "status": row[3]} if row else _ABSENT
+        # Якщо поки ми читали стався запис — не кешуємо, результат міг застаріти
+        if version == self._version:
+            self.cache.set(user_id, data)
+        return data or None
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, user_ids: list[int]) -> set[int]:
+        removed = {}
+        for user_id in user_ids:
+            removed.update(conn.execute("DELETE FROM users WHERE user_id = ? RETURNING user_id, tariff",
+                                        (user_id,)).fetchall())
+        record(conn, [(user_id, 'removed', tariff, None, 0) for user_id, tariff in removed.items()])
+        return set(removed)
+
+    async def delete(self, user_id: int) -> int:
+        try:
+            return len(await self.db.write(self._delete, [user_id]))
+        finally:
+            self.invalidate(user_id)
+
+    async def delete_many(self, user_ids: list[int]) -> set[int]:
+        try:
+            return await self.db.write(self._delete, user_ids)
+        finally:
+            self.invalidate(*user_ids)
+
+    async def delete_expired(self) -> int:
+        # Історія від цього не губиться: події й агрегати лишаються в sub_events / daily_stats
+        try:
+            return await self.db.execute("DELETE FROM users WHERE status = 'expired'")
+        finally:
+            self.invalidate()
+            self.cache.clear()
+
+    @staticmethod
+    def _filters(status: str | None, tariff: str | None) -> tuple[list[str], list]:
+        where, params = [], []
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if tariff:
+            where.append("tariff = ?")
+            params.append(tariff)
+        return where, params
+
+    async def page(self, status: str | None = None, tariff: str | None = None,
+                   cursor: tuple[int | None, int] | None = None, backwards: bool = False,
+                   limit: int = 20) -> tuple[list[tuple], bool]:
+        # Keyset-пагінація по (end_date, user_id) від найпізніших дат; індекси
+        # (status, end_date) і (end_date) з rowid дають порядок без сортування.
+        # Повертає рядки сторінки і чи є ще рядки в напрямку руху.
+        # NULL в SQLite менший за будь-яке число, тож користувачі без дати — в самому кінці
+        # списку; порівняння кортежу з NULL дає NULL, тому ці випадки розписані окремо
+        where, params = self._filters(status, tariff)
+        if cursor:
+            end, user_id = cursor
+            if end is None:
+                where.append("(end_date IS NOT NULL OR user_id > ?)" if backwards
+                             else "(end_date IS NULL AND user_id < ?)")
+                params.append(user_id)
+            else:
+                where.append("(end_date, user_id) > (?, ?)" if backwards
+                             else "((end_date, user_id) < (?, ?) OR end_date IS NULL)")
+                params.extend(cursor)
+        order = "ASC" if backwards else "DESC"
+        sql = "SELECT user_id, username, tariff, end_date, status FROM users"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY end_date {order}, user_id {order} LIMIT ?"
+        rows = await self.db.fetchall(sql, (*params, limit + 1))
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if backwards:
+            rows.reverse()
+        return rows, more
+
+    async def tariffs(self) -> list[str]:
+        rows = await self.db.fetchall("SELECT DISTINCT tariff FROM users WHERE tariff IS NOT NULL ORDER BY tariff")
+        return [row[0] for row in rows]
+
+    async def export_csv(self, path: str, status: str | None = None, tariff: str | None = None) -> int:
+        # Пишемо CSV прямо з курсора рядок за рядком — вся таблиця в пам'ять не потрапляє
+        where, params = self._filters(status, tariff)
+        sql = "SELECT user_id, username, tariff, start_date, end_date, status, created_at FROM users"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY end_date DESC, user_id DESC"
+
+        def dump(conn: sqlite3.Connection) -> int:
+            count = 0
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["user_id", "username", "tariff", "start_date", "end_date", "status", "created_at"])
+                for user_id, username, tariff, start, end, status, created in conn.execute(sql, params):
+                    writer.writerow([user_id, username, tariff, _iso(start), _iso(end), status, _iso(created)])
+                    count += 1
+            return count
+
+        return await self.db.read(dump)
+
+    async def due_state(self, user_ids: list[int] | None = None) -> list[tuple]:
+        # (user_id, status, end_date, grace_notice) для активних і grace — усіх або лише заданих
+        if user_ids is None:
+            return await self.db.fetchall(SQL_DUE_STATE)
+        rows = []
+        for i in range(0, len(user_ids), 500):
+            chunk = user_ids[i:i + 500]
+            rows += await self.db.fetchall(
+                f"{SQL_DUE_STATE} AND user_id IN ({', '.join('?' * len(chunk))})", chunk)
+        return rows
+
+    async def current_user_ids(self) -> list[int]:
+        rows = await self.db.fetchall("SELECT user_id FROM users WHERE status IN ('active', 'grace')")
+        return [row[0] for row in rows]
+
+    async def count(self, *statuses: str) -> int:
+        if not statuses:
+            row = await self.db.fetchone("SELECT COUNT(*) FROM users")
+        else:
+            marks = ", ".join("?" * len(statuses))
+            row = await self.db.fetchone(f"SELECT COUNT(*) FROM users WHERE status IN ({marks})", statuses)
+        return row[0]
+
+    async def restore_grace(self, user_ids: list[int]) -> int:
+        # Кік після grace не вдався — повертаємо grace і знімаємо записаний відтік
+        def restore(conn: sqlite3.Connection) -> int:
+            rows = []
+            for user_id in user_ids:
+                rows += conn.execute("UPDATE users SET status = 'grace' WHERE user_id = ? RETURNING user_id, tariff",
+                                     (user_id,)).fetchall()
+            record(conn, [(user_id, 'churn_reverted', tariff, None, 0) for user_id, tariff in rows])
+            return len(rows)
+        try:
+            return await self.db.write(restore)
+        finally:
+            self.invalidate(*user_ids)
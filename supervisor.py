@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable
+
+from aiogram import Bot
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+from logs import update_context
+from metrics import task_errors, task_wait
+
+logger = logging.getLogger(__name__)
+
+
+class SupervisorClosed(Exception):
+    pass
+
+
+class TaskSupervisor:
+    """Обмежений пул фонових задач замість голих asyncio.create_task.
+
+    Задачі розкладені по «смугах» за ключем (id користувача): одночасно з однієї
+    смуги виконується лише одна задача, тож апдейти того самого користувача
+    обробляються по черзі, а різні користувачі — паралельно, до concurrency.
+    submit() чекає, коли в черзі вже max_pending задач, — так тиск доходить до
+    вебхука, і Telegram сам притримує доставку. close() дочікує чергу.
+    """
+
+    def __init__(self, concurrency: int = 50, max_pending: int = 1000):
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.pending = 0
+        self.running = 0
+        self.failed = 0
+        self.closed = False
+        self._lanes: dict[Hashable, deque] = {}
+        self._ready: asyncio.Queue | None = None
+        self._space: asyncio.Condition | None = None
+        self._idle: asyncio.Event | None = None
+        self._workers: list[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        return self.pending - self.running
+
+    def _start(self) -> None:
+        if self._ready is not None:
+            return
+        self._ready = asyncio.Queue()
+        self._space = asyncio.Condition()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    def _enqueue(self, key: Hashable | None, fn: Callable[..., Awaitable[Any]], args: tuple) -> None:
+        if key is None:
+            key = object()  # Без ключа — без порядку
+        # Контекст логів переходить у задачу: фонова робота хендлера логується з його update_id
+        item = (fn, args, time.perf_counter(), update_context.get())
+        self.pending += 1
+        self._idle.clear()
+        lane = self._lanes.get(key)
+        if lane is not None:
+            lane.append(item)
+        else:
+            self._lanes[key] = deque((item,))
+            self._ready.put_nowait(key)
+
+    async def submit(self, key: Hashable | None, fn: Callable[..., Awaitable[Any]], *args: Any) -> None:
+        # Для вхідних апдейтів: чекає на місце в черзі
+        if self.closed:
+            raise SupervisorClosed()
+        self._start()
+        if self.pending >= self.max_pending:
+            async with self._space:
+                await self._space.wait_for(lambda: self.pending < self.max_pending or self.closed)
+            if self.closed:
+                raise SupervisorClosed()
+        self._enqueue(key, fn, args)
+
+    def spawn(self, key: Hashable | None, fn: Callable[..., Awaitable[Any]], *args: Any) -> None:
+        # Для задач із хендлерів: без очікування, інакше воркер може чекати сам на себе
+        if self.closed:
+            raise SupervisorClosed()
+        self._start()
+        self._enqueue(key, fn, args)
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._ready.get()
+            lane = self._lanes[key]
+            fn, args, queued_at, context = lane.popleft()
+            task_wait.observe(time.perf_counter() - queued_at)
+            self.running += 1
+            token = update_context.set(context)
+            try:
+                await fn(*args)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.failed += 1
+                task_errors.inc(getattr(fn, "__name__", "task"))
+                logger.exception(f"Фонова задача {getattr(fn, '__name__', fn)} впала")
+            finally:
+                update_context.reset(token)
+                self.running -= 1
+                self.pending -= 1
+                # Наступна задача смуги стає в кінець черги — інші користувачі не чекають
+                if lane:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._lanes[key]
+                if self.pending == 0:
+                    self._idle.set()
+                async with self._space:
+                    self._space.notify()
+
+    async def close(self, timeout: float = 25) -> None:
+        self.closed = True
+        if self._ready is None:
+            return
+        async with self._space:
+            self._space.notify_all()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            logger.info("Фонові задачі завершено")
+        except asyncio.TimeoutError:
+            logger.warning(f"Не дочекались {self.pending} фонових задач за {timeout} с — скасовуємо")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+
+def update_key(update: dict) -> int | None:
+    # Ключ порядку — користувач, від якого апдейт (або чат, якщо користувача немає)
+    for field, value in update.items():
+        if field != "update_id" and isinstance(value, dict):
+            sender = value.get("from") or value.get("chat") or value.get("user")
+            return sender.get("id") if sender else None
+    return None
+
+
+class SupervisedRequestHandler(SimpleRequestHandler):
+    # Вебхук, що віддає апдейти в TaskSupervisor замість необмежених create_task
+    def __init__(self, *args: Any, supervisor: TaskSupervisor, drain_timeout: float = 25, **kwargs: Any):
+        super().__init__(*args, handle_in_background=True, **kwargs)
+        self.supervisor = supervisor
+        self.drain_timeout = drain_timeout
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        try:
+            await self.supervisor.submit(update_key(update), self._background_feed_update, bot, update)
+        except SupervisorClosed:
+            # Telegram повторить доставку після рестарту
+            return web.Response(status=503)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def close(self) -> None:
+        # Спершу дочікуємо апдейти в роботі — їм ще потрібна сесія бота
+        await self.supervisor.close(self.drain_timeout)
+        await super().close()
@@ -0,0 +1,80 @@
+import json
+import logging
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TARIFFS = [
+    {"key": "14days", "name": "14 днів", "price": "500 грн", "days": 14},
+    {"key": "1month", "name": "1 місяць", "price": "800 грн", "days": 30},
+]
+
+PAYMENT_TEXT = (
+    "Ти обрав(ла) тариф: **{name} — {price}** ✅\n\n"
+    "Перекажіть **{price}** на рахунок (просто натисни на те, що треба скопіювати):\n\n"
+    "Отримувач: `{recipient}`\nIBAN: `{iban}`\nІПН/ЄДРПОУ отримувача: `{ipn}`\nБанк: {bank}\n\n"
+    "**Призначення платежу (обов’язково!):** `{payment_code}`\n\n"
+    "Після оплати натисни кнопку нижче і надішли скрін або чек оплати."
+)
+PAYMENT_CODE = "За тренування"  # {user_id} це для перевірки апі монобанкока
+
+
+class Tariff:
+    """Тариф і все, що для нього показується користувачу, відрендерене один раз при старті."""
+
+    def __init__(self, key: str, name: str, price: str, days: int, amount: int | None = None):
+        if "_" in key or ":" in key:
+            raise ValueError(f"Ключ тарифу {key!r} не може містити '_' чи ':' — він іде в callback_data")
+        self.key = key
+        self.name = name
+        self.price = price
+        self.days = int(days)
+        # Сума для звітів про дохід; якщо не задана — цифри з price («1 200 грн» → 1200)
+        self.amount = int(amount) if amount is not None else int("".join(ch for ch in price if ch.isdigit()) or 0)
+        self.label = f"{name} — {price}"
+        self.payment_text = ""
+        # Кнопка «Я оплатив» однакова для всіх: хто натиснув, видно з callback.from_user
+        self.payment_kb = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="Я оплатив", callback_data=f"paid_{key}")],
+            [InlineKeyboardButton(text="← Назад до меню", callback_data="back")]
+        ])
+
+
+class TariffRegistry:
+    def __init__(self, tariffs: list[Tariff], recipient: str | None, iban: str | None,
+                 ipn: str | None, bank: str | None):
+        if not tariffs:
+            raise ValueError("Потрібен хоча б один тариф")
+        self.tariffs = {t.key: t for t in tariffs}
+        self.default = tariffs[0]
+        for t in tariffs:
+            t.payment_text = PAYMENT_TEXT.format(name=t.name, price=t.price, recipient=recipient, iban=iban,
+                                                 ipn=ipn, bank=bank, payment_code=PAYMENT_CODE)
+        self.menu_text = "Обери тариф для доступу до тренувань Ірини 💪\n\n" + "\n".join(
+            f"• {t.label}" for t in tariffs)
+        self.menu_kb = InlineKeyboardMarkup(inline_keyboard=[
+            *([InlineKeyboardButton(text=t.label, callback_data=f"tariff_{t.key}")] for t in tariffs),
+            [InlineKeyboardButton(text="← Назад", callback_data="back")]
+        ])
+
+    def get(self, key: str) -> Tariff | None:
+        return self.tariffs.get(key)
+
+    def __iter__(self):
+        return iter(self.tariffs.values())
+
+
+def load_tariffs(spec: str | None, **payment: str | None) -> TariffRegistry:
+    # TARIFFS — JSON-список [{"key", "name", "price", "days", "amount"?}] або шлях до такого файлу
+    items = DEFAULT_TARIFFS
+    if spec:
+        if spec.lstrip().startswith("["):
+            items = json.loads(spec)
+        else:
+            with open(spec, encoding="utf-8") as f:
+                items = json.load(f)
+    registry = TariffRegistry([Tariff(**item) for item in items], **payment)
+    logger.info(f"Тарифи: {', '.join(t.label for t in registry)}")
+    return registry
+